@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+Кодирование ответов ККМ (state, full_state, fs_state): pyshtrih.codec и pickle.
+
+Ответы получаются от эмулятора ККМ один раз, затем многократно кодируются и декодируются.
+
+Запуск::
+
+    $ python benchmarks/codec.py --number 20000
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import pickle
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pyshtrih import device, emulator, codec  # noqa: E402
+
+
+def measure(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000, help=u'количество повторов')
+    args = parser.parse_args()
+
+    emu = emulator.Emulator(print_line_time=0)
+    dev = device.ShtrihM01F(transport=emu.loopback(timeout=5))
+    dev.connect()
+    try:
+        responses = {
+            'state': dev.state(),
+            'full_state': dev.full_state(),
+            'fs_state': dev.fs_state()
+        }
+    finally:
+        dev.disconnect()
+
+    result = {}
+    for name, response in responses.items():
+        encoded = codec.dumps(response)
+        pickled = pickle.dumps(response, pickle.HIGHEST_PROTOCOL)
+        result[name] = {
+            'codec_bytes': len(encoded),
+            'codec_dumps_us': measure(lambda: codec.dumps(response), args.number),
+            'codec_loads_us': measure(lambda: codec.loads(encoded), args.number),
+            'pickle_bytes': len(pickled),
+            'pickle_dumps_us': measure(lambda: pickle.dumps(response, pickle.HIGHEST_PROTOCOL), args.number),
+            'pickle_loads_us': measure(lambda: pickle.loads(pickled), args.number)
+        }
+
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+Групповые операции над несколькими эмуляторами ККМ: последовательно и через Fleet.
+
+Измеряется время запроса состояния (state) всех устройств и время выполнения
+чека на всех устройствах с имитацией времени передачи на заданной скорости.
+
+Запуск::
+
+    $ python benchmarks/fleet.py --devices 12 --baudrate 9600
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pyshtrih import device, emulator, fleet, receipt  # noqa: E402
+
+
+ITEM = (u'Позиция', 1000, 100)
+
+timer = timeit.default_timer
+
+
+def check(dev):
+    return receipt.Receipt().sale(*ITEM).sale(*ITEM).close(cash=2 * ITEM[2]).execute(dev)
+
+
+def measure(func, repeat):
+    started = timer()
+    for _ in range(repeat):
+        func()
+    return (timer() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--devices', type=int, default=12, help=u'количество устройств')
+    parser.add_argument('--baudrate', type=int, default=9600, help=u'скорость линии эмуляторов')
+    parser.add_argument('--repeat', type=int, default=5, help=u'количество повторов')
+    args = parser.parse_args()
+
+    emulators = [emulator.Emulator(baudrate=args.baudrate, print_line_time=0) for _ in range(args.devices)]
+    devices = [device.ShtrihM01F(transport=emu.loopback(timeout=5)) for emu in emulators]
+    # трекер печати настроен по эмулятору (скорость линии, время печати строки): иначе задержка чека
+    # состоит из ожидания печати по оценке трекера для 9600 бод, а не из обмена
+    for emu, dev in zip(emulators, devices):
+        dev.print_tracker.baudrate = emu.baudrate
+        dev.print_tracker.line_time = emu.print_line_time
+        dev.print_tracker.poll_time = 0
+    group = fleet.Fleet(dict(enumerate(devices)))
+
+    try:
+        group.connect()
+
+        def sequential_state():
+            for dev in devices:
+                dev.state()
+
+        def sequential_check():
+            for dev in devices:
+                check(dev)
+
+        result = {
+            'devices': args.devices,
+            'baudrate': args.baudrate,
+            'sequential_state': measure(sequential_state, args.repeat),
+            'fleet_state': measure(group.state, args.repeat),
+            'sequential_check': measure(sequential_check, args.repeat),
+            'fleet_check': measure(lambda: group.gather(check), args.repeat)
+        }
+    finally:
+        group.disconnect()
+        group.shutdown()
+        for emu in emulators:
+            emu.stop()
+
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
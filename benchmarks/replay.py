@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""
+Воспроизведение файла захвата (pyshtrih.capture) через разбор ответов и протокол.
+
+Измеряется скорость разбора полезной нагрузки ответов (Protocol.handle_payload,
+в обычном и ленивом режимах) и скорость воспроизведения команд через протокол
+без выдержки исходных интервалов. Без --capture файл захвата записывается
+с эмулятором ККМ (смесь запросов состояния и чеков).
+
+Запуск::
+
+    $ python benchmarks/replay.py --capture session.pshc
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import timeit
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pyshtrih import capture, device, emulator, excepts, protocol  # noqa: E402
+
+
+ITEM = (u'Позиция', 1000, 100)
+
+timer = timeit.default_timer
+
+
+def record_session(path, receipts):
+    """
+    Запись сессии обмена с эмулятором: на каждый чек - запросы состояния,
+    открытие, 3 продажи и закрытие.
+    """
+
+    emu = emulator.Emulator(print_line_time=0)
+    recorder = capture.RecordingTransport(emu.loopback(timeout=5), path)
+    dev = device.ShtrihM01F(transport=recorder)
+    # трекер печати настроен по эмулятору (скорость линии, время печати строки): иначе задержка чека
+    # состоит из ожидания печати по оценке трекера для 9600 бод, а не из обмена
+    dev.print_tracker.baudrate = emu.baudrate
+    dev.print_tracker.line_time = emu.print_line_time
+    dev.print_tracker.poll_time = 0
+    try:
+        dev.connect()
+        for _ in range(receipts):
+            dev.state()
+            dev.full_state()
+            dev.fs_state()
+            dev.open_check(0)
+            for _ in range(3):
+                dev.sale(ITEM)
+            dev.close_check(3 * ITEM[2])
+        dev.disconnect()
+    finally:
+        recorder.stop()
+        emu.stop()
+
+
+def decode_rate(path, payloads, lazy, repeat):
+    """
+    Количество разобранных ответов в секунду.
+    """
+
+    proto = protocol.Protocol(None, None, None, fs=True, transport=capture.ReplayTransport(path), lazy=lazy)
+
+    handle = proto.handle_payload
+    started = timer()
+    for _ in range(repeat):
+        for payload in payloads:
+            try:
+                handle(payload)
+            except excepts.Error:
+                pass
+    return repeat * len(payloads) / (timer() - started)
+
+
+def replay_rate(path, repeat):
+    """
+    Количество команд в секунду при воспроизведении через протокол.
+    """
+
+    frames = capture.commands(path)
+
+    elapsed = 0
+    for _ in range(repeat):
+        proto = protocol.Protocol(None, None, None, transport=capture.ReplayTransport(path))
+        started = timer()
+        proto.connect()
+        for frame in frames:
+            proto.command_frame(frame)
+        elapsed += timer() - started
+
+    return repeat * len(frames) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--capture', help=u'файл захвата (по умолчанию записывается с эмулятором)')
+    parser.add_argument('--receipts', type=int, default=200, help=u'количество чеков в записываемой сессии')
+    parser.add_argument('--repeat', type=int, default=5, help=u'количество повторов')
+    args = parser.parse_args()
+
+    path = args.capture
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.pshc')
+        os.close(fd)
+        record_session(path, args.receipts)
+
+    try:
+        payloads = capture.payloads(path)
+        result = {
+            'capture': args.capture,
+            'payloads': len(payloads),
+            'commands': len(capture.commands(path)),
+            'decode_per_second': decode_rate(path, payloads, False, args.repeat),
+            'lazy_decode_per_second': decode_rate(path, payloads, True, args.repeat),
+            'replay_commands_per_second': replay_rate(path, args.repeat)
+        }
+    finally:
+        if args.capture is None:
+            os.remove(path)
+
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
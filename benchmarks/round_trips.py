@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Сравнение количества обменов с ККМ на один чек в обычном и сессионном режимах.
+
+Запуск::
+
+    $ python benchmarks/round_trips.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pyshtrih import device, misc, protocol, transport  # noqa: E402
+
+
+RECEIPTS = 100
+ITEMS = 10
+
+
+class FakeTransport(transport.Transport):
+    """
+    Простейшая имитация ККМ: на ENQ отвечает NAK, на кадр - ACK и ответом без ошибки.
+    """
+
+    def __init__(self):
+        super(FakeTransport, self).__init__(u'fake', 115200, 1)
+        self.rx = bytearray()
+        self.enq = 0
+        self.frames = 0
+
+    @property
+    def is_open(self):
+        return True
+
+    @property
+    def in_waiting(self):
+        return len(self.rx)
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def flush_input(self):
+        del self.rx[:]
+
+    def flush_output(self):
+        pass
+
+    def write(self, data):
+        data = bytearray(data)
+        if data == protocol.ENQ:
+            self.enq += 1
+            self.rx.extend(protocol.NAK)
+        elif data[:1] == protocol.STX:
+            self.frames += 1
+            cmd = data[2:3] if data[2] != 0xFF else data[2:4]
+            payload = misc.bytearray_concat(cmd, bytearray((0x00, 0x01)), bytearray(16))
+            buff = misc.bytearray_concat(misc.CAST_SIZE['1'](len(payload)), payload)
+            self.rx.extend(protocol.ACK)
+            self.rx.extend(misc.bytearray_concat(protocol.STX, buff, misc.CAST_SIZE['1'](misc.lrc(buff))))
+
+    def read(self, size=1):
+        result = bytes(self.rx[:size])
+        del self.rx[:size]
+        return result
+
+
+def run(session):
+    fake = FakeTransport()
+    dev = device.ShtrihM01F(session=session, transport=fake)
+    # имитация отвечает мгновенно: ожидание печати по оценке трекера не должно входить во время чека
+    dev.print_tracker.baudrate = None
+    dev.print_tracker.line_time = 0
+    dev.print_tracker.poll_time = 0
+    dev.connect()
+    fake.enq = fake.frames = 0
+
+    started = time.time()
+    for _ in range(RECEIPTS):
+        dev.open_check(0)
+        for i in range(ITEMS):
+            dev.sale((u'Позиция {}'.format(i), 1000, 1000))
+        dev.close_check(ITEMS * 1000)
+    elapsed = time.time() - started
+
+    return {
+        'enq_per_receipt': fake.enq / float(RECEIPTS),
+        'frames_per_receipt': fake.frames / float(RECEIPTS),
+        'round_trips_per_receipt': (fake.enq + fake.frames) / float(RECEIPTS),
+        'seconds_per_receipt': elapsed / RECEIPTS
+    }
+
+
+def main():
+    for session in (False, True):
+        print(u'session={}'.format(session))
+        for key, value in sorted(run(session).items()):
+            print(u'    {:<24} {:.6f}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
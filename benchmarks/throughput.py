@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+Пропускная способность и задержки обмена с эмулятором ККМ.
+
+Измеряется количество команд в секунду для state, full_state, sale и close_check
+(без имитации времени передачи по линии) и перцентили p50/p95/p99 времени
+полного чека (открытие, продажи, закрытие) для каждой скорости из misc.BAUDRATE_DIRECT.
+
+Запуск::
+
+    $ python benchmarks/throughput.py --output results.json
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pyshtrih import device, emulator, misc, receipt  # noqa: E402
+
+
+ITEM = (u'Позиция', 1000, 100)
+
+timer = timeit.default_timer
+
+
+def percentile(values, pct):
+    """
+    Перцентиль по методу ближайшего ранга.
+    """
+
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def make_device(baudrate=None, session=False):
+    emu = emulator.Emulator(baudrate=baudrate, print_line_time=0)
+    dev = device.ShtrihM01F(session=session, transport=emu.loopback(timeout=5))
+    # трекер печати настроен по эмулятору (скорость линии, время печати строки): иначе задержка чека
+    # состоит из ожидания печати по оценке трекера для 9600 бод, а не из обмена
+    dev.print_tracker.baudrate = emu.baudrate
+    dev.print_tracker.line_time = emu.print_line_time
+    dev.print_tracker.poll_time = 0
+    dev.connect()
+    return emu, dev
+
+
+def commands_per_second(dev, count):
+    """
+    Количество команд в секунду для state, full_state, sale и close_check.
+    """
+
+    result = {}
+
+    for name in ('state', 'full_state'):
+        func = getattr(dev, name)
+        started = timer()
+        for _ in range(count):
+            func()
+        result[name] = count / (timer() - started)
+
+    dev.open_check(0)
+    started = timer()
+    for _ in range(count):
+        dev.sale(ITEM)
+    result['sale'] = count / (timer() - started)
+    dev.close_check(count * ITEM[2])
+
+    elapsed = 0
+    for _ in range(count):
+        dev.sale(ITEM)
+        started = timer()
+        dev.close_check(ITEM[2])
+        elapsed += timer() - started
+    result['close_check'] = count / elapsed
+
+    return result
+
+
+def receipt_latency(dev, receipts, items, pipeline=False):
+    """
+    Перцентили времени полного чека.
+
+    При pipeline=True чек выполняется через pyshtrih.receipt.Receipt.
+    """
+
+    samples = []
+    for _ in range(receipts):
+        started = timer()
+        if pipeline:
+            check = receipt.Receipt()
+            for _ in range(items):
+                check.sale(*ITEM)
+            check.close(items * ITEM[2]).execute(dev)
+        else:
+            dev.open_check(0)
+            for _ in range(items):
+                dev.sale(ITEM)
+            dev.close_check(items * ITEM[2])
+        samples.append(timer() - started)
+
+    return {
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'mean': sum(samples) / len(samples)
+    }
+
+
+def run(count, receipts, items, session, pipeline=False):
+    emu, dev = make_device(session=session)
+    try:
+        cps = commands_per_second(dev, count)
+    finally:
+        dev.disconnect()
+        emu.stop()
+
+    latency = {}
+    for baudrate in sorted(misc.BAUDRATE_DIRECT):
+        emu, dev = make_device(baudrate, session)
+        try:
+            latency[str(baudrate)] = receipt_latency(dev, receipts, items, pipeline)
+        finally:
+            dev.disconnect()
+            emu.stop()
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': int(time.time()),
+        'session': session,
+        'pipeline': pipeline,
+        'commands': count,
+        'receipts': receipts,
+        'items': items,
+        'commands_per_second': cps,
+        'receipt_latency': latency
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--commands', type=int, default=1000, help=u'количество команд каждого вида')
+    parser.add_argument('--receipts', type=int, default=20, help=u'количество чеков на каждой скорости')
+    parser.add_argument('--items', type=int, default=3, help=u'количество позиций в чеке')
+    parser.add_argument('--session', action='store_true', help=u'сессионный режим протокола')
+    parser.add_argument('--pipeline', action='store_true', help=u'выполнять чеки через pyshtrih.receipt.Receipt')
+    parser.add_argument('--output', help=u'файл результатов (по умолчанию stdout)')
+    args = parser.parse_args()
+
+    result = run(args.commands, args.receipts, args.items, args.session, args.pipeline)
+    data = json.dumps(result, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            fd.write(data)
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
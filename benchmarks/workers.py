@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+Пропускная способность группы эмуляторов ККМ: потоки (Fleet) и рабочие процессы (WorkerPool).
+
+Каждое устройство выполняет пачку запросов состояния (state, full_state) без имитации
+времени передачи, т.е. нагрузка определяется формированием кадров и разбором ответов.
+Эмуляторы работают в тех же процессах, что и устройства.
+
+Запуск::
+
+    $ python benchmarks/workers.py --devices 8 --commands 500
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pyshtrih import device, emulator, fleet, workers  # noqa: E402
+
+
+timer = timeit.default_timer
+
+
+def make_device():
+    emu = emulator.Emulator(print_line_time=0)
+    dev = device.ShtrihM01F(transport=emu.loopback(timeout=5))
+    # трекер печати настроен по эмулятору (скорость линии, время печати строки): иначе задержка чека
+    # состоит из ожидания печати по оценке трекера для 9600 бод, а не из обмена
+    dev.print_tracker.baudrate = emu.baudrate
+    dev.print_tracker.line_time = emu.print_line_time
+    dev.print_tracker.poll_time = 0
+    return dev
+
+
+def poll(dev, count):
+    for _ in range(count // 2):
+        dev.state()
+        dev.full_state()
+
+
+def rate(group, devices, commands):
+    group.connect()
+    started = timer()
+    results = group.gather(poll, commands)
+    elapsed = timer() - started
+    errors = [r for r in results.values() if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+    return devices * (commands // 2 * 2) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--devices', type=int, default=8, help=u'количество устройств')
+    parser.add_argument('--commands', type=int, default=500, help=u'количество команд на устройство')
+    parser.add_argument('--processes', type=int, default=None,
+                        help=u'количество рабочих процессов (по умолчанию - процесс на устройство)')
+    args = parser.parse_args()
+
+    threads = fleet.Fleet({i: make_device() for i in range(args.devices)})
+    try:
+        threads_rate = rate(threads, args.devices, args.commands)
+    finally:
+        threads.shutdown()
+
+    processes = workers.WorkerPool(
+        {i: make_device for i in range(args.devices)}, processes=args.processes
+    )
+    try:
+        processes_rate = rate(processes, args.devices, args.commands)
+    finally:
+        processes.shutdown()
+
+    print(json.dumps({
+        'devices': args.devices,
+        'processes': args.processes or args.devices,
+        'cpus': os.cpu_count() if hasattr(os, 'cpu_count') else None,
+        'threads_commands_per_second': threads_rate,
+        'processes_commands_per_second': processes_rate
+    }, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,12 +3,22 @@
 
 from .utils import discovery
 from .protocol import Protocol
+from .transport import Transport, SerialTransport, TCPTransport, LoopbackTransport
 from .device import ShtrihFRK, ShtrihFRPTK, ShtrihComboFRK, ShtrihComboPTK, ShtrihLightPTK, Shtrih950K, \
     ShtrihFR01F, ShtrihOnLine, ShtrihM01F, ShtrihM02F, ShtrihLight01F, ShtrihLight02F, ShtrihMini01F, \
     Retail01F, \
     ShtrihAllCommands
-from .excepts import ProtocolError, NoConnectionError, UnexpectedResponseError, FDError, Error, CheckError, \
-    OpenCheckError, ItemSaleError, CloseCheckError
+from .executor import DeviceExecutor
+from .fleet import Fleet
+from .workers import WorkerPool
+from .daemon import DeviceDaemon, DaemonClient
+from .receipt import Receipt
+from .journal import Journal
+from .metrics import Metrics
+from .tables import TableCache
+from .metadata import MetadataCache
+from .excepts import ProtocolError, NoConnectionError, UnexpectedResponseError, FDError, PrintTimeoutError, Error, \
+    CheckError, OpenCheckError, ItemSaleError, CloseCheckError
 from .fd import FD
 
 
@@ -16,11 +26,21 @@ __version__ = '2.0.6'
 __all__ = (
     'discovery',
     'Protocol',
+    'Transport', 'SerialTransport', 'TCPTransport', 'LoopbackTransport',
     'ShtrihFRK', 'ShtrihFRPTK', 'ShtrihComboFRK', 'ShtrihComboPTK', 'ShtrihLightPTK', 'Shtrih950K',
     'ShtrihFR01F', 'ShtrihOnLine', 'ShtrihM01F', 'ShtrihM02F', 'ShtrihLight01F', 'ShtrihLight02F', 'ShtrihMini01F',
     'Retail01F',
     'ShtrihAllCommands',
-    'ProtocolError', 'NoConnectionError', 'UnexpectedResponseError', 'FDError', 'Error', 'CheckError',
-    'OpenCheckError', 'ItemSaleError', 'CloseCheckError',
+    'DeviceExecutor',
+    'Fleet',
+    'WorkerPool',
+    'DeviceDaemon', 'DaemonClient',
+    'Receipt',
+    'Journal',
+    'Metrics',
+    'TableCache',
+    'MetadataCache',
+    'ProtocolError', 'NoConnectionError', 'UnexpectedResponseError', 'FDError', 'PrintTimeoutError', 'Error',
+    'CheckError', 'OpenCheckError', 'ItemSaleError', 'CloseCheckError',
     'FD'
 )
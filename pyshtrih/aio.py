@@ -0,0 +1,574 @@
+# -*- coding: utf-8 -*-
+
+"""
+Асинхронная (asyncio) реализация протокола и устройств.
+
+Модуль требует Python 3.5+ и не импортируется пакетом автоматически:
+
+    from pyshtrih import aio
+
+    device = aio.ShtrihM01F('192.168.137.111:7778')
+    await device.connect()
+    print(await device.state())
+
+Для работы с последовательным портом необходим пакет pyserial-asyncio,
+TCP соединения (адрес вида 'host:port') работают без дополнительных зависимостей.
+"""
+
+
+import asyncio
+import inspect
+import functools
+
+from . import protocol, device, commands, printing, status, misc, excepts, compat
+from .handlers import decoders as hd
+
+
+class AsyncProtocol(object):
+    MAX_ATTEMPTS = protocol.Protocol.MAX_ATTEMPTS
+    CHECK_NUM = protocol.Protocol.CHECK_NUM
+
+    def __init__(self, port, baudrate, timeout, fs=False, session=False, opener=None):
+        """
+        Асинхронный протокол взаимодействия с устройством.
+
+        :type port: str
+        :param port: порт взаимодействия с устройством или адрес 'host:port'
+        :type baudrate: int
+        :param baudrate: скорость взаимодействия с устройством
+        :type timeout: float
+        :param timeout: время таймаута ответа устройства
+        :type fs: bool
+        :param fs: признак наличия ФН (фискальный накопитель)
+        :type session: bool
+        :param session: сессионный режим (см. pyshtrih.protocol.Protocol)
+        :param opener: корутина, возвращающая пару (asyncio.StreamReader, asyncio.StreamWriter),
+                       по умолчанию соединение открывается по значению port
+        """
+
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.fs = fs
+        self.session = session
+        self.lazy = False
+        self.set_context(hd.DEFAULT_CONTEXT._replace(fs=fs))
+        self.listeners = []
+        self.opener = opener or self.open_connection
+
+        self.reader = None
+        self.writer = None
+        self.lock = None
+        self.connected = False
+        self.synced = False
+
+    # разбор полезной нагрузки не зависит от способа ввода-вывода
+    handle_payload = protocol.Protocol.handle_payload
+    set_context = protocol.Protocol.set_context
+    notify = protocol.Protocol.notify
+
+    async def open_connection(self):
+        """
+        Открытие соединения по значению port.
+        """
+
+        host, _, tcp_port = self.port.rpartition(':')
+        if host and tcp_port.isdigit():
+            return await asyncio.open_connection(host, int(tcp_port))
+
+        try:
+            import serial_asyncio
+        except ImportError:
+            raise excepts.NoConnectionError(
+                u'Для работы с портом {} необходим пакет pyserial-asyncio'.format(self.port)
+            )
+
+        return await serial_asyncio.open_serial_connection(url=self.port, baudrate=self.baudrate)
+
+    async def connect(self):
+        """
+        Метод подключения к устройству.
+        """
+
+        if self.connected:
+            return
+
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        try:
+            self.reader, self.writer = await asyncio.wait_for(self.opener(), self.timeout)
+        except (OSError, asyncio.TimeoutError) as exc:
+            raise excepts.NoConnectionError(
+                u'Не удалось открыть порт {} ({})'.format(self.port, exc)
+            )
+
+        for _ in range(self.CHECK_NUM):
+            try:
+                if await self.init():
+                    self.connected = True
+                    return
+            except excepts.NoConnectionError:
+                pass
+
+        self.close()
+        raise excepts.NoConnectionError()
+
+    async def disconnect(self):
+        """
+        Метод отключения от устройства.
+        """
+
+        if self.connected:
+            self.close()
+            self.connected = False
+            self.synced = False
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def read(self, size=1):
+        """
+        Чтение size байт с ожиданием не дольше таймаута.
+
+        :rtype: bytes
+        :return: прочитанные байты или пустая строка в случае таймаута
+        """
+
+        try:
+            return await asyncio.wait_for(self.reader.readexactly(size), self.timeout)
+        except asyncio.TimeoutError:
+            return bytes()
+        except asyncio.IncompleteReadError:
+            raise excepts.NoConnectionError(u'Соединение закрыто устройством')
+
+    async def write(self, data):
+        """
+        Запись байт.
+        """
+
+        try:
+            self.writer.write(data)
+            await asyncio.wait_for(self.writer.drain(), self.timeout)
+        except asyncio.TimeoutError:
+            raise excepts.ProtocolError(u'Не удалось записать байт в ККМ')
+        except OSError as exc:
+            raise excepts.ProtocolError(str(exc))
+
+    async def drain(self):
+        """
+        Вычитывание всех данных до истечения таймаута.
+        """
+
+        while await self.read():
+            pass
+
+    async def init(self, expected=None):
+        """
+        Метод инициализации устройства перед отправкой команды (см. pyshtrih.protocol.Protocol.init).
+        """
+
+        await self.write(protocol.ENQ)
+        byte = await self.read()
+        if not byte:
+            raise excepts.NoConnectionError()
+
+        if byte == protocol.NAK:
+            self.synced = True
+        elif byte == protocol.ACK:
+            payload = await self.read_response()
+            if protocol.is_response(payload, expected):
+                return payload
+            self.handle_payload(payload)
+        else:
+            await self.drain()
+            return False
+
+        return True
+
+    async def read_frame(self):
+        """
+        Чтение кадра ответа ККМ.
+
+        :rtype: bytes
+        :return: полезная нагрузка или None, если кадр получен не полностью или не совпала контрольная сумма
+        """
+
+        stx = await self.read()
+        if stx != protocol.STX:
+            raise excepts.NoConnectionError()
+
+        length = await self.read()
+        if not length:
+            return
+
+        body = await self.read(length[0] + 1)
+        if len(body) != length[0] + 1:
+            return
+
+        if misc.lrc(misc.bytearray_concat(length, body[:-1])) != body[-1]:
+            return
+
+        return body[:-1]
+
+    async def handle_response(self):
+        """
+        Метод обработки ответа ККМ.
+        """
+
+        return self.handle_payload(await self.read_response())
+
+    async def read_response(self):
+        """
+        Метод чтения кадра ответа ККМ с подтверждением приема.
+
+        :rtype: bytes
+        :return: полезная нагрузка ответа
+        """
+
+        for _ in range(self.MAX_ATTEMPTS):
+            payload = await self.read_frame()
+
+            if payload is not None:
+                await self.write(protocol.ACK)
+                self.synced = True
+                return payload
+            else:
+                await self.write(protocol.NAK)
+                await self.write(protocol.ENQ)
+                byte = await self.read()
+                if byte != protocol.ACK:
+                    raise excepts.UnexpectedResponseError(
+                        u'Получен байт 0x{:02X}, ожидался ACK'.format(ord(byte)) if byte
+                        else u'Не получен ACK'
+                    )
+        else:
+            raise excepts.NoConnectionError()
+
+    async def command_nopass(self, cmd, params=bytearray()):
+        """
+        Метод отправки команды без пароля оператора.
+        """
+
+        if not isinstance(params, bytearray):
+            raise TypeError(u'{} expected, got {} instead'.format(bytearray, type(params)))
+
+        return await self.command_frame(protocol.build_frame(cmd, params))
+
+    async def command_frame(self, command):
+        """
+        Метод отправки готового кадра команды (см. pyshtrih.encoders).
+        """
+
+        if not self.connected:
+            raise excepts.ProtocolError(u'Необходимо вначале выполнить метод connect()')
+
+        async with self.lock:
+            # номер команды, если кадр отправлен, но его прием не подтвержден (см. Protocol.send_frame)
+            expected = None
+
+            if self.session and self.synced:
+                self.synced = False
+                await self.write(command)
+                if await self.read() == protocol.ACK:
+                    return await self.handle_response()
+                expected = protocol.frame_cmd(command)
+
+            for _ in range(self.CHECK_NUM):
+                r = await self.init(expected)
+                for attempt in range(self.MAX_ATTEMPTS):
+                    if attempt:
+                        # кадр повторяется, только если ККМ ответила на ENQ готовностью (NAK)
+                        r = await self.init(expected)
+                    if r is not True:
+                        break
+
+                    self.synced = False
+                    await self.write(command)
+                    if await self.read() == protocol.ACK:
+                        return await self.handle_response()
+                    expected = protocol.frame_cmd(command)
+                else:
+                    raise excepts.NoConnectionError()
+
+                if r:
+                    # ККМ выполнила команду, ответ получен при проверке связи
+                    return self.handle_payload(r)
+            else:
+                raise excepts.NoConnectionError()
+
+    async def command(self, cmd, password, *params):
+        """
+        Метод отправки команды с паролем оператора.
+        """
+
+        params = misc.bytearray_concat(
+            misc.CAST_SIZE['4'](password), *params
+        )
+
+        return await self.command_nopass(cmd, params)
+
+
+class _Request(Exception):
+    def __init__(self, frame):
+        super(_Request, self).__init__(frame)
+        self.frame = frame
+
+
+class _Recorder(protocol.Protocol):
+    def __init__(self):
+        """
+        Протокол, который вместо отправки команды возвращает ее кадр.
+        Позволяет использовать функции модуля commands для формирования запросов.
+        """
+
+    def command_frame(self, command):
+        raise _Request(command)
+
+
+class _Capture(object):
+    protocol = _Recorder()
+
+    def __init__(self, device_):
+        self.device = device_
+
+    def __getattr__(self, item):
+        return getattr(self.device, item)
+
+    def wait_printing(self):
+        pass
+
+
+def _capture(func, device_, args, kwargs):
+    try:
+        func(_Capture(device_), *args, **kwargs)
+    except _Request as request:
+        return request.frame
+
+    raise excepts.ProtocolError(u'Функция {} не сформировала команду'.format(func.__name__))
+
+
+# исключения, в которые оборачиваются ошибки команд чека (как в модуле commands)
+CHECK_ERRORS = {
+    commands.open_check: (excepts.Error, excepts.OpenCheckError),
+    commands.sale: (excepts.Error, excepts.ItemSaleError),
+    commands.close_check: (excepts.ProtocolError, excepts.CloseCheckError)
+}
+
+
+def coroutine_command(func):
+    """
+    Преобразование функции модуля commands в корутину.
+    """
+
+    waits = commands.wait_printing in getattr(func, 'depends', ())
+    catch, wrap = CHECK_ERRORS.get(func, ((), None))
+
+    @functools.wraps(func)
+    async def method(self, *args, **kwargs):
+        if waits:
+            await self.wait_printing()
+
+        frame = _capture(func, self, args, kwargs)
+        try:
+            return await self.protocol.command_frame(frame)
+        except catch as exc:
+            raise wrap(exc)
+
+    return method
+
+
+async def read_table(self, table, row, field, _type):
+    """
+    Чтение таблицы.
+    """
+
+    cast_funcs_map = {
+        int: misc.bytes_to_int,
+        str: misc.FuncChain(misc.decode, misc.bytearray_strip)
+    }
+
+    if _type not in cast_funcs_map:
+        raise ValueError(
+            u'ожидаемые типы {}'.format(', '.join(t.__name__ for t in cast_funcs_map))
+        )
+
+    result = await self.protocol.command(
+        0x1F,
+        self.admin_password,
+        misc.CAST_SIZE['121'](table, row, field)
+    )
+    result[u'Значение'] = cast_funcs_map[_type](result[u'Значение'])
+
+    return result
+
+
+async def set_datetime(self, datetime):
+    """
+    Установка даты и времени.
+    """
+
+    await self.set_time(datetime.time())
+    await self.set_date(datetime.date())
+    await self.confirm_date(datetime.date())
+
+
+async def wait_printing(self, timeout=None, paper_out=None):
+    """
+    Метод ожидания окончания печати документа (см. pyshtrih.printing.PrintTracker).
+    """
+
+    tracker = self.print_tracker
+    if tracker.idle:
+        return
+
+    for delay in tracker.delays(self.PRINT_TIMEOUT if timeout is None else timeout):
+        await asyncio.sleep(delay)
+
+        action = tracker.handle_state(await self.state(fresh=True), paper_out)
+        if action == printing.DONE:
+            return
+        if action == printing.CONTINUE:
+            await self.continue_print()
+
+
+# функции, требующие отдельной асинхронной реализации
+COROUTINES = {
+    commands.read_table: read_table,
+    commands.set_datetime: set_datetime,
+    commands.wait_printing: wait_printing
+}
+
+
+class AsyncSupportedCommands(commands.SupportedCommands):
+    def __new__(mcs, classname, supers, attributedict):
+        cls = super(AsyncSupportedCommands, mcs).__new__(mcs, classname, supers, attributedict)
+
+        for name, value in list(vars(cls).items()):
+            if not inspect.isfunction(value) or value.__module__ != commands.__name__:
+                continue
+
+            if value in COROUTINES:
+                setattr(cls, name, COROUTINES[value])
+            elif hasattr(value, 'cmd'):
+                setattr(cls, name, coroutine_command(value))
+            # прочие функции (например, print_line) возвращают результат корутины и не требуют обертки
+
+        return cls
+
+
+class AsyncDevice(compat.with_metaclass(AsyncSupportedCommands)):
+    SERIAL_TIMEOUT = device.Device.SERIAL_TIMEOUT
+    WAIT_TIME = device.Device.WAIT_TIME
+    PRINT_TIMEOUT = device.Device.PRINT_TIMEOUT
+
+    DEFAULT_CASHIER_PASSWORD = device.Device.DEFAULT_CASHIER_PASSWORD
+    DEFAULT_ADMIN_PASSWORD = device.Device.DEFAULT_ADMIN_PASSWORD
+
+    DEFAULT_MAX_LENGTH = device.Device.DEFAULT_MAX_LENGTH
+
+    TAPES = device.Device.TAPES
+    FS = device.Device.FS
+
+    def __init__(self, port='/dev/ttyS0', baudrate=9600, timeout=None, password=None, admin_password=None,
+                 session=False, opener=None):
+        """
+        Асинхронное устройство. Методы-команды являются корутинами.
+
+        :type port: str
+        :param port: порт взаимодействия с устройством или адрес 'host:port'
+        :type baudrate: int
+        :param baudrate: скорость взаимодействия с устройством
+        :type timeout: float
+        :param timeout: время таймаута ответа устройства
+        :type password: int
+        :param password: пароль кассира
+        :type admin_password: int
+        :param admin_password: пароль администратора
+        :type session: bool
+        :param session: сессионный режим (проверка связи только при подключении и после ошибки обмена)
+        :param opener: корутина, возвращающая пару (asyncio.StreamReader, asyncio.StreamWriter)
+        """
+
+        self.protocol = AsyncProtocol(
+            port,
+            baudrate,
+            timeout or self.SERIAL_TIMEOUT,
+            fs=self.FS,
+            session=session,
+            opener=opener
+        )
+
+        self.print_tracker = printing.PrintTracker(baudrate, poll_time=self.WAIT_TIME)
+        self.protocol.listeners.append(self.print_tracker)
+        # ответы state/fs_state не кешируются
+        self.status = status.StatusCache()
+
+        self.password = password or self.DEFAULT_CASHIER_PASSWORD
+        self.admin_password = admin_password or self.DEFAULT_ADMIN_PASSWORD
+
+        self.dev_info = None
+
+    port = property(lambda self: self.protocol.port)
+    connected = device.Device.connected
+    name = device.Device.name
+
+    async def connect(self, force=False):
+        """
+        Подключиться к ККМ.
+
+        :type force: bool
+        :param force: отключиться перед подключением
+        """
+
+        if force:
+            await self.protocol.disconnect()
+
+        await self.protocol.connect()
+
+        if hasattr(self, 'model'):
+            self.dev_info = await self.model()
+            self.protocol.set_context(self.protocol.context._replace(model=self.dev_info[u'Модель устройства']))
+
+    async def disconnect(self):
+        """
+        Отключиться от ККМ.
+        """
+
+        await self.protocol.disconnect()
+
+
+def from_device(device_cls):
+    """
+    Создание асинхронного класса устройства по синхронному.
+
+    :type device_cls: type
+    :param device_cls: класс устройства из модуля pyshtrih.device
+    """
+
+    return AsyncSupportedCommands(device_cls.__name__, (AsyncDevice, ), {
+        '__module__': __name__,
+        'SUPPORTED_COMMANDS': tuple(device_cls.SUPPORTED_COMMANDS),
+        'DEFAULT_MAX_LENGTH': device_cls.DEFAULT_MAX_LENGTH,
+        'TAPES': device_cls.TAPES,
+        'FS': device_cls.FS
+    })
+
+
+ShtrihFRK = from_device(device.ShtrihFRK)
+ShtrihFRPTK = from_device(device.ShtrihFRPTK)
+ShtrihComboFRK = from_device(device.ShtrihComboFRK)
+ShtrihComboPTK = from_device(device.ShtrihComboPTK)
+ShtrihLightPTK = from_device(device.ShtrihLightPTK)
+Shtrih950K = from_device(device.Shtrih950K)
+ShtrihFR01F = from_device(device.ShtrihFR01F)
+ShtrihOnLine = from_device(device.ShtrihOnLine)
+ShtrihM01F = from_device(device.ShtrihM01F)
+ShtrihM02F = from_device(device.ShtrihM02F)
+ShtrihLight01F = from_device(device.ShtrihLight01F)
+ShtrihLight02F = from_device(device.ShtrihLight02F)
+ShtrihMini01F = from_device(device.ShtrihMini01F)
+Retail01F = from_device(device.Retail01F)
+ShtrihAllCommands = from_device(device.ShtrihAllCommands)
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+
+import io
+import time
+import struct
+import collections
+
+from . import misc, transport as tr
+from .compat import monotonic
+
+
+MAGIC = b'PSHC'
+VERSION = 1
+# сигнатура, версия, время начала записи (time.time)
+FILE_HEADER = struct.Struct('<4sBd')
+# тип записи, интервал от предыдущей записи (мкс), длина данных
+RECORD_HEADER = struct.Struct('<BIH')
+MAX_INTERVAL = 2 ** 32 - 1
+
+# типы записей
+READ, WRITE, OPEN, CLOSE, FLUSH_INPUT = range(5)
+
+STX = 0x02
+ACK = 0x06
+
+
+Record = collections.namedtuple('Record', 'kind time data')
+
+
+class ReplayError(tr.TransportError):
+    pass
+
+
+def records(path):
+    """
+    Чтение записей файла захвата.
+
+    :type path: str
+    :param path: путь к файлу захвата
+
+    :rtype: tuple
+    :return: (время начала записи, список Record со временем в секундах от начала записи)
+    """
+
+    with io.open(path, 'rb') as fd:
+        data = fd.read()
+
+    if len(data) < FILE_HEADER.size:
+        raise ValueError(u'Файл {} не является файлом захвата'.format(path))
+
+    magic, version, started = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(u'Файл {} не является файлом захвата версии {}'.format(path, VERSION))
+
+    result = []
+    offset = FILE_HEADER.size
+    elapsed = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, interval, size = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + size > len(data):
+            # запись прервана сбоем
+            break
+
+        elapsed += interval
+        result.append(Record(kind, elapsed / 1e6, data[offset:offset + size]))
+        offset += size
+
+    return started, result
+
+
+def payloads(path):
+    """
+    Полезная нагрузка кадров ответов ККМ из файла захвата (кадры с неверной LRC пропускаются).
+
+    :type path: str
+    :param path: путь к файлу захвата
+
+    :rtype: list
+    :return: список bytearray
+    """
+
+    stream = bytearray().join(record.data for record in records(path)[1] if record.kind == READ)
+
+    result = []
+    offset = 0
+    while offset < len(stream):
+        if stream[offset] != STX or offset + 1 >= len(stream):
+            offset += 1
+            continue
+
+        end = offset + stream[offset + 1] + 2
+        if end >= len(stream):
+            break
+
+        if misc.lrc(stream[offset + 1:end]) == stream[end]:
+            result.append(stream[offset + 2:end])
+            offset = end + 1
+        else:
+            offset += 1
+
+    return result
+
+
+def commands(path):
+    """
+    Кадры команд, принятых ККМ (подтвержденных ACK), в порядке отправки.
+
+    :type path: str
+    :param path: путь к файлу захвата
+
+    :rtype: list
+    :return: список bytearray
+    """
+
+    result = []
+    pending = None
+    for record in records(path)[1]:
+        if record.kind == WRITE and record.data[:1] == bytearray((STX, )):
+            pending = bytearray(record.data)
+        elif record.kind == READ and record.data and pending is not None:
+            if bytearray(record.data)[0] == ACK:
+                result.append(pending)
+            pending = None
+
+    return result
+
+
+class RecordingTransport(tr.Transport):
+    def __init__(self, transport, path):
+        """
+        Транспорт, записывающий все переданные и принятые байты в файл захвата.
+
+        Каждая операция (чтение, в т.ч. завершившееся таймаутом, запись, открытие, закрытие,
+        очистка входного буфера) записывается с интервалом от предыдущей операции
+        по монотонным часам. Файл воспроизводится ReplayTransport.
+
+        :type transport: pyshtrih.transport.Transport
+        :param transport: записываемый транспорт
+        :type path: str
+        :param path: путь к файлу захвата (перезаписывается)
+        """
+
+        self.transport = transport
+        self.path = path
+        self.file = io.open(path, 'wb')
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, time.time()))
+        self.last = monotonic()
+
+    port = property(
+        lambda self: self.transport.port,
+        lambda self, value: setattr(self.transport, 'port', value)
+    )
+    baudrate = property(
+        lambda self: self.transport.baudrate,
+        lambda self, value: setattr(self.transport, 'baudrate', value)
+    )
+    timeout = property(
+        lambda self: self.transport.timeout,
+        lambda self, value: setattr(self.transport, 'timeout', value)
+    )
+
+    def record(self, kind, data=b''):
+        now = monotonic()
+        interval = min(int((now - self.last) * 1e6), MAX_INTERVAL)
+        self.last = now
+
+        self.file.write(RECORD_HEADER.pack(kind, interval, len(data)))
+        self.file.write(data)
+
+    @property
+    def is_open(self):
+        return self.transport.is_open
+
+    @property
+    def in_waiting(self):
+        return self.transport.in_waiting
+
+    def open(self):
+        self.transport.open()
+        self.record(OPEN)
+
+    def close(self):
+        self.transport.close()
+        self.record(CLOSE)
+        self.file.flush()
+
+    def read(self, size=1):
+        data = self.transport.read(size)
+        self.record(READ, data)
+        return data
+
+    def write(self, data):
+        self.transport.write(data)
+        self.record(WRITE, bytes(data))
+        self.file.flush()
+
+    def flush_input(self):
+        self.transport.flush_input()
+        self.record(FLUSH_INPUT)
+
+    def flush_output(self):
+        self.transport.flush_output()
+
+    def stop(self):
+        """
+        Закрыть файл захвата.
+        """
+
+        if not self.file.closed:
+            self.file.close()
+
+
+class ReplayTransport(tr.Transport):
+    def __init__(self, path, realtime=False, strict=True, port=u'replay', baudrate=None, timeout=None):
+        """
+        Транспорт, воспроизводящий файл захвата RecordingTransport.
+
+        Чтения возвращают записанные данные (в т.ч. пустые ответы по таймауту) в исходном порядке.
+
+        :type path: str
+        :param path: путь к файлу захвата
+        :type realtime: bool
+        :param realtime: выдерживать исходные интервалы между операциями
+                         (False - воспроизведение с максимальной скоростью)
+        :type strict: bool
+        :param strict: сверять записываемые байты с записанными (ReplayError при расхождении)
+        """
+
+        super(ReplayTransport, self).__init__(port, baudrate, timeout)
+
+        self.path = path
+        self.realtime = realtime
+        self.strict = strict
+        self.records = collections.deque(
+            record for record in records(path)[1] if record.kind in (READ, WRITE)
+        )
+        self.buffer = bytearray()
+        self.opened = False
+        self.started = None
+
+    def wait(self, record):
+        if not self.realtime:
+            return
+
+        if self.started is None:
+            self.started = monotonic() - record.time
+        delay = self.started + record.time - monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def next_read(self):
+        """
+        Следующая запись чтения (операции записи пропускаются или, в режиме strict, считаются ошибкой).
+
+        :rtype: Record
+        """
+
+        while self.records:
+            record = self.records[0]
+            if record.kind == READ:
+                return self.records.popleft()
+            if self.strict:
+                raise ReplayError(u'Ожидалась запись {!r}'.format(bytes(record.data)))
+            self.records.popleft()
+
+    @property
+    def is_open(self):
+        return self.opened
+
+    @property
+    def in_waiting(self):
+        return len(self.buffer)
+
+    def open(self):
+        self.opened = True
+
+    def close(self):
+        self.opened = False
+
+    def read(self, size=1):
+        if len(self.buffer) < size:
+            record = self.next_read()
+            if record is None:
+                raise ReplayError(u'Файл захвата закончился')
+
+            self.wait(record)
+            if not record.data and not self.buffer:
+                # чтение завершилось таймаутом
+                return bytes()
+            self.buffer.extend(record.data)
+
+        result = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return result
+
+    def write(self, data):
+        while self.records and self.records[0].kind == READ and not self.records[0].data:
+            # таймауты чтения, не запрошенные протоколом при воспроизведении
+            self.records.popleft()
+
+        if not self.records or self.records[0].kind != WRITE:
+            if self.strict:
+                raise ReplayError(u'Неожиданная запись {!r}'.format(bytes(data)))
+            return
+
+        record = self.records.popleft()
+        self.wait(record)
+        if self.strict and bytes(record.data) != bytes(data):
+            raise ReplayError(
+                u'Записано {!r}, ожидалось {!r}'.format(bytes(data), bytes(record.data))
+            )
+
+    def flush_input(self):
+        del self.buffer[:]
+
+    def flush_output(self):
+        pass
+
+
+def record(device, path):
+    """
+    Начать запись обмена устройства в файл захвата.
+
+    :type device: pyshtrih.device.Device
+    :param device: устройство
+    :type path: str
+    :param path: путь к файлу захвата
+
+    :rtype: RecordingTransport
+    :return: записывающий транспорт (метод stop закрывает файл захвата)
+    """
+
+    recorder = RecordingTransport(device.protocol.transport, path)
+    device.protocol.transport = device.protocol.reader.transport = recorder
+    return recorder
@@ -0,0 +1,536 @@
+# -*- coding: utf-8 -*-
+
+
+import struct
+import datetime
+
+from . import excepts, protocol
+from .compat import PY2, unicode
+from .handlers import functions as hf
+
+
+# теги значений (первый байт закодированного значения)
+NONE = 0x00
+TRUE = 0x01
+FALSE = 0x02
+INT = 0x03
+FLOAT = 0x04
+BYTES = 0x05
+TEXT = 0x06
+LIST = 0x07
+TUPLE = 0x08
+DICT = 0x09
+DATE = 0x0A
+TIME = 0x0B
+DATETIME = 0x0C
+FR_MODE = 0x0D
+FR_SUBMODE = 0x0E
+TYPE = 0x0F
+RESPONSE = 0x10
+ERROR = 0x11
+FIELD = 0x12
+
+FLOAT_STRUCT = struct.Struct('<d')
+
+# типы, передаваемые тегом TYPE (тип поля таблицы в ответе 0x2E)
+TYPES = {
+    u'int': int,
+    u'str': str
+}
+
+# номера полей ответов ККМ (ключ словаря параметров кодируется тегом FIELD и номером поля)
+# номер поля - его позиция в FIELDS: номера неизменны, новые поля добавляются только в конец,
+# поля, отсутствующие в FIELDS, кодируются текстом
+FIELDS = (
+    u'Код ошибки',
+    u'Порядковый номер оператора',
+    u'Флаги ФР',
+    u'Режим ФР',
+    u'Подрежим ФР',
+    u'Количество операций в чеке',
+    u'Напряжение резервной батареи',
+    u'Напряжение источника питания',
+    u'Код ошибки ФП',
+    u'Код ошибки ЭКЛЗ',
+    u'Зарезервировано',
+    u'Версия ПО ФР',
+    u'Сборка ПО ФР',
+    u'Дата ПО ФР',
+    u'Номер в зале',
+    u'Сквозной номер текущего документа',
+    u'Порт ФР',
+    u'Версия ПО ФП',
+    u'Сборка ПО ФП',
+    u'Дата ПО ФП',
+    u'Дата',
+    u'Время',
+    u'Флаги ФП',
+    u'Заводской номер',
+    u'Номер последней закрытой смены',
+    u'Количество свободных записей в ФП',
+    u'Количество перерегистраций (фискализаций)',
+    u'Количество оставшихся перерегистраций (фискализаций)',
+    u'ИНН',
+    u'Код скорости обмена',
+    u'Тайм аут приема байта',
+    u'Содержимое регистра',
+    u'Значение',
+    u'Название таблицы',
+    u'Количество рядов',
+    u'Количество полей',
+    u'Название поля',
+    u'Тип поля',
+    u'Сквозной номер документа',
+    u'Сдача',
+    u'Тип устройства',
+    u'Подтип устройства',
+    u'Версия протокола для данного устройства',
+    u'Подверсия протокола для данного устройства',
+    u'Модель устройства',
+    u'Язык устройства',
+    u'Название устройства',
+    u'Состояние фазы жизни',
+    u'Текущий документ',
+    u'Данные документа',
+    u'Состояние смены',
+    u'Флаги предупреждения',
+    u'Дата и время',
+    u'Номер ФН',
+    u'Номер последнего ФД',
+    u'Срок действия',
+    u'Кол-во оставшихся отчетов о перерегистрации',
+    u'Выполнено отчетов о перерегистрации',
+    u'Тип фискального документа',
+    u'Получена ли квитанция из ОФД',
+    u'Данные фискального документа',
+    u'Номер новой открытой смены',
+    u'Номер ФД',
+    u'Фискальный признак',
+    u'Номер чека',
+    u'Количество неподтверждённых документов',
+    u'Дата первого неподтверждённого документа',
+    u'Статус информационного обмена',
+    u'Состояние чтения сообщения',
+    u'Количество сообщений для ОФД',
+    u'Номер документа для ОФД первого в очереди',
+    u'Дата и время документа для ОФД первого в очереди',
+    u'Количество неподтверждённых ФД',
+    u'Номер смены',
+    u'Номер только что закрытой смены',
+    u'Увеличенная точность количества',
+    u'ЭКЛЗ почти заполнена',
+    u'Отказ левого датчика принтера',
+    u'Отказ правого датчика принтера',
+    u'Денежный ящик',
+    u'Крышка корпуса ФР',
+    u'Рычаг термоголовки чековой ленты',
+    u'Рычаг термоголовки контрольной ленты',
+    u'Оптический датчик чековой ленты',
+    u'Оптический датчик операционного журнала',
+    u'ЭКЛЗ',
+    u'Положение десятичной точки',
+    u'Нижний датчик подкладного документа',
+    u'Верхний датчик подкладного документа',
+    u'Рулон чековой ленты',
+    u'Рулон операционного журнала',
+    u'ФП 1',
+    u'ФП 2',
+    u'Лицензия',
+    u'Переполнение ФП',
+    u'Батарея ФП',
+    u'Последняя запись ФП',
+    u'Смена в ФП',
+    u'24 часа в ФП',
+    u'Закончена передача фискальных данных в ОФД',
+    u'Закрыт фискальный режим',
+    u'Открыт фискальный режим',
+    u'Проведена настройка ФН',
+    u'Превышено время ожидания ответа ОФД',
+    u'Переполнение памяти ФН (Архив ФН заполнен на 90%)',
+    u'Исчерпание ресурса криптографического сопроцессора (до окончания срока действия 30 дней)',
+    u'Срочная замена криптографического сопроцессора (до окончания срока действия 3 дня)',
+    u'Ожидание ответа на команду от ОФД',
+    u'Изменились настройки соединения с ОФД',
+    u'Есть команда от ОФД',
+    u'Ожидание ответного сообщения (квитанции) от ОФД',
+    u'Есть сообщение для передачи в ОФД',
+    u'Транспортное соединение установлено',
+    u'Количество байт',
+    u'Минимальное значение поля',
+    u'Максимальное значение поля',
+    u'Буфер принтера непуст',
+    u'Бумага на выходе из презентера',
+    u'Бумага на входе в презентер',
+    u'Модель принтера'
+)
+FIELD_IDS = {name: num for num, name in enumerate(FIELDS)}
+
+
+class CodecError(ValueError):
+    pass
+
+
+def write_uint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_uint(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        try:
+            byte = data[offset]
+        except IndexError:
+            raise CodecError(u'Неожиданный конец данных')
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def write_text(out, value):
+    value = value.encode('utf-8')
+    write_uint(out, len(value))
+    out.extend(value)
+
+
+def read_text(data, offset):
+    size, offset = read_uint(data, offset)
+    end = offset + size
+    if end > len(data):
+        raise CodecError(u'Неожиданный конец данных')
+    return bytes(data[offset:end]).decode('utf-8'), end
+
+
+def encode_int(out, value):
+    # zigzag: отрицательные числа кодируются нечетными
+    if 0 <= value < 0x40:
+        out.extend((INT, value << 1))
+    else:
+        out.append(INT)
+        write_uint(out, value << 1 if value >= 0 else ((-value) << 1) - 1)
+
+
+def encode_float(out, value):
+    out.append(FLOAT)
+    out.extend(FLOAT_STRUCT.pack(value))
+
+
+def encode_bytes(out, value):
+    out.append(BYTES)
+    write_uint(out, len(value))
+    out.extend(value)
+
+
+def encode_text(out, value):
+    out.append(TEXT)
+    write_text(out, value)
+
+
+def encode_sequence(tag):
+    def encoder(out, value):
+        out.append(tag)
+        write_uint(out, len(value))
+        for item in value:
+            encode_value(out, item)
+    return encoder
+
+
+def encode_field(num):
+    out = bytearray((FIELD, ))
+    write_uint(out, num)
+    return bytes(out)
+
+
+# название поля -> закодированный ключ
+FIELD_KEYS = {name: encode_field(num) for num, name in enumerate(FIELDS)}
+
+
+def encode_dict(out, value):
+    out.append(DICT)
+    write_uint(out, len(value))
+    for key, item in value.items():
+        field = FIELD_KEYS.get(key)
+        if field is not None:
+            out.extend(field)
+        else:
+            encode_value(out, key)
+        encode_value(out, item)
+
+
+def encode_date(out, value):
+    out.append(DATE)
+    write_uint(out, value.year)
+    out.append(value.month)
+    out.append(value.day)
+
+
+def encode_time(out, value):
+    out.append(TIME)
+    out.append(value.hour)
+    out.append(value.minute)
+    out.append(value.second)
+    write_uint(out, value.microsecond)
+
+
+def encode_datetime(out, value):
+    out.append(DATETIME)
+    write_uint(out, value.year)
+    out.extend((value.month, value.day, value.hour, value.minute, value.second))
+    write_uint(out, value.microsecond)
+
+
+def encode_fr_mode(out, value):
+    out.append(FR_MODE)
+    out.append(value.num | (value.status << 4))
+
+
+def encode_fr_submode(out, value):
+    out.append(FR_SUBMODE)
+    out.append(value.num)
+
+
+def encode_type(out, value):
+    if value not in TYPES.values():
+        raise CodecError(u'Тип {} не поддерживается'.format(value.__name__))
+    out.append(TYPE)
+    write_text(out, unicode(value.__name__))
+
+
+def encode_response(out, value):
+    out.append(RESPONSE)
+    write_uint(out, value.cmd)
+    encode_dict(out, value.params)
+
+
+def encode_error(out, value):
+    out.append(ERROR)
+    if isinstance(value, excepts.Error):
+        cls = type(value)
+        if getattr(excepts, cls.__name__, None) is not cls:
+            cls = excepts.Error
+        write_text(out, unicode(cls.__name__))
+        encode_dict(out, value.__dict__)
+    else:
+        cls = type(value)
+        if getattr(excepts, cls.__name__, None) is not cls:
+            # исключения вне pyshtrih.excepts передаются как ProtocolError с описанием
+            value = excepts.ProtocolError(u'{}: {}'.format(cls.__name__, unicode(value)))
+            cls = excepts.ProtocolError
+        write_text(out, unicode(cls.__name__))
+        encode_value(out, tuple(value.args))
+
+
+ENCODERS = {
+    type(None): lambda out, value: out.append(NONE),
+    bool: lambda out, value: out.append(TRUE if value else FALSE),
+    int: encode_int,
+    float: encode_float,
+    bytes: encode_bytes,
+    bytearray: encode_bytes,
+    unicode: encode_text,
+    list: encode_sequence(LIST),
+    tuple: encode_sequence(TUPLE),
+    dict: encode_dict,
+    datetime.date: encode_date,
+    datetime.time: encode_time,
+    datetime.datetime: encode_datetime,
+    hf.FRMode: encode_fr_mode,
+    hf.FRSubMode: encode_fr_submode,
+    type: encode_type,
+    protocol.Response: encode_response,
+    protocol.LazyResponse: encode_response
+}
+if PY2:
+    ENCODERS[long] = encode_int  # noqa: F821
+
+
+def encode_value(out, value):
+    encoder = ENCODERS.get(type(value))
+    if encoder is not None:
+        return encoder(out, value)
+
+    if isinstance(value, BaseException):
+        return encode_error(out, value)
+    if isinstance(value, memoryview):
+        return encode_bytes(out, value.tobytes())
+    if isinstance(value, dict):
+        return encode_dict(out, value)
+
+    raise CodecError(u'Тип {} не поддерживается'.format(type(value).__name__))
+
+
+def decode_int(data, offset):
+    value, offset = read_uint(data, offset)
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1), offset
+
+
+def decode_float(data, offset):
+    if offset + FLOAT_STRUCT.size > len(data):
+        raise CodecError(u'Неожиданный конец данных')
+    return FLOAT_STRUCT.unpack_from(data, offset)[0], offset + FLOAT_STRUCT.size
+
+
+def decode_bytes(data, offset):
+    size, offset = read_uint(data, offset)
+    if offset + size > len(data):
+        raise CodecError(u'Неожиданный конец данных')
+    return bytearray(data[offset:offset + size]), offset + size
+
+
+def decode_sequence(data, offset):
+    count, offset = read_uint(data, offset)
+    result = []
+    for _ in range(count):
+        item, offset = decode_value(data, offset)
+        result.append(item)
+    return result, offset
+
+
+def decode_tuple(data, offset):
+    result, offset = decode_sequence(data, offset)
+    return tuple(result), offset
+
+
+def decode_dict(data, offset):
+    count, offset = read_uint(data, offset)
+    result = {}
+    for _ in range(count):
+        if offset < len(data) and data[offset] == FIELD:
+            num, offset = read_uint(data, offset + 1)
+            try:
+                key = FIELDS[num]
+            except IndexError:
+                raise CodecError(u'Неизвестный номер поля {}'.format(num))
+        else:
+            key, offset = decode_value(data, offset)
+        result[key], offset = decode_value(data, offset)
+    return result, offset
+
+
+def decode_date(data, offset):
+    year, offset = read_uint(data, offset)
+    month, day = data[offset:offset + 2]
+    return datetime.date(year, month, day), offset + 2
+
+
+def decode_time(data, offset):
+    hour, minute, second = data[offset:offset + 3]
+    microsecond, offset = read_uint(data, offset + 3)
+    return datetime.time(hour, minute, second, microsecond), offset
+
+
+def decode_datetime(data, offset):
+    year, offset = read_uint(data, offset)
+    month, day, hour, minute, second = data[offset:offset + 5]
+    microsecond, offset = read_uint(data, offset + 5)
+    return datetime.datetime(year, month, day, hour, minute, second, microsecond), offset
+
+
+def decode_type(data, offset):
+    name, offset = read_text(data, offset)
+    try:
+        return TYPES[name], offset
+    except KeyError:
+        raise CodecError(u'Тип {} не поддерживается'.format(name))
+
+
+def decode_response(data, offset):
+    cmd, offset = read_uint(data, offset)
+    params, offset = decode_value(data, offset)
+    try:
+        return protocol.Response(cmd, params), offset
+    except KeyError:
+        raise CodecError(u'Неизвестная команда 0x{:02X}'.format(cmd))
+
+
+def decode_error(data, offset):
+    name, offset = read_text(data, offset)
+    state, offset = decode_value(data, offset)
+    cls = getattr(excepts, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, excepts.ProtocolError)):
+        raise CodecError(u'Неизвестное исключение {}'.format(name))
+    if issubclass(cls, excepts.Error):
+        return excepts.restore(cls, state), offset
+    return cls(*state), offset
+
+
+# тег -> функция декодирования (данные, смещение после тега) -> (значение, смещение)
+DECODERS = {
+    NONE: lambda data, offset: (None, offset),
+    TRUE: lambda data, offset: (True, offset),
+    FALSE: lambda data, offset: (False, offset),
+    INT: decode_int,
+    FLOAT: decode_float,
+    BYTES: decode_bytes,
+    TEXT: read_text,
+    LIST: decode_sequence,
+    TUPLE: decode_tuple,
+    DICT: decode_dict,
+    DATE: decode_date,
+    TIME: decode_time,
+    DATETIME: decode_datetime,
+    FR_MODE: lambda data, offset: (hf.FRMode(data[offset]), offset + 1),
+    FR_SUBMODE: lambda data, offset: (hf.FRSubMode(data[offset]), offset + 1),
+    TYPE: decode_type,
+    RESPONSE: decode_response,
+    ERROR: decode_error
+}
+
+
+def decode_value(data, offset):
+    try:
+        decoder = DECODERS[data[offset]]
+    except IndexError:
+        raise CodecError(u'Неожиданный конец данных')
+    except KeyError:
+        raise CodecError(u'Неизвестный тег 0x{:02X}'.format(data[offset]))
+    return decoder(data, offset + 1)
+
+
+def dumps(value):
+    """
+    Кодирование значения в компактный двоичный формат.
+
+    Поддерживаются None, bool, int, float, bytes/bytearray, unicode, list, tuple, dict,
+    datetime.date/time/datetime, FRMode, FRSubMode, типы полей таблиц (int, str),
+    Response (в т.ч. LazyResponse) и исключения pyshtrih.excepts.
+
+    Ответ ККМ кодируется номером команды (название команды восстанавливается по номеру)
+    и параметрами, названия полей которых заменяются номерами из FIELDS:
+
+        >>> data = codec.dumps(device.state())
+        >>> codec.loads(data)[u'Режим ФР']
+
+    :rtype: bytearray
+    """
+
+    out = bytearray()
+    encode_value(out, value)
+    return out
+
+
+def loads(data):
+    """
+    Декодирование значения, закодированного dumps.
+
+    :type data: bytes or bytearray
+    :param data: закодированное значение
+
+    :raises CodecError: данные повреждены или содержат неподдерживаемое значение
+    """
+
+    data = bytearray(data)
+    try:
+        value, offset = decode_value(data, 0)
+    except (IndexError, KeyError, ValueError, TypeError) as exc:
+        if isinstance(exc, CodecError):
+            raise
+        raise CodecError(u'Поврежденные данные: {}'.format(exc))
+    if offset != len(data):
+        raise CodecError(u'Лишние данные после значения')
+    return value
@@ -2,20 +2,26 @@
 
 
 import sys
-import time
 import inspect
 
-from . import misc, excepts
+from . import misc, excepts, encoders
 
 
-def state(self):
+def state(self, fresh=False):
     """
     Состояние ККМ в коротком виде.
+
+    Ответ кешируется на время STATUS_TTL (см. pyshtrih.status.StatusCache).
+
+    :type fresh: bool
+    :param fresh: запросить состояние в обход кеша
     """
 
-    return self.protocol.command(
+    return self.status.get(
         0x10,
-        self.password
+        fresh,
+        self.protocol.command_frame,
+        encoders.ENCODERS[0x10](self.password)
     )
 state.cmd = 0x10
 
@@ -25,9 +31,8 @@ def full_state(self):
     Состояние ККМ.
     """
 
-    return self.protocol.command(
-        0x11,
-        self.password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x11](self.password)
     )
 full_state.cmd = 0x11
 
@@ -37,9 +42,8 @@ def beep(self):
     Гудок.
     """
 
-    return self.protocol.command(
-        0x13,
-        self.password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x13](self.password)
     )
 beep.cmd = 0x13
 
@@ -49,12 +53,13 @@ def set_exchange_params(self, port, baudrate, timeout):
     Установка параметров обмена.
     """
 
-    return self.protocol.command(
-        0x14,
-        self.admin_password,
-        misc.CAST_SIZE['1'](port),
-        misc.CAST_SIZE['1'](misc.BAUDRATE_DIRECT[baudrate]),
-        misc.CAST_SIZE['1'](misc.cast_byte_timeout(timeout))
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x14](
+            self.admin_password,
+            port,
+            misc.BAUDRATE_DIRECT[baudrate],
+            misc.cast_byte_timeout(timeout)
+        )
     )
 set_exchange_params.cmd = 0x14
 
@@ -64,10 +69,8 @@ def read_exchange_params(self, port):
     Чтение параметров обмена.
     """
 
-    return self.protocol.command(
-        0x15,
-        self.admin_password,
-        misc.CAST_SIZE['1'](port)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x15](self.admin_password, port)
     )
 read_exchange_params.cmd = 0x15
 
@@ -77,8 +80,8 @@ def reset_settings(self):
     Технологическое обнуление.
     """
 
-    return self.protocol.command_nopass(
-        0x16
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x16]()
     )
 reset_settings.cmd = 0x16
 
@@ -92,11 +95,8 @@ def print_string(self, string, control_tape=True, cash_tape=True):
     cash = 0b10 if cash_tape else 0b00
 
     self.wait_printing()
-    return self.protocol.command(
-        0x17,
-        self.password,
-        misc.CAST_SIZE['1'](control + cash),
-        misc.prepare_string(string, self.DEFAULT_MAX_LENGTH)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x17](self.password, control + cash, string, length=self.DEFAULT_MAX_LENGTH)
     )
 print_string.cmd = 0x17
 
@@ -116,10 +116,8 @@ def test_start(self, minute):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0x19,
-        self.password,
-        misc.CAST_SIZE['1'](minute)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x19](self.password, minute)
     )
 test_start.cmd = 0x19
 
@@ -129,10 +127,8 @@ def request_monetary_register(self, num):
     Запрос денежного регистра.
     """
 
-    return self.protocol.command(
-        0x1A,
-        self.password,
-        misc.CAST_SIZE['1'](num)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x1A](self.password, num)
     )
 request_monetary_register.cmd = 0x1A
 
@@ -142,10 +138,8 @@ def request_operational_register(self, num):
     Запрос операционного регистра.
     """
 
-    return self.protocol.command(
-        0x1B,
-        self.password,
-        misc.CAST_SIZE['1'](num)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x1B](self.password, num)
     )
 request_operational_register.cmd = 0x1B
 
@@ -184,10 +178,8 @@ def read_table(self, table, row, field, _type):
             u'ожидаемые типы {}'.format(', '.join(cast_funcs_map.keys()))
         )
 
-    result = self.protocol.command(
-        0x1F,
-        self.admin_password,
-        misc.CAST_SIZE['121'](table, row, field)
+    result = self.protocol.command_frame(
+        encoders.ENCODERS[0x1F](self.admin_password, table, row, field)
     )
     result[u'Значение'] = cast_funcs_map[_type](result[u'Значение'])
 
@@ -201,10 +193,8 @@ def set_time(self, time_):
     """
 
     # TODO: разобраться с округлением секунд до 00
-    return self.protocol.command(
-        0x21,
-        self.admin_password,
-        misc.CAST_SIZE['111'](time_.hour, time_.minute, time_.second)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x21](self.admin_password, time_.hour, time_.minute, time_.second)
     )
 set_time.cmd = 0x21
 
@@ -214,10 +204,8 @@ def set_date(self, date):
     Программирование даты.
     """
 
-    return self.protocol.command(
-        0x22,
-        self.admin_password,
-        misc.CAST_SIZE['111'](date.day, date.month, date.year - 2000)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x22](self.admin_password, date.day, date.month, date.year - 2000)
     )
 set_date.cmd = 0x22
 
@@ -227,10 +215,8 @@ def confirm_date(self, date):
     Подтверждение программирование даты.
     """
 
-    return self.protocol.command(
-        0x23,
-        self.admin_password,
-        misc.CAST_SIZE['111'](date.day, date.month, date.year - 2000)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x23](self.admin_password, date.day, date.month, date.year - 2000)
     )
 confirm_date.cmd = 0x23
 
@@ -255,10 +241,8 @@ def cut(self, partial=False):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0x25,
-        self.password,
-        misc.CAST_SIZE['1'](partial)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x25](self.password, partial)
     )
 cut.cmd = 0x25
 
@@ -268,10 +252,8 @@ def open_drawer(self, box=0):
     Открыть денежный ящик.
     """
 
-    return self.protocol.command(
-        0x28,
-        self.password,
-        misc.CAST_SIZE['1'](box)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x28](self.password, box)
     )
 open_drawer.cmd = 0x28
 
@@ -289,11 +271,8 @@ def feed(self, count, control_tape=False, cash_tape=False, skid_document=False):
     skid = 0b100 if skid_document else 0b000
 
     self.wait_printing()
-    return self.protocol.command(
-        0x29,
-        self.password,
-        misc.CAST_SIZE['1'](control + cash + skid),
-        misc.CAST_SIZE['1'](count)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x29](self.password, control + cash + skid, count)
     )
 feed.cmd = 0x29
 
@@ -304,9 +283,8 @@ def test_stop(self):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0x2B,
-        self.password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x2B](self.password)
     )
 test_stop.cmd = 0x2B
 
@@ -316,10 +294,8 @@ def request_table_structure(self, table):
     Запрос структуры таблицы.
     """
 
-    return self.protocol.command(
-        0x2D,
-        self.admin_password,
-        misc.CAST_SIZE['1'](table)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x2D](self.admin_password, table)
     )
 request_table_structure.cmd = 0x2D
 
@@ -329,10 +305,8 @@ def request_field_structure(self, table, field):
     Запрос структуры поля.
     """
 
-    return self.protocol.command(
-        0x2E,
-        self.admin_password,
-        misc.CAST_SIZE['11'](table, field)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x2E](self.admin_password, table, field)
     )
 request_field_structure.cmd = 0x2E
 
@@ -343,9 +317,8 @@ def x_report(self):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0x40,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x40](self.admin_password)
     )
 x_report.cmd = 0x40
 
@@ -356,9 +329,8 @@ def z_report(self):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0x41,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x41](self.admin_password)
     )
 z_report.cmd = 0x41
 
@@ -369,10 +341,8 @@ def income(self, cash):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0x50,
-        self.password,
-        misc.CAST_SIZE['11111'](*misc.int_to_bytes(cash, 5))
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x50](self.password, cash)
     )
 income.cmd = 0x50
 
@@ -383,10 +353,8 @@ def outcome(self, cash):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0x51,
-        self.password,
-        misc.CAST_SIZE['11111'](*misc.int_to_bytes(cash, 5))
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x51](self.password, cash)
     )
 outcome.cmd = 0x51
 
@@ -399,14 +367,19 @@ def sale(self, item, department_num=0, tax1=0, tax2=0, tax3=0, tax4=0):
     text, quantity, price = item
 
     try:
-        return self.protocol.command(
-            0x80,
-            self.password,
-            misc.CAST_SIZE['11111'](*misc.int_to_bytes(quantity, 5)),
-            misc.CAST_SIZE['11111'](*misc.int_to_bytes(price, 5)),
-            misc.CAST_SIZE['1'](department_num),
-            misc.CAST_SIZE['1111'](tax1, tax2, tax3, tax4),
-            misc.prepare_string(text, self.DEFAULT_MAX_LENGTH)
+        return self.protocol.command_frame(
+            encoders.ENCODERS[0x80](
+                self.password,
+                quantity,
+                price,
+                department_num,
+                tax1,
+                tax2,
+                tax3,
+                tax4,
+                text,
+                length=self.DEFAULT_MAX_LENGTH
+            )
         )
     except excepts.Error as exc:
         raise excepts.ItemSaleError(exc)
@@ -420,14 +393,19 @@ def return_sale(self, item, department_num=0, tax1=0, tax2=0, tax3=0, tax4=0):
 
     text, quantity, price = item
 
-    return self.protocol.command(
-        0x82,
-        self.password,
-        misc.CAST_SIZE['11111'](*misc.int_to_bytes(quantity, 5)),
-        misc.CAST_SIZE['11111'](*misc.int_to_bytes(price, 5)),
-        misc.CAST_SIZE['1'](department_num),
-        misc.CAST_SIZE['1111'](tax1, tax2, tax3, tax4),
-        misc.prepare_string(text, self.DEFAULT_MAX_LENGTH)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x82](
+            self.password,
+            quantity,
+            price,
+            department_num,
+            tax1,
+            tax2,
+            tax3,
+            tax4,
+            text,
+            length=self.DEFAULT_MAX_LENGTH
+        )
     )
 return_sale.cmd = 0x82
 
@@ -448,17 +426,22 @@ def close_check(self,
     """
 
     try:
-        return self.protocol.command(
-            0x85,
-            self.password,
-            misc.CAST_SIZE['11111'](*misc.int_to_bytes(cash, 5)),
-            misc.CAST_SIZE['11111'](*misc.int_to_bytes(payment_type2, 5)),
-            misc.CAST_SIZE['11111'](*misc.int_to_bytes(payment_type3, 5)),
-            misc.CAST_SIZE['11111'](*misc.int_to_bytes(payment_type4, 5)),
-            # TODO: проверить скидку/надбавку
-            misc.CAST_SIZE['s2'](discount_allowance),
-            misc.CAST_SIZE['1111'](tax1, tax2, tax3, tax4),
-            misc.prepare_string(text, self.DEFAULT_MAX_LENGTH)
+        return self.protocol.command_frame(
+            encoders.ENCODERS[0x85](
+                self.password,
+                cash,
+                payment_type2,
+                payment_type3,
+                payment_type4,
+                # TODO: проверить скидку/надбавку
+                discount_allowance,
+                tax1,
+                tax2,
+                tax3,
+                tax4,
+                text,
+                length=self.DEFAULT_MAX_LENGTH
+            )
         )
     except excepts.ProtocolError as exc:
         raise excepts.CloseCheckError(exc)
@@ -470,12 +453,8 @@ def discount(self, sum_, tax1=0, tax2=0, tax3=0, tax4=0, text=None):
     Скидка.
     """
 
-    return self.protocol.command(
-        0x86,
-        self.password,
-        misc.CAST_SIZE['11111'](*misc.int_to_bytes(sum_, 5)),
-        misc.CAST_SIZE['1111'](tax1, tax2, tax3, tax4),
-        misc.prepare_string(text, self.DEFAULT_MAX_LENGTH)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x86](self.password, sum_, tax1, tax2, tax3, tax4, text, length=self.DEFAULT_MAX_LENGTH)
     )
 discount.cmd = 0x86
 
@@ -485,12 +464,8 @@ def allowance(self, sum_, tax1=0, tax2=0, tax3=0, tax4=0, text=None):
     Надбавка.
     """
 
-    return self.protocol.command(
-        0x87,
-        self.password,
-        misc.CAST_SIZE['11111'](*misc.int_to_bytes(sum_, 5)),
-        misc.CAST_SIZE['1111'](tax1, tax2, tax3, tax4),
-        misc.prepare_string(text, self.DEFAULT_MAX_LENGTH)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x87](self.password, sum_, tax1, tax2, tax3, tax4, text, length=self.DEFAULT_MAX_LENGTH)
     )
 allowance.cmd = 0x87
 
@@ -501,9 +476,8 @@ def cancel_check(self):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0x88,
-        self.password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x88](self.password)
     )
 cancel_check.cmd = 0x88
 
@@ -514,9 +488,8 @@ def repeat(self):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0x8C,
-        self.password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0x8C](self.password)
     )
 repeat.cmd = 0x8C
 
@@ -528,10 +501,8 @@ def open_check(self, check_type):
 
     self.wait_printing()
     try:
-        return self.protocol.command(
-            0x8D,
-            self.password,
-            misc.CAST_SIZE['1'](check_type)
+        return self.protocol.command_frame(
+            encoders.ENCODERS[0x8D](self.password, check_type)
         )
     except excepts.Error as exc:
         raise excepts.OpenCheckError(exc)
@@ -544,13 +515,18 @@ def epct_report_by_departments_in_date_range(self, date_first, date_last, report
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0xA0,
-        self.admin_password,
-        misc.CAST_SIZE['1'](report_type),
-        misc.CAST_SIZE['1'](department_num),
-        misc.CAST_SIZE['111'](date_first.day, date_first.month, date_first.year % 100),
-        misc.CAST_SIZE['111'](date_last.day, date_last.month, date_last.year % 100)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xA0](
+            self.admin_password,
+            report_type,
+            department_num,
+            date_first.day,
+            date_first.month,
+            date_first.year % 100,
+            date_last.day,
+            date_last.month,
+            date_last.year % 100
+        )
     )
 epct_report_by_departments_in_date_range.cmd = 0xA0
 
@@ -561,12 +537,17 @@ def epct_report_by_shifts_closures_in_date_range(self, date_first, date_last, re
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0xA2,
-        self.admin_password,
-        misc.CAST_SIZE['1'](report_type),
-        misc.CAST_SIZE['111'](date_first.day, date_first.month, date_first.year % 100),
-        misc.CAST_SIZE['111'](date_last.day, date_last.month, date_last.year % 100)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xA2](
+            self.admin_password,
+            report_type,
+            date_first.day,
+            date_first.month,
+            date_first.year % 100,
+            date_last.day,
+            date_last.month,
+            date_last.year % 100
+        )
     )
 epct_report_by_shifts_closures_in_date_range.cmd = 0xA2
 
@@ -576,9 +557,8 @@ def continue_print(self):
     Продолжение печати.
     """
 
-    return self.protocol.command(
-        0xB0,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xB0](self.admin_password)
     )
 continue_print.cmd = 0xB0
 
@@ -603,11 +583,8 @@ def print_graphics(self, start_line, end_line):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0xC1,
-        self.password,
-        misc.CAST_SIZE['1'](start_line),
-        misc.CAST_SIZE['1'](end_line)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xC1](self.password, start_line, end_line)
     )
 print_graphics.cmd = 0xC1
 
@@ -618,10 +595,8 @@ def print_barcode(self, num):
     """
 
     self.wait_printing()
-    return self.protocol.command(
-        0xC2,
-        self.password,
-        misc.CAST_SIZE['11111'](*misc.int_to_bytes(num, 5))
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xC2](self.password, num)
     )
 print_barcode.cmd = 0xC2
 
@@ -631,9 +606,8 @@ def open_shift(self):
     Открыть смену.
     """
 
-    return self.protocol.command(
-        0xE0,
-        self.password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xE0](self.password)
     )
 open_shift.cmd = 0xE0
 
@@ -643,20 +617,27 @@ def model(self):
     Получить тип устройства.
     """
 
-    return self.protocol.command_nopass(
-        0xFC
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFC]()
     )
 model.cmd = 0xFC
 
 
-def fs_state(self):
+def fs_state(self, fresh=False):
     """
     Запрос статуса ФН.
+
+    Ответ кешируется на время STATUS_TTL (см. pyshtrih.status.StatusCache).
+
+    :type fresh: bool
+    :param fresh: запросить статус в обход кеша
     """
 
-    return self.protocol.command(
+    return self.status.get(
         0xFF01,
-        self.admin_password
+        fresh,
+        self.protocol.command_frame,
+        encoders.ENCODERS[0xFF01](self.admin_password)
     )
 fs_state.cmd = 0xFF01
 
@@ -666,9 +647,8 @@ def fs_expiration_time(self):
     Запрос срока действия ФН.
     """
 
-    return self.protocol.command(
-        0xFF03,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF03](self.admin_password)
     )
 fs_expiration_time.cmd = 0xFF03
 
@@ -678,9 +658,8 @@ def fs_cancel_document(self):
     Отменить документ в ФН.
     """
 
-    return self.protocol.command(
-        0xFF08,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF08](self.admin_password)
     )
 fs_cancel_document.cmd = 0xFF08
 
@@ -690,10 +669,8 @@ def fs_find_document_by_num(self, num):
     Найти фискальный документ по номеру.
     """
 
-    return self.protocol.command(
-        0xFF0A,
-        self.admin_password,
-        misc.CAST_SIZE['4'](num)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF0A](self.admin_password, num)
     )
 fs_find_document_by_num.cmd = 0xFF0A
 
@@ -703,9 +680,8 @@ def fs_open_shift(self):
     Открыть смену в ФН.
     """
 
-    return self.protocol.command(
-        0xFF0B,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF0B](self.admin_password)
     )
 fs_open_shift.cmd = 0xFF0B
 
@@ -733,9 +709,8 @@ def fs_begin_correction_check(self):
     Начать формирование чека коррекции.
     """
 
-    return self.protocol.command(
-        0xFF35,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF35](self.admin_password)
     )
 fs_begin_correction_check.cmd = 0xFF35
 
@@ -745,11 +720,8 @@ def fs_correction_check(self, sum_, check_type):
     Сформировать чек коррекции.
     """
 
-    return self.protocol.command(
-        0xFF36,
-        self.admin_password,
-        misc.CAST_SIZE['11111'](*misc.int_to_bytes(sum_, 5)),
-        misc.CAST_SIZE['1'](check_type)
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF36](self.admin_password, sum_, check_type)
     )
 fs_correction_check.cmd = 0xFF36
 
@@ -759,9 +731,8 @@ def fs_calculation_state_report(self):
     Сформировать отчёт о состоянии расчётов.
     """
 
-    return self.protocol.command(
-        0xFF38,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF38](self.admin_password)
     )
 fs_calculation_state_report.cmd = 0xFF38
 
@@ -771,9 +742,8 @@ def fs_info_exchange(self):
     Получить статус информационного обмена.
     """
 
-    return self.protocol.command(
-        0xFF39,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF39](self.admin_password)
     )
 fs_info_exchange.cmd = 0xFF39
 
@@ -783,9 +753,8 @@ def fs_unconfirmed_document_count(self):
     Запрос количества ФД на которые нет квитанции.
     """
 
-    return self.protocol.command(
-        0xFF3F,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF3F](self.admin_password)
     )
 fs_unconfirmed_document_count.cmd = 0xFF3F
 
@@ -795,9 +764,8 @@ def fs_shift_params(self):
     Запрос параметров текущей смены.
     """
 
-    return self.protocol.command(
-        0xFF40,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF40](self.admin_password)
     )
 fs_shift_params.cmd = 0xFF40
 
@@ -807,9 +775,8 @@ def fs_begin_open_shift(self):
     Начать открытие смены.
     """
 
-    return self.protocol.command(
-        0xFF41,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF41](self.admin_password)
     )
 fs_begin_open_shift.cmd = 0xFF41
 
@@ -819,9 +786,8 @@ def fs_begin_close_shift(self):
     Начать закрытие смены.
     """
 
-    return self.protocol.command(
-        0xFF42,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF42](self.admin_password)
     )
 fs_begin_close_shift.cmd = 0xFF42
 
@@ -831,32 +797,32 @@ def fs_close_shift(self):
     Закрыть смену в ФН.
     """
 
-    return self.protocol.command(
-        0xFF43,
-        self.admin_password
+    return self.protocol.command_frame(
+        encoders.ENCODERS[0xFF43](self.admin_password)
     )
 fs_close_shift.cmd = 0xFF43
 
 
-def wait_printing(self):
+def wait_printing(self, timeout=None, paper_out=None):
     """
     Метод ожидания окончания печати документа.
-    """
 
-    while True:
-        time.sleep(self.WAIT_TIME)
+    Если последний ответ на запрос состояния сообщил об окончании печати и с тех пор
+    ничего не печаталось, метод возвращается без обмена с ККМ. Иначе состояние
+    запрашивается по истечении оценки времени печати с увеличивающимся интервалом
+    (см. pyshtrih.printing.PrintTracker).
 
-        state_ = self.state()
-        mode = state_[u'Режим ФР']
-        submode = state_[u'Подрежим ФР']
+    :type timeout: float
+    :param timeout: максимальное время ожидания, по умолчанию - PRINT_TIMEOUT;
+                    при PRINT_TIMEOUT = None ожидание не ограничено, в том числе
+                    при отсутствии бумаги
+    :param paper_out: callable объект, вызываемый с ответом state
+                      при обнаружении отсутствия бумаги
 
-        if mode.num == 12:
-            continue
+    :raises pyshtrih.excepts.PrintTimeoutError: печать не окончена за timeout
+    """
 
-        if submode.state == 0:
-            return
-        if submode.state == 3:
-            self.continue_print()
+    self.print_tracker.wait(self, self.PRINT_TIMEOUT if timeout is None else timeout, paper_out)
 print_string.depends = (wait_printing, )
 test_start.depends = (wait_printing, )
 cut.depends = (wait_printing, )
@@ -879,6 +845,13 @@ FUNCTIONS = {
     for name, function_ in inspect.getmembers(module_, inspect.isfunction)
     if function_.__module__ == module_.__name__
 }
+# имена методов устройства, соответствующих функциям модуля
+METHODS = frozenset(function_.__name__ for function_ in FUNCTIONS.values())
+
+# команды, не изменяющие состояние ККМ (не сбрасывают кеш состояния)
+READ_ONLY_COMMANDS = (
+    0x10, 0x11, 0x15, 0x1A, 0x1B, 0x1F, 0x2D, 0x2E, 0xFC, 0xFF01, 0xFF03, 0xFF0A, 0xFF39, 0xFF3F, 0xFF40
+)
 
 
 class SupportedCommands(type):
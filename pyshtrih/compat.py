@@ -10,15 +10,25 @@ LOCALE = locale.getpreferredencoding()
 
 
 if PY2:
+    import time
+    import Queue as queue
+
     unicode = unicode
     xrange = xrange
     reduce = reduce
+    # struct и binascii в Python 2 не принимают memoryview, поэтому срезы копируются
+    memoryview = bytearray
+    # монотонные часы появились в Python 3.3
+    monotonic = time.time
 else:
+    import queue
     import functools
+    from time import monotonic
 
     unicode = str
     xrange = range
     reduce = functools.reduce
+    memoryview = memoryview
 
 
 # Взято из six
@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+import errno
+import socket
+import struct
+import itertools
+import threading
+from concurrent import futures
+
+from . import codec, commands, excepts
+from .executor import DeviceExecutor
+from .compat import unicode, monotonic, queue
+
+
+# длина сообщения
+MESSAGE_HEADER = struct.Struct('<I')
+MAX_MESSAGE = 16 * 1024 * 1024
+
+# методы устройства, доступные клиентам: функции модуля commands
+METHODS = commands.METHODS
+# методы, одинаковые запросы которых разных клиентов объединяются
+READ_ONLY_METHODS = frozenset(
+    func.__name__ for cmd, func in commands.FUNCTIONS.items() if cmd in commands.READ_ONLY_COMMANDS
+)
+
+
+def failed(exc):
+    """
+    Завершенный с ошибкой concurrent.futures.Future.
+    """
+
+    future = futures.Future()
+    future.set_exception(exc)
+    return future
+
+
+def recv_exact(sock, size):
+    """
+    Чтение ровно size байт из сокета.
+
+    :rtype: bytearray
+    :return: прочитанные байты или None, если соединение закрыто
+    """
+
+    result = bytearray()
+    while len(result) < size:
+        chunk = sock.recv(size - len(result))
+        if not chunk:
+            return None
+        result.extend(chunk)
+    return result
+
+
+def send_message(sock, value):
+    data = codec.dumps(value)
+    sock.sendall(bytes(MESSAGE_HEADER.pack(len(data)) + data))
+
+
+def recv_message(sock):
+    """
+    Чтение сообщения (длина и значение в формате pyshtrih.codec).
+
+    :return: значение или None, если соединение закрыто
+    """
+
+    header = recv_exact(sock, MESSAGE_HEADER.size)
+    if header is None:
+        return None
+
+    size = MESSAGE_HEADER.unpack(bytes(header))[0]
+    if size > MAX_MESSAGE:
+        raise codec.CodecError(u'Слишком длинное сообщение: {} байт'.format(size))
+
+    data = recv_exact(sock, size)
+    if data is None:
+        return None
+    return codec.loads(data)
+
+
+class DeviceDaemon(object):
+    # пауза между неудачными попытками подключения к устройству, с
+    RECONNECT_DELAY = 1
+    # количество неотправленных ответов клиенту, при превышении которого клиент отключается
+    MAX_REPLIES = 1024
+
+    def __init__(self, device, path, mode=0o660):
+        """
+        Сервер, предоставляющий устройство нескольким процессам через Unix-сокет.
+
+        Порт ККМ открыт только сервером, команды всех клиентов выполняются последовательно
+        одним исполнителем (DeviceExecutor). При потере связи сервер переподключается
+        перед следующей командой, клиенты не переподключаются к порту сами.
+        Одинаковые запросы, не изменяющие состояние ККМ (READ_ONLY_METHODS),
+        поступившие от разных клиентов до получения ответа, выполняются один раз.
+
+        Клиентам доступны методы устройства из commands.FUNCTIONS
+        (см. DaemonClient). Сообщения кодируются pyshtrih.codec.
+
+            >>> daemon = DeviceDaemon(ShtrihM01F('/dev/ttyS0', 115200), '/run/pyshtrih.sock')
+            >>> daemon.serve_forever()
+
+        :type device: pyshtrih.device.Device
+        :param device: устройство
+        :type path: str
+        :param path: путь к Unix-сокету
+        :type mode: int
+        :param mode: права доступа к сокету
+        """
+
+        self.device = device
+        self.path = path
+        self.mode = mode
+
+        self.executor = None
+        self.sock = None
+        self.lock = threading.Lock()
+        # (метод, аргументы) -> concurrent.futures.Future выполняемого запроса
+        self.inflight = {}
+        self.clients = set()
+        self.closed = threading.Event()
+        # время, до которого попытки подключения не выполняются, и ошибка последней попытки
+        self.retry_at = 0
+        self.connect_error = None
+
+    def start(self):
+        """
+        Открыть сокет и начать прием клиентов в отдельном потоке.
+        """
+
+        self.remove_stale()
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, self.mode)
+        self.sock.listen(16)
+
+        self.executor = DeviceExecutor(self.device)
+        self.closed.clear()
+
+        thread = threading.Thread(target=self._accept, name=u'pyshtrih-daemon-{}'.format(self.path))
+        thread.daemon = True
+        thread.start()
+
+    def serve_forever(self):
+        """
+        Запустить сервер и ожидать его остановки.
+        """
+
+        self.start()
+        try:
+            while not self.closed.wait(1):
+                pass
+        finally:
+            self.stop()
+
+    def remove_stale(self):
+        """
+        Удаление сокета, оставшегося после аварийного завершения сервера.
+
+        :raises RuntimeError: сокет используется работающим сервером
+        """
+
+        if not os.path.exists(self.path):
+            return
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except socket.error as exc:
+            if exc.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+                raise
+            os.remove(self.path)
+        else:
+            raise RuntimeError(u'Сокет {} уже используется'.format(self.path))
+        finally:
+            probe.close()
+
+    def _accept(self):
+        while not self.closed.is_set():
+            try:
+                client, _ = self.sock.accept()
+            except socket.error:
+                break
+
+            with self.lock:
+                self.clients.add(client)
+            thread = threading.Thread(target=self._serve_client, args=(client, ), name=u'pyshtrih-daemon-client')
+            thread.daemon = True
+            thread.start()
+
+    def _serve_client(self, client):
+        # ответы отправляются отдельным потоком: клиент, не читающий ответы,
+        # не должен блокировать поток устройства
+        replies = queue.Queue(self.MAX_REPLIES)
+
+        def drop():
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+        def reply(num, future):
+            try:
+                replies.put_nowait((num, future))
+            except queue.Full:
+                # клиент не читает ответы - отключаем его
+                drop()
+
+        sender = threading.Thread(target=self._send_replies, args=(client, replies, drop),
+                                  name=u'pyshtrih-daemon-sender')
+        sender.daemon = True
+        sender.start()
+
+        try:
+            while not self.closed.is_set():
+                message = recv_message(client)
+                if message is None:
+                    break
+
+                num, method, args, kwargs = message
+                future = self.submit(method, tuple(args), kwargs)
+                future.add_done_callback(lambda f, n=num: reply(n, f))
+        except (socket.error, codec.CodecError, ValueError, TypeError):
+            pass
+        finally:
+            with self.lock:
+                self.clients.discard(client)
+            drop()
+            replies.put(None)
+            sender.join()
+            client.close()
+
+    @staticmethod
+    def _send_replies(client, replies, drop):
+        while True:
+            item = replies.get()
+            if item is None:
+                return
+
+            num, future = item
+            try:
+                value = (num, True, future.result())
+            except Exception as exc:
+                value = (num, False, exc)
+
+            try:
+                try:
+                    send_message(client, value)
+                except codec.CodecError as exc:
+                    send_message(client, (num, False, excepts.ProtocolError(unicode(exc))))
+            except socket.error:
+                drop()
+
+    def call(self, method, args, kwargs):
+        """
+        Выполнение метода устройства в потоке исполнителя (с переподключением при потере связи).
+
+        После неудачного подключения следующая попытка выполняется не ранее чем через
+        RECONNECT_DELAY секунд, до этого запросы завершаются NoConnectionError
+        с ошибкой последней попытки в качестве причины.
+        """
+
+        if not self.device.connected:
+            if monotonic() < self.retry_at:
+                error = excepts.NoConnectionError(u'Нет связи с ККМ ({})'.format(self.connect_error))
+                error.__cause__ = self.connect_error
+                raise error
+            try:
+                self.device.connect()
+            except Exception as exc:
+                self.device.disconnect()
+                self.retry_at = monotonic() + self.RECONNECT_DELAY
+                self.connect_error = exc
+                raise
+
+        try:
+            return getattr(self.device, method)(*args, **kwargs)
+        except excepts.NoConnectionError:
+            self.device.disconnect()
+            raise
+
+    def enqueue(self, method, args, kwargs):
+        try:
+            return self.executor.submit(self.call, method, args, kwargs)
+        except RuntimeError as exc:
+            # сервер остановлен
+            return failed(excepts.ProtocolError(unicode(exc)))
+        except queue.Full:
+            return failed(excepts.ProtocolError(u'Очередь команд устройства заполнена'))
+
+    def submit(self, method, args, kwargs):
+        """
+        Поставить вызов метода устройства в очередь, объединяя одинаковые запросы чтения.
+
+        :rtype: concurrent.futures.Future
+        """
+
+        if method not in METHODS or not hasattr(self.device, method):
+            return failed(excepts.ProtocolError(u'Метод {} не поддерживается'.format(method)))
+
+        if method not in READ_ONLY_METHODS:
+            return self.enqueue(method, args, kwargs)
+
+        key = bytes(codec.dumps((method, args, kwargs)))
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                return future
+
+            future = self.enqueue(method, args, kwargs)
+            if future.done():
+                return future
+            self.inflight[key] = future
+
+        def forget(_):
+            with self.lock:
+                if self.inflight.get(key) is future:
+                    del self.inflight[key]
+
+        future.add_done_callback(forget)
+        return future
+
+    def stop(self):
+        """
+        Остановить сервер, закрыть соединения клиентов и отключиться от устройства.
+        """
+
+        if self.closed.is_set():
+            return
+        self.closed.set()
+
+        if self.sock is not None:
+            self.sock.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+        if self.executor is not None:
+            self.executor.submit(self.device.disconnect)
+            self.executor.shutdown()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class DaemonClient(object):
+    def __init__(self, path, timeout=None):
+        """
+        Клиент DeviceDaemon: методы устройства вызываются через сервер.
+
+            >>> device = DaemonClient('/run/pyshtrih.sock')
+            >>> device.state()[u'Режим ФР']
+
+        Клиент может использоваться несколькими потоками одновременно.
+
+        :type path: str
+        :param path: путь к Unix-сокету сервера
+        :type timeout: float
+        :param timeout: время ожидания ответа сервера, None - без ограничения
+        """
+
+        self.path = path
+        self.timeout = timeout
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        # номер запроса -> concurrent.futures.Future
+        self.pending = {}
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._reader, name=u'pyshtrih-client-{}'.format(path))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _reader(self):
+        try:
+            while True:
+                message = recv_message(self.sock)
+                if message is None:
+                    break
+
+                num, ok, value = message
+                with self.lock:
+                    future = self.pending.pop(num, None)
+                if future is None:
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+        except (socket.error, codec.CodecError, ValueError, TypeError):
+            pass
+
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(excepts.NoConnectionError(u'Соединение с сервером {} закрыто'.format(self.path)))
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Отправить вызов метода устройства.
+
+        :type method: str
+        :param method: имя метода (функции модуля commands)
+
+        :rtype: concurrent.futures.Future
+        """
+
+        future = futures.Future()
+        future.set_running_or_notify_cancel()
+        with self.lock:
+            if self.closed:
+                raise excepts.NoConnectionError(u'Соединение с сервером {} закрыто'.format(self.path))
+            num = next(self.counter)
+            self.pending[num] = future
+            try:
+                send_message(self.sock, (num, method, args, kwargs))
+            except Exception:
+                del self.pending[num]
+                raise
+        return future
+
+    def call(self, method, *args, **kwargs):
+        """
+        Вызов метода устройства с ожиданием результата.
+        """
+
+        return self.submit(method, *args, **kwargs).result(self.timeout)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getattr__(self, item):
+        if item not in METHODS:
+            raise AttributeError(item)
+
+        def method(*args, **kwargs):
+            return self.call(item, *args, **kwargs)
+
+        method.__name__ = item
+        return method
@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 
 
-from . import protocol, commands, misc, compat
-from .handlers import commands as hc, functions as hf
+from . import protocol, commands, printing, status, metadata as md, misc, compat
+from .handlers import commands as hc
 
 
 class Device(compat.with_metaclass(commands.SupportedCommands)):
     SERIAL_TIMEOUT = 3
+    # минимальный интервал между запросами состояния при ожидании окончания печати, с
     WAIT_TIME = 0.01
+    # максимальное время ожидания окончания печати (в т.ч. замены бумаги), с; None - без ограничения
+    PRINT_TIMEOUT = 300
+    # время жизни кешированного ответа state/fs_state, 0 - без кеширования
+    STATUS_TTL = 0
 
     DEFAULT_CASHIER_PASSWORD = 1
     DEFAULT_ADMIN_PASSWORD = 30
@@ -17,7 +22,9 @@ class Device(compat.with_metaclass(commands.SupportedCommands)):
     TAPES = misc.T_TAPES(False, False, False)
     FS = False
 
-    def __init__(self, port='/dev/ttyS0', baudrate=9600, timeout=None, password=None, admin_password=None):
+    def __init__(self, port='/dev/ttyS0', baudrate=9600, timeout=None, password=None, admin_password=None,
+                 session=False, transport=None, lazy=False, journal=None, metrics=None, metadata=None,
+                 status_ttl=None):
         """
         :type port: str
         :param port: порт взаимодействия с устройством
@@ -29,20 +36,55 @@ class Device(compat.with_metaclass(commands.SupportedCommands)):
         :param password: пароль кассира
         :type admin_password: int
         :param admin_password: пароль администратора
+        :type session: bool
+        :param session: сессионный режим (проверка связи только при подключении и после ошибки обмена)
+        :type transport: pyshtrih.transport.Transport
+        :param transport: транспорт взаимодействия с устройством (TCP, loopback и т.п.),
+                          по умолчанию - последовательный порт port
+        :type lazy: bool
+        :param lazy: разбирать поля ответов при первом обращении (см. pyshtrih.protocol.LazyResponse)
+        :type journal: pyshtrih.journal.Journal
+        :param journal: журнал обмена для восстановления чека после сбоя (см. pyshtrih.journal.recover)
+        :type metrics: pyshtrih.metrics.Metrics
+        :param metrics: метрики обмена (см. pyshtrih.metrics.Metrics.snapshot)
+        :type metadata: pyshtrih.metadata.MetadataCache
+        :param metadata: постоянный кеш неизменяемых сведений об устройстве
+        :type status_ttl: float
+        :param status_ttl: время жизни кешированного ответа state/fs_state, с
+                           (по умолчанию - STATUS_TTL, см. pyshtrih.status.StatusCache)
         """
 
         self.protocol = protocol.Protocol(
             port,
             baudrate,
             timeout or self.SERIAL_TIMEOUT,
-            fs=self.FS
+            fs=self.FS,
+            session=session,
+            transport=transport,
+            lazy=lazy,
+            journal=journal,
+            metrics=metrics
         )
 
+        self.print_tracker = printing.PrintTracker(baudrate, poll_time=self.WAIT_TIME)
+        self.protocol.listeners.append(self.print_tracker)
+
+        self.status = status.StatusCache(
+            self.STATUS_TTL if status_ttl is None else status_ttl, commands.READ_ONLY_COMMANDS
+        )
+        self.protocol.senders.append(self.status.sent)
+
         self.password = password or self.DEFAULT_CASHIER_PASSWORD
         self.admin_password = admin_password or self.DEFAULT_ADMIN_PASSWORD
 
         self.dev_info = None
 
+        self.metadata = metadata
+        # запись кеша для подключенного устройства
+        self.metadata_entry = None
+        if metadata is not None:
+            self.protocol.listeners.append(self.verify_metadata)
+
     @property
     def port(self):
         return self.protocol.port
@@ -55,22 +97,22 @@ class Device(compat.with_metaclass(commands.SupportedCommands)):
 
     @property
     def baudrate(self):
-        return self.protocol.serial.baudrate
+        return self.protocol.transport.baudrate
 
     @baudrate.setter
     def baudrate(self, baudrate):
-        self.protocol.serial.baudrate = baudrate
+        self.protocol.transport.baudrate = baudrate
+        self.print_tracker.baudrate = baudrate
         if self.connected:
             self.connect(force=True)
 
     @property
     def timeout(self):
-        return self.protocol.serial.timeout
+        return self.protocol.transport.timeout
 
     @timeout.setter
     def timeout(self, timeout):
-        self.protocol.serial.timeout = timeout
-        self.protocol.serial.write_timeout = timeout
+        self.protocol.transport.timeout = timeout
 
     @property
     def connected(self):
@@ -92,10 +134,69 @@ class Device(compat.with_metaclass(commands.SupportedCommands)):
 
         return self.dev_info[u'Название устройства'] if self.dev_info else u''
 
+    @property
+    def info(self):
+        """
+        Неизменяемые сведения об устройстве: версии, сборки и даты ПО, заводской номер, ИНН
+        (см. pyshtrih.metadata.INFO_FIELDS). Без кеша сведений запрашиваются у ККМ.
+
+        :rtype: dict
+        """
+
+        if self.metadata_entry is not None:
+            return self.metadata_entry.info
+
+        full_state = self.full_state()
+        return {name: full_state[name] for name in md.INFO_FIELDS}
+
+    def verify_metadata(self, cmd, response):
+        """
+        Проверка соответствия записи кеша сведений ответу команды 0x11 "Запрос состояния ФР".
+
+        Если к порту подключено другое устройство или обновлено ПО, сведения
+        (dev_info, запись кеша, контекст разбора ответов) сразу запрашиваются у ККМ заново.
+        """
+
+        entry = self.metadata_entry
+        if cmd == 0x11 and entry is not None and not entry.matches(response):
+            self.metadata.forget(self.port)
+            self.metadata_entry = None
+            self.identify(response)
+
+    def identify(self, full_state=None):
+        """
+        Запрос сведений об устройстве (команда 0xFC) и сохранение их в кеш сведений.
+
+        :type full_state: pyshtrih.protocol.Response
+        :param full_state: ответ команды 0x11 "Запрос состояния ФР" (если уже получен)
+        """
+
+        self.dev_info = self.model()
+        entry = None
+        if self.metadata is not None and hasattr(self, 'full_state'):
+            entry = self.metadata.store(self.port, self.dev_info, full_state or self.full_state())
+        self.metadata_entry = entry
+        self.update_context()
+
+    def update_context(self):
+        """
+        Установка контекста разбора ответов по сведениям об устройстве.
+        """
+
+        entry = self.metadata_entry
+        self.protocol.set_context(self.protocol.context._replace(
+            model=self.dev_info[u'Модель устройства'],
+            firmware=entry.info[u'Сборка ПО ФР'] if entry is not None else None
+        ))
+
     def connect(self, force=False):
         """
         Подключиться к ККМ.
 
+        Если устройство, подключавшееся к порту, есть в кеше сведений, вместо запросов
+        0xFC и 0x11 выполняется один запрос 0x11 для сверки с записью кеша
+        (см. verify_metadata).
+
         :type force: bool
         :param force: отключиться перед подключением
         """
@@ -106,8 +207,16 @@ class Device(compat.with_metaclass(commands.SupportedCommands)):
         self.protocol.connect()
 
         if hasattr(self, 'model'):
-            self.dev_info = self.model()
-            hf.handle_fr_flags.model = self.dev_info[u'Модель устройства']
+            entry = self.metadata.lookup(self.port) if self.metadata is not None else None
+            if entry is None:
+                self.identify()
+                return
+
+            self.dev_info = entry.model
+            self.metadata_entry = entry
+            self.update_context()
+            if hasattr(self, 'full_state'):
+                self.full_state()
 
     def disconnect(self):
         """
@@ -0,0 +1,949 @@
+# -*- coding: utf-8 -*-
+
+"""
+Эмулятор ККМ семейства "Штрих".
+
+Эмулятор реализует протокол обмена (ENQ/ACK/NAK, кадры STX/длина/данные/LRC)
+и отвечает на все команды из handlers.commands.COMMANDS ответами,
+разметка которых соответствует HANDLERS. Состояние (режим/подрежим, смена,
+открытый чек, регистры, таблицы, задержки печати) моделируется упрощенно.
+
+Эмулятор можно подключить через псевдотерминал, TCP или loopback транспорт:
+
+    $ python -m pyshtrih.emulator
+    /dev/pts/3
+
+    >>> device = pyshtrih.ShtrihM01F('/dev/pts/3', 115200)
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import struct
+import socket
+import select
+import datetime
+import threading
+
+from . import misc, transport
+from .protocol import STX, ENQ, ACK, NAK
+
+
+class EmulatorError(Exception):
+    def __init__(self, code):
+        """
+        Ошибка выполнения команды эмулятором.
+
+        :type code: int
+        :param code: код ошибки (см. pyshtrih.excepts.Error.codes)
+        """
+
+        super(EmulatorError, self).__init__(code)
+        self.code = code
+
+
+def _money(arg):
+    return misc.bytes_to_int(arg)
+
+
+def _pack_money(value, size=5):
+    return bytearray(misc.int_to_bytes(value, size))
+
+
+class Emulator(object):
+    # время приема байта, после которого незавершенный кадр отбрасывается
+    BYTE_TIMEOUT = 0.5
+    # время печати одной строки
+    PRINT_LINE_TIME = 0.02
+    # количество строк, печатаемых командами
+    PRINT_LINES = {
+        0x17: 1,
+        0x25: 4,
+        0x40: 30,
+        0x41: 40,
+        0x50: 8,
+        0x51: 8,
+        0x80: 2,
+        0x82: 2,
+        0x85: 6,
+        0x86: 1,
+        0x87: 1,
+        0x88: 3,
+        0x8C: 12,
+        0x8D: 4,
+        0xC1: 8,
+        0xC2: 6
+    }
+    # команды, которые не выполняются, пока идет печать (в драйвере перед ними вызывается wait_printing)
+    WAIT_PRINTING = (0x17, 0x19, 0x25, 0x29, 0x2B, 0x40, 0x41, 0x50, 0x51, 0x88, 0x8C, 0x8D, 0xA0, 0xA2, 0xC1, 0xC2)
+    # отчеты (подрежим 4 во время печати)
+    REPORTS = (0x40, 0x41)
+    # команды без пароля
+    NOPASS = (0x16, 0xFC)
+
+    CASH_REGISTER = 241
+    SALES_REGISTER = 121
+    CHECKS_REGISTER = 144
+
+    TABLES = {
+        1: (u'Тип и режим кассы', 1, (
+            (u'Номер кассы в магазине', int, 1, 1, 99, 1),
+            (u'Автоматическое обнуление денежной наличности', int, 1, 0, 1, 0),
+            (u'Звуковой сигнал', int, 1, 0, 1, 1),
+        )),
+        2: (u'Пароли кассиров и администраторов', 30, (
+            (u'Пароль', int, 4, 0, 99999999, None),
+            (u'Имя оператора', str, 21, 0, 0, None),
+        )),
+        4: (u'Текст в чеке', 4, (
+            (u'Строка', str, 40, 0, 0, u''),
+        ))
+    }
+
+    def __init__(self, name=u'ШТРИХ-М-01Ф', model=19, fs=True, serial_number=12345678, inn=7700000000,
+                 baudrate=None, print_line_time=None):
+        """
+        :type name: unicode
+        :param name: название устройства (ответ команды 0xFC)
+        :type model: int
+        :param model: код модели устройства
+        :type fs: bool
+        :param fs: признак наличия ФН
+        :type serial_number: int
+        :param serial_number: заводской номер
+        :type inn: int
+        :param inn: ИНН
+        :type baudrate: int
+        :param baudrate: скорость линии для имитации времени передачи, None - без задержек
+        :type print_line_time: float
+        :param print_line_time: время печати одной строки
+        """
+
+        self.name = name
+        self.model = model
+        self.fs = fs
+        self.serial_number = serial_number
+        self.inn = inn
+        self.baudrate = baudrate
+        self.print_line_time = self.PRINT_LINE_TIME if print_line_time is None else print_line_time
+
+        self.lock = threading.RLock()
+        self.rx = bytearray()
+        self.rx_time = 0
+        self.pending = None
+        self.stopped = threading.Event()
+        self.threads = []
+
+        self.reset()
+
+        self.commands = {
+            0x10: self.state,
+            0x11: self.full_state,
+            0x13: self.operator_only,
+            0x14: self.set_exchange_params,
+            0x15: self.read_exchange_params,
+            0x16: self.reset_settings,
+            0x17: self.printing,
+            0x19: self.test_start,
+            0x1A: self.request_monetary_register,
+            0x1B: self.request_operational_register,
+            0x1E: self.write_table,
+            0x1F: self.read_table,
+            0x21: self.set_time,
+            0x22: self.set_date,
+            0x23: self.confirm_date,
+            0x25: self.printing,
+            0x28: self.operator_only,
+            0x29: self.feed_paper,
+            0x2B: self.test_stop,
+            0x2D: self.request_table_structure,
+            0x2E: self.request_field_structure,
+            0x40: self.x_report,
+            0x41: self.z_report,
+            0x50: self.income,
+            0x51: self.outcome,
+            0x80: self.sale,
+            0x82: self.sale,
+            0x85: self.close_check,
+            0x86: self.discount,
+            0x87: self.discount,
+            0x88: self.cancel_check,
+            0x8C: self.repeat,
+            0x8D: self.open_check,
+            0xA0: self.empty,
+            0xA2: self.empty,
+            0xB0: self.continue_print,
+            0xC0: self.operator_only,
+            0xC1: self.printing,
+            0xC2: self.printing,
+            0xE0: self.open_shift,
+            0xFC: self.device_model,
+            0xFF01: self.fs_state,
+            0xFF03: self.fs_expiration_time,
+            0xFF08: self.fs_cancel_document,
+            0xFF0A: self.fs_find_document_by_num,
+            0xFF0B: self.fs_open_shift,
+            0xFF0C: self.empty,
+            0xFF35: self.empty,
+            0xFF36: self.fs_correction_check,
+            0xFF38: self.fs_calculation_state_report,
+            0xFF39: self.fs_info_exchange,
+            0xFF3F: self.fs_unconfirmed_document_count,
+            0xFF40: self.fs_shift_params,
+            0xFF41: self.empty,
+            0xFF42: self.empty,
+            0xFF43: self.fs_close_shift
+        }
+
+    def reset(self):
+        """
+        Сброс состояния устройства к заводскому (технологическое обнуление).
+        """
+
+        self.exchange = {0: (6, 100)}
+        self.clock_offset = datetime.timedelta()
+        self.paper = True
+        self.printing_until = 0
+        self.printing_report = False
+        self.wait_continue = False
+
+        self.mode = 4
+        self.mode_before = 4
+        self.date_pending = None
+        self.check_type = None
+        self.check_ops = 0
+        self.check_total = 0
+        self.shift_num = 0
+        self.doc_num = 0
+        self.fd_num = 0
+        self.last_document = False
+        self.unconfirmed = 0
+
+        self.monetary = {}
+        self.operational = {}
+        self.table_values = {}
+        for table, (_, rows, fields) in self.TABLES.items():
+            for row in range(1, rows + 1):
+                for field, (_, _, _, _, _, default) in enumerate(fields, 1):
+                    self.table_values[(table, row, field)] = default
+        for row in range(1, 31):
+            self.table_values[(2, row, 1)] = row
+            self.table_values[(2, row, 2)] = u'Администратор' if row == 30 else u'Кассир {}'.format(row)
+
+    # обмен
+
+    def feed(self, data):
+        """
+        Обработка байт, полученных от драйвера.
+
+        :type data: bytes or bytearray
+        :param data: полученные байты
+
+        :rtype: bytes
+        :return: байты ответа
+        """
+
+        with self.lock:
+            now = time.time()
+            if self.rx and now - self.rx_time > self.BYTE_TIMEOUT:
+                del self.rx[:]
+            self.rx_time = now
+            self.rx.extend(data)
+
+            rx = self.rx
+            out = bytearray()
+            while rx:
+                byte = rx[0]
+                if byte == ENQ[0]:
+                    del rx[:1]
+                    out.extend(ACK + self.pending if self.pending else NAK)
+                elif byte == ACK[0]:
+                    del rx[:1]
+                    self.pending = None
+                elif byte == NAK[0]:
+                    # ответ будет повторен по запросу ENQ
+                    del rx[:1]
+                elif byte == STX[0]:
+                    if len(rx) < 2 or len(rx) < rx[1] + 3:
+                        break
+
+                    end = rx[1] + 2
+                    frame = rx[:end + 1]
+                    del rx[:end + 1]
+
+                    if misc.lrc(frame[1:end]) != frame[end]:
+                        out.extend(NAK)
+                        continue
+
+                    payload = self.execute(frame[2:end])
+                    buff = misc.bytearray_concat(misc.CAST_SIZE['1'](len(payload)), payload)
+                    self.pending = misc.bytearray_concat(STX, buff, misc.CAST_SIZE['1'](misc.lrc(buff)))
+                    out.extend(ACK + self.pending)
+                else:
+                    del rx[:1]
+
+            return bytes(out)
+
+    def execute(self, payload):
+        """
+        Выполнение команды.
+
+        :type payload: bytearray
+        :param payload: код команды и ее параметры
+
+        :rtype: bytearray
+        :return: код команды, код ошибки и данные ответа
+        """
+
+        cmd_bytes = payload[:2 if payload[:1] == b'\xff' else 1]
+        try:
+            if not payload:
+                # кадр без команды
+                raise EmulatorError(0x37)
+
+            cmd = misc.bytes_to_int(reversed(cmd_bytes))
+            params = payload[len(cmd_bytes):]
+
+            handler = self.commands.get(cmd)
+            if handler is None:
+                raise EmulatorError(0x37)
+
+            operator = None
+            if cmd not in self.NOPASS:
+                if len(params) < 4:
+                    raise EmulatorError(0x33)
+                operator = self.operator(misc.UNCAST_SIZE['4'](params[:4]))
+                params = params[4:]
+
+            if cmd in self.WAIT_PRINTING and self.busy:
+                raise EmulatorError(0x50)
+            if cmd in self.PRINT_LINES and not self.paper:
+                raise EmulatorError(0x6B)
+
+            body = handler(cmd, operator, params)
+        except EmulatorError as exc:
+            return misc.bytearray_concat(cmd_bytes, misc.CAST_SIZE['1'](exc.code))
+        except (struct.error, IndexError, ValueError):
+            return misc.bytearray_concat(cmd_bytes, misc.CAST_SIZE['1'](0x33))
+        except Exception:
+            # ошибка эмулятора не должна завершать поток обслуживания
+            return misc.bytearray_concat(cmd_bytes, misc.CAST_SIZE['1'](0x39))
+
+        if cmd in self.PRINT_LINES:
+            self.print_lines(self.PRINT_LINES[cmd], cmd in self.REPORTS)
+
+        return misc.bytearray_concat(cmd_bytes, misc.NULL, body or bytearray())
+
+    def delay(self, size):
+        """
+        Имитация времени передачи size байт по линии.
+        """
+
+        if self.baudrate:
+            time.sleep(size * 10.0 / self.baudrate)
+
+    def run(self, read, write):
+        """
+        Цикл обслуживания одного соединения.
+
+        :param read: функция чтения, возвращающая байты, пустую строку по таймауту или None при закрытии
+        :param write: функция записи
+        """
+
+        while not self.stopped.is_set():
+            data = read()
+            if data is None:
+                return
+            if not data:
+                continue
+
+            reply = self.feed(data)
+            if reply:
+                self.delay(len(data) + len(reply))
+                write(reply)
+
+    def start(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def stop(self):
+        """
+        Остановка всех обслуживающих потоков.
+        """
+
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        del self.threads[:]
+        self.stopped.clear()
+
+    def loopback(self, timeout=None):
+        """
+        Обслуживание через loopback транспорт.
+
+        :type timeout: float
+        :param timeout: таймаут транспорта драйвера
+
+        :rtype: pyshtrih.transport.LoopbackTransport
+        :return: транспорт для передачи в Device
+        """
+
+        client, server = transport.LoopbackTransport.pair(timeout=timeout, baudrate=self.baudrate)
+        server.timeout = 0.1
+        server.open()
+
+        def read():
+            return server.read(max(1, server.in_waiting))
+
+        self.start(self.run, read, server.write)
+        return client
+
+    def pty(self):
+        """
+        Обслуживание через псевдотерминал.
+
+        :rtype: str
+        :return: путь к подчиненному терминалу (например, /dev/pts/3)
+        """
+
+        import tty
+
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        path = os.ttyname(slave)
+
+        def read():
+            if select.select((master, ), (), (), 0.1)[0]:
+                try:
+                    return os.read(master, 4096)
+                except OSError:
+                    # терминал закрыт клиентом, ждем переподключения
+                    time.sleep(0.1)
+            return bytes()
+
+        def write(data):
+            os.write(master, data)
+
+        def serve():
+            try:
+                self.run(read, write)
+            finally:
+                os.close(master)
+                os.close(slave)
+
+        self.start(serve)
+        return path
+
+    def tcp(self, host='127.0.0.1', port=0):
+        """
+        Обслуживание через TCP.
+
+        :rtype: tuple
+        :return: адрес (host, port)
+        """
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen(1)
+        server.settimeout(0.1)
+
+        def serve():
+            try:
+                while not self.stopped.is_set():
+                    try:
+                        conn, _ = server.accept()
+                    except socket.timeout:
+                        continue
+
+                    conn.settimeout(0.1)
+
+                    def read():
+                        try:
+                            return conn.recv(4096) or None
+                        except socket.timeout:
+                            return bytes()
+
+                    try:
+                        self.run(read, conn.sendall)
+                    except socket.error:
+                        pass
+                    finally:
+                        conn.close()
+            finally:
+                server.close()
+
+        self.start(serve)
+        return server.getsockname()
+
+    # состояние
+
+    @property
+    def now(self):
+        return datetime.datetime.now() + self.clock_offset
+
+    @property
+    def busy(self):
+        return time.time() < self.printing_until
+
+    @property
+    def submode(self):
+        if self.wait_continue:
+            return 3
+        if not self.paper:
+            return 2 if self.busy else 1
+        if self.busy:
+            return 4 if self.printing_report else 5
+        return 0
+
+    @property
+    def flags(self):
+        # рычаг термоголовки опущен, 2 знака после запятой, датчики бумаги по состоянию
+        flags = (1 << 9) | (1 << 4)
+        if self.paper:
+            flags |= (1 << 7) | (1 << 1)
+        return flags
+
+    @property
+    def mode_code(self):
+        if self.mode == 8:
+            return 8 | (self.check_type << 4)
+        return self.mode
+
+    def operator(self, password):
+        for row in range(1, 31):
+            if self.table_values[(2, row, 1)] == password:
+                return row
+        raise EmulatorError(0x4F)
+
+    def print_lines(self, count, report=False):
+        if not self.paper:
+            raise EmulatorError(0x6B)
+        start = max(time.time(), self.printing_until)
+        self.printing_until = start + count * self.print_line_time
+        self.printing_report = report
+
+    def require_shift(self):
+        if self.mode == 4:
+            self.open_shift_()
+        if self.mode not in (2, 3, 8):
+            raise EmulatorError(0x73)
+
+    def open_shift_(self):
+        self.shift_num += 1
+        self.fd_num += 1
+        self.mode = 2
+
+    def require_check(self):
+        if self.mode != 8:
+            raise EmulatorError(0x55)
+
+    def close_document(self):
+        self.doc_num += 1
+        self.fd_num += 1
+        self.unconfirmed += 1
+        self.last_document = True
+
+    def add_monetary(self, num, value):
+        self.monetary[num] = self.monetary.get(num, 0) + value
+
+    def add_operational(self, num, value=1):
+        self.operational[num] = self.operational.get(num, 0) + value
+
+    # команды
+
+    def empty(self, cmd, operator, params):
+        return bytearray()
+
+    def operator_only(self, cmd, operator, params):
+        return misc.CAST_SIZE['1'](operator)
+
+    printing = operator_only
+
+    def state(self, cmd, operator, params):
+        return misc.bytearray_concat(
+            misc.CAST_SIZE['1'](operator),
+            misc.CAST_SIZE['2'](self.flags),
+            misc.CAST_SIZE['11'](self.mode_code, self.submode),
+            # количество операций в чеке разнесено по байтам 6 и 11 (см. HANDLERS[0x10])
+            misc.CAST_SIZE['1'](self.check_ops >> 8),
+            misc.CAST_SIZE['1111'](170, 200, 0, 0),
+            misc.CAST_SIZE['1'](self.check_ops & 0xFF),
+            bytearray(3)
+        )
+
+    def full_state(self, cmd, operator, params):
+        now = self.now
+        return misc.bytearray_concat(
+            misc.CAST_SIZE['1'](operator),
+            bytearray(b'A4'),
+            misc.CAST_SIZE['2'](1),
+            misc.CAST_SIZE['111'](1, 1, 18),
+            misc.CAST_SIZE['1'](self.table_values[(1, 1, 1)]),
+            misc.CAST_SIZE['2'](self.doc_num),
+            misc.CAST_SIZE['2'](self.flags),
+            misc.CAST_SIZE['11'](self.mode_code, self.submode),
+            misc.CAST_SIZE['1'](0),
+            bytearray(b'A4'),
+            misc.CAST_SIZE['2'](1),
+            misc.CAST_SIZE['111'](1, 1, 18),
+            misc.CAST_SIZE['111'](now.day, now.month, now.year - 2000),
+            misc.CAST_SIZE['111'](now.hour, now.minute, now.second),
+            misc.CAST_SIZE['1'](0),
+            misc.CAST_SIZE['4'](self.serial_number),
+            misc.CAST_SIZE['2'](max(self.shift_num - (self.mode != 4), 0)),
+            misc.CAST_SIZE['2'](2100 - self.shift_num),
+            misc.CAST_SIZE['11'](1, 3),
+            bytearray(misc.int_to_bytes(self.inn, 6)[::-1])
+        )
+
+    def set_exchange_params(self, cmd, operator, params):
+        port, code, timeout = misc.UNCAST_SIZE['111'](params[:3])
+        self.exchange[port] = (code, timeout)
+
+    def read_exchange_params(self, cmd, operator, params):
+        code, timeout = self.exchange.get(misc.UNCAST_SIZE['1'](params[:1]), (6, 100))
+        return misc.CAST_SIZE['11'](code, timeout)
+
+    def reset_settings(self, cmd, operator, params):
+        self.reset()
+
+    def test_start(self, cmd, operator, params):
+        if self.mode != 10:
+            self.mode_before = self.mode
+        self.mode = 10
+        return misc.CAST_SIZE['1'](operator)
+
+    def test_stop(self, cmd, operator, params):
+        if self.mode == 10:
+            self.mode = self.mode_before
+        return misc.CAST_SIZE['1'](operator)
+
+    def request_monetary_register(self, cmd, operator, params):
+        num = misc.UNCAST_SIZE['1'](params[:1])
+        return misc.bytearray_concat(misc.CAST_SIZE['1'](operator), _pack_money(self.monetary.get(num, 0), 6))
+
+    def request_operational_register(self, cmd, operator, params):
+        num = misc.UNCAST_SIZE['1'](params[:1])
+        return misc.bytearray_concat(misc.CAST_SIZE['1'](operator), misc.CAST_SIZE['2'](self.operational.get(num, 0)))
+
+    def table_field(self, table, field):
+        try:
+            _, rows, fields = self.TABLES[table]
+        except KeyError:
+            raise EmulatorError(0x5D)
+        if not 1 <= field <= len(fields):
+            raise EmulatorError(0x33)
+        return rows, fields[field - 1]
+
+    def write_table(self, cmd, operator, params):
+        table, row, field = misc.UNCAST_SIZE['121'](params[:4])
+        rows, (_, type_, size, min_, max_, _) = self.table_field(table, field)
+        if not 1 <= row <= rows:
+            raise EmulatorError(0x33)
+
+        value = params[4:4 + size]
+        if type_ is int:
+            value = misc.bytes_to_int(value)
+            if not min_ <= value <= max_:
+                raise EmulatorError(0x33)
+        else:
+            value = misc.decode(misc.bytearray_strip(bytearray(value)))
+        self.table_values[(table, row, field)] = value
+
+    def read_table(self, cmd, operator, params):
+        table, row, field = misc.UNCAST_SIZE['121'](params[:4])
+        rows, (_, type_, size, _, _, _) = self.table_field(table, field)
+        if not 1 <= row <= rows:
+            raise EmulatorError(0x33)
+
+        value = self.table_values[(table, row, field)]
+        if type_ is int:
+            return bytearray(misc.int_to_bytes(value, size))
+        return bytearray(misc.encode(value)[:size].ljust(size, b'\x00'))
+
+    def request_table_structure(self, cmd, operator, params):
+        table = misc.UNCAST_SIZE['1'](params[:1])
+        try:
+            name, rows, fields = self.TABLES[table]
+        except KeyError:
+            raise EmulatorError(0x5D)
+        return misc.bytearray_concat(
+            misc.prepare_string(name, 40), misc.CAST_SIZE['2'](rows), misc.CAST_SIZE['1'](len(fields))
+        )
+
+    def request_field_structure(self, cmd, operator, params):
+        table, field = misc.UNCAST_SIZE['11'](params[:2])
+        _, (name, type_, size, min_, max_, _) = self.table_field(table, field)
+        return misc.bytearray_concat(
+            misc.prepare_string(name, 40),
+            misc.CAST_SIZE['11'](0 if type_ is int else 1, size),
+            bytearray(misc.int_to_bytes(min_, size)),
+            bytearray(misc.int_to_bytes(max_, size))
+        )
+
+    def set_time(self, cmd, operator, params):
+        h, m, s = misc.UNCAST_SIZE['111'](params[:3])
+        now = self.now
+        self.clock_offset += now.replace(hour=h, minute=m, second=s) - now
+
+    def set_date(self, cmd, operator, params):
+        d, m, y = misc.UNCAST_SIZE['111'](params[:3])
+        self.date_pending = datetime.date(2000 + y, m, d)
+        if self.mode != 6:
+            self.mode_before = self.mode
+        self.mode = 6
+
+    def confirm_date(self, cmd, operator, params):
+        d, m, y = misc.UNCAST_SIZE['111'](params[:3])
+        if self.mode != 6 or datetime.date(2000 + y, m, d) != self.date_pending:
+            raise EmulatorError(0x7C)
+        now = self.now
+        self.clock_offset += now.replace(year=2000 + y, month=m, day=d) - now
+        self.mode = self.mode_before
+
+    def feed_paper(self, cmd, operator, params):
+        _, count = misc.UNCAST_SIZE['11'](params[:2])
+        self.print_lines(count)
+        return misc.CAST_SIZE['1'](operator)
+
+    def x_report(self, cmd, operator, params):
+        self.close_document()
+        return misc.CAST_SIZE['1'](operator)
+
+    def z_report(self, cmd, operator, params):
+        if self.mode == 8:
+            raise EmulatorError(0x4A)
+        if self.mode == 4:
+            raise EmulatorError(0x16)
+        self.close_document()
+        self.operational.clear()
+        self.mode = 4
+        return misc.CAST_SIZE['1'](operator)
+
+    def income(self, cmd, operator, params):
+        if self.mode == 8:
+            raise EmulatorError(0x4A)
+        self.require_shift()
+        cash = _money(params[:5])
+        if cmd == 0x51:
+            if self.monetary.get(self.CASH_REGISTER, 0) < cash:
+                raise EmulatorError(0x46)
+            cash = -cash
+        self.add_monetary(self.CASH_REGISTER, cash)
+        self.close_document()
+        return misc.bytearray_concat(misc.CAST_SIZE['1'](operator), misc.CAST_SIZE['2'](self.doc_num))
+
+    outcome = income
+
+    def open_check_(self, check_type):
+        if self.mode == 8:
+            raise EmulatorError(0x4A)
+        self.require_shift()
+        self.mode = 8
+        self.check_type = check_type
+        self.check_ops = 0
+        self.check_total = 0
+
+    def sale(self, cmd, operator, params):
+        check_type = 0 if cmd == 0x80 else 2
+        if self.mode != 8:
+            self.open_check_(check_type)
+        elif self.check_type != check_type:
+            raise EmulatorError(0x49)
+
+        quantity, price = _money(params[0:5]), _money(params[5:10])
+        department = misc.UNCAST_SIZE['1'](params[10:11])
+        if department > 16:
+            raise EmulatorError(0x63)
+
+        amount = quantity * price // 1000
+        self.check_total += amount
+        self.check_ops += 1
+        self.add_monetary(self.SALES_REGISTER + department, amount)
+        return misc.CAST_SIZE['1'](operator)
+
+    def discount(self, cmd, operator, params):
+        self.require_check()
+        sum_ = _money(params[0:5])
+        if cmd == 0x86:
+            if sum_ > self.check_total:
+                raise EmulatorError(0x5A)
+            sum_ = -sum_
+        self.check_total += sum_
+        self.check_ops += 1
+        return misc.CAST_SIZE['1'](operator)
+
+    def close_check(self, cmd, operator, params):
+        self.require_check()
+        payments = [_money(params[i:i + 5]) for i in range(0, 20, 5)]
+        if sum(payments) < self.check_total:
+            raise EmulatorError(0x45)
+
+        change = min(sum(payments) - self.check_total, payments[0])
+        cash = payments[0] - change
+        self.add_monetary(self.CASH_REGISTER, cash if self.check_type == 0 else -cash)
+        self.add_operational(self.CHECKS_REGISTER + self.check_type)
+        self.close_document()
+
+        self.mode = 2
+        self.check_type = None
+        self.check_ops = 0
+        self.check_total = 0
+        return misc.bytearray_concat(misc.CAST_SIZE['1'](operator), _pack_money(change))
+
+    def cancel_check(self, cmd, operator, params):
+        self.require_check()
+        self.close_document()
+        self.mode = 2
+        self.check_type = None
+        self.check_ops = 0
+        self.check_total = 0
+        return misc.CAST_SIZE['1'](operator)
+
+    def repeat(self, cmd, operator, params):
+        if not self.last_document:
+            raise EmulatorError(0x56)
+        return misc.CAST_SIZE['1'](operator)
+
+    def open_check(self, cmd, operator, params):
+        check_type = misc.UNCAST_SIZE['1'](params[:1])
+        if check_type > 3:
+            raise EmulatorError(0x33)
+        self.open_check_(check_type)
+        return misc.CAST_SIZE['1'](operator)
+
+    def continue_print(self, cmd, operator, params):
+        self.wait_continue = False
+        return misc.CAST_SIZE['1'](operator)
+
+    def open_shift(self, cmd, operator, params):
+        if self.mode != 4:
+            raise EmulatorError(0x73)
+        self.open_shift_()
+
+    def device_model(self, cmd, operator, params):
+        return misc.bytearray_concat(
+            misc.CAST_SIZE['11111'](0, 0, 1, 106, self.model),
+            misc.CAST_SIZE['1'](0),
+            misc.encode(self.name)
+        )
+
+    def require_fs(self):
+        if not self.fs:
+            raise EmulatorError(0x37)
+
+    def fs_state(self, cmd, operator, params):
+        self.require_fs()
+        now = self.now
+        return misc.bytearray_concat(
+            misc.CAST_SIZE['1'](0b0011),
+            misc.CAST_SIZE['1'](0x04 if self.mode == 8 else 0x00),
+            misc.CAST_SIZE['1'](0),
+            misc.CAST_SIZE['1'](int(self.mode in (2, 3, 8))),
+            misc.CAST_SIZE['1'](0),
+            misc.CAST_SIZE['11111'](now.year - 2000, now.month, now.day, now.hour, now.minute),
+            bytearray(misc.encode(u'{:016d}'.format(self.serial_number))),
+            misc.CAST_SIZE['4'](self.fd_num)
+        )
+
+    def fs_expiration_time(self, cmd, operator, params):
+        self.require_fs()
+        return misc.CAST_SIZE['11111'](self.now.year - 2000 + 1, 12, 31, 11, 1)
+
+    def fs_cancel_document(self, cmd, operator, params):
+        self.require_fs()
+        if self.mode == 8:
+            self.mode = 2
+            self.check_type = None
+            self.check_ops = 0
+
+    def fs_find_document_by_num(self, cmd, operator, params):
+        self.require_fs()
+        num = misc.UNCAST_SIZE['4'](params[:4])
+        if not 1 <= num <= self.fd_num:
+            raise EmulatorError(0x08)
+        return misc.bytearray_concat(misc.CAST_SIZE['11'](3, int(num <= self.fd_num - self.unconfirmed)), bytearray(4))
+
+    def fs_open_shift(self, cmd, operator, params):
+        self.require_fs()
+        if self.mode != 4:
+            raise EmulatorError(0x02)
+        self.open_shift_()
+        return misc.bytearray_concat(
+            misc.CAST_SIZE['2'](self.shift_num), misc.CAST_SIZE['4'](self.fd_num), misc.CAST_SIZE['4'](self.fd_num)
+        )
+
+    def fs_correction_check(self, cmd, operator, params):
+        self.require_fs()
+        self.require_shift()
+        self.close_document()
+        return misc.bytearray_concat(
+            misc.CAST_SIZE['2'](self.doc_num), misc.CAST_SIZE['4'](self.fd_num), misc.CAST_SIZE['4'](self.fd_num)
+        )
+
+    def fs_calculation_state_report(self, cmd, operator, params):
+        self.require_fs()
+        self.close_document()
+        now = self.now
+        return misc.bytearray_concat(
+            misc.CAST_SIZE['4'](self.fd_num),
+            misc.CAST_SIZE['4'](self.fd_num),
+            misc.CAST_SIZE['4'](self.unconfirmed),
+            misc.CAST_SIZE['111'](now.year - 2000, now.month, now.day)
+        )
+
+    def fs_info_exchange(self, cmd, operator, params):
+        self.require_fs()
+        now = self.now
+        return misc.bytearray_concat(
+            misc.CAST_SIZE['11'](0b100000 | (0b10000 if self.unconfirmed else 0), 0),
+            misc.CAST_SIZE['2'](self.unconfirmed),
+            misc.CAST_SIZE['4'](self.fd_num - self.unconfirmed + 1 if self.unconfirmed else 0),
+            misc.CAST_SIZE['11111'](now.year - 2000, now.month, now.day, now.hour, now.minute)
+        )
+
+    def fs_unconfirmed_document_count(self, cmd, operator, params):
+        self.require_fs()
+        return misc.CAST_SIZE['2'](self.unconfirmed)
+
+    def fs_shift_params(self, cmd, operator, params):
+        self.require_fs()
+        return misc.bytearray_concat(
+            misc.CAST_SIZE['1'](int(self.mode in (2, 3, 8))),
+            misc.CAST_SIZE['2'](self.shift_num),
+            misc.CAST_SIZE['2'](self.doc_num)
+        )
+
+    def fs_close_shift(self, cmd, operator, params):
+        self.require_fs()
+        if self.mode not in (2, 3):
+            raise EmulatorError(0x02)
+        self.close_document()
+        self.mode = 4
+        return misc.bytearray_concat(
+            misc.CAST_SIZE['2'](self.shift_num), misc.CAST_SIZE['4'](self.fd_num), misc.CAST_SIZE['4'](self.fd_num)
+        )
+
+
+def main():
+    emulator = Emulator()
+    if len(sys.argv) > 1 and sys.argv[1] == 'tcp':
+        print(u'{}:{}'.format(*emulator.tcp('0.0.0.0', int(sys.argv[2]) if len(sys.argv) > 2 else 7778)))
+    else:
+        print(emulator.pty())
+    sys.stdout.flush()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
+
+
+if __name__ == '__main__':
+    main()
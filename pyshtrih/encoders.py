@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+
+import struct
+
+from . import misc
+from .compat import memoryview
+from .protocol import STX
+
+
+# коды формата параметров команды (порядок байт - little-endian):
+#   B, H, I, h - как в модуле struct
+#   M - денежная сумма (5 байт)
+#   S - строка, дополняемая нулями до длины, заданной при вызове (не менее misc.DEFAULT_MIN_LENGTH)
+STRUCT_CODES = {
+    'B': 'B',
+    'H': 'H',
+    'I': 'I',
+    'h': 'h',
+    'M': 'IB'
+}
+
+MONEY_MASK = 0xFFFFFFFF
+
+
+class Encoder(object):
+    def __init__(self, cmd, fmt):
+        """
+        Формирователь кадра команды.
+
+        Кадр целиком (STX, длина, команда, параметры, LRC) упаковывается
+        одним вызовом struct.Struct.pack_into в заранее выделенный буфер.
+
+        :type cmd: int
+        :param cmd: номер команды
+        :type fmt: str
+        :param fmt: формат параметров команды (см. STRUCT_CODES)
+        """
+
+        if 'S' in fmt[:-1]:
+            raise ValueError(u'Строка должна быть последним параметром команды')
+
+        self.cmd = cmd
+        self.fmt = fmt
+        self.cmd_bytes = tuple(misc.CAST_CMD[len(misc.int_to_bytes(cmd))](cmd))
+        self.money = 'M' in fmt
+        self.text = fmt.endswith('S')
+        self.structs = {}
+
+        if not self.text:
+            self.layout(0)
+
+    def layout(self, length):
+        """
+        Структура кадра и его заголовок (STX, длина, байты команды) для заданной длины строки.
+
+        :type length: int
+        :param length: длина строки
+
+        :rtype: tuple
+        :return: (struct.Struct, заголовок)
+        """
+
+        try:
+            return self.structs[length]
+        except KeyError:
+            pass
+
+        codes = ''.join(STRUCT_CODES[code] for code in self.fmt if code != 'S')
+        if self.text:
+            codes += '{}s'.format(max(length, misc.DEFAULT_MIN_LENGTH))
+
+        # STX, длина, байты команды, параметры, LRC
+        struct_ = struct.Struct('<BB{}{}B'.format('B' * len(self.cmd_bytes), codes))
+        head = (ord(STX), struct_.size - 3) + self.cmd_bytes
+
+        self.structs[length] = struct_, head
+        return struct_, head
+
+    def __call__(self, *args, **kwargs):
+        """
+        Формирование кадра.
+
+        :param args: параметры команды в порядке формата
+        :param kwargs: length - длина строки (для формата со строкой)
+
+        :rtype: bytearray
+        :return: кадр, готовый к отправке
+        """
+
+        struct_, head = self.layout(kwargs.get('length', 0) if self.text else 0)
+
+        values = list(head)
+        if self.money:
+            for code, arg in zip(self.fmt, args):
+                if code == 'M':
+                    values.append(arg & MONEY_MASK)
+                    values.append((arg >> 32) & 0xFF)
+                else:
+                    values.append(arg)
+        else:
+            values.extend(args)
+
+        if self.text:
+            text = values[-1]
+            values[-1] = misc.encode(text) if text else b''
+
+        # место под LRC
+        values.append(0)
+
+        frame = bytearray(struct_.size)
+        struct_.pack_into(frame, 0, *values)
+        frame[-1] = misc.lrc(memoryview(frame)[1:-1])
+
+        return frame
+
+
+# форматы параметров команд; команды с параметрами переменного размера
+# (0x1E "Запись таблицы", 0xC0 "Загрузка графики", 0xFF0C "Передать произвольную TLV структуру")
+# формируются Protocol.command
+FORMATS = {
+    # Короткий запрос состояния ФР
+    0x10: 'I',
+    # Запрос состояния ФР
+    0x11: 'I',
+    # Гудок
+    0x13: 'I',
+    # Установка параметров обмена
+    0x14: 'IBBB',
+    # Чтение параметров обмена
+    0x15: 'IB',
+    # Технологическое обнуление
+    0x16: '',
+    # Печать строки
+    0x17: 'IBS',
+    # Тестовый прогон
+    0x19: 'IB',
+    # Запрос денежного регистра
+    0x1A: 'IB',
+    # Запрос операционного регистра
+    0x1B: 'IB',
+    # Чтение таблицы
+    0x1F: 'IBHB',
+    # Программирование времени
+    0x21: 'IBBB',
+    # Программирование даты
+    0x22: 'IBBB',
+    # Подтверждение программирования даты
+    0x23: 'IBBB',
+    # Отрезка чека
+    0x25: 'IB',
+    # Открыть денежный ящик
+    0x28: 'IB',
+    # Протяжка
+    0x29: 'IBB',
+    # Прерывание тестового прогона
+    0x2B: 'I',
+    # Запрос структуры таблицы
+    0x2D: 'IB',
+    # Запрос структуры поля
+    0x2E: 'IBB',
+    # Суточный отчет без гашения
+    0x40: 'I',
+    # Суточный отчет с гашением
+    0x41: 'I',
+    # Внесение
+    0x50: 'IM',
+    # Выплата
+    0x51: 'IM',
+    # Продажа
+    0x80: 'IMMBBBBBS',
+    # Возврат продажи
+    0x82: 'IMMBBBBBS',
+    # Закрытие чека
+    0x85: 'IMMMMhBBBBS',
+    # Скидка
+    0x86: 'IMBBBBS',
+    # Надбавка
+    0x87: 'IMBBBBS',
+    # Аннулирование чека
+    0x88: 'I',
+    # Повтор документа
+    0x8C: 'I',
+    # Открыть чек
+    0x8D: 'IB',
+    # Отчет ЭКЛЗ по отделам в заданном диапазоне дат
+    0xA0: 'IBBBBBBBB',
+    # Отчет ЭКЛЗ по закрытиям смен в заданном диапазоне дат
+    0xA2: 'IBBBBBBB',
+    # Продолжение печати
+    0xB0: 'I',
+    # Печать графики
+    0xC1: 'IBB',
+    # Печать штрих-кода
+    0xC2: 'IM',
+    # Открыть смену
+    0xE0: 'I',
+    # Получить тип устройства
+    0xFC: '',
+    # Запрос статуса ФН
+    0xFF01: 'I',
+    # Запрос срока действия ФН
+    0xFF03: 'I',
+    # Отменить документ в ФН
+    0xFF08: 'I',
+    # Найти фискальный документ по номеру
+    0xFF0A: 'II',
+    # Открыть смену в ФН
+    0xFF0B: 'I',
+    # Начать формирование чека коррекции
+    0xFF35: 'I',
+    # Сформировать чек коррекции
+    0xFF36: 'IMB',
+    # Сформировать отчёт о состоянии расчётов
+    0xFF38: 'I',
+    # Получить статус информационного обмена
+    0xFF39: 'I',
+    # Запрос количества ФД на которые нет квитанции
+    0xFF3F: 'I',
+    # Запрос параметров текущей смены
+    0xFF40: 'I',
+    # Начать открытие смены
+    0xFF41: 'I',
+    # Начать закрытие смены
+    0xFF42: 'I',
+    # Закрыть смену в ФН
+    0xFF43: 'I'
+}
+
+ENCODERS = {
+    cmd: Encoder(cmd, fmt) for cmd, fmt in FORMATS.items()
+}
@@ -38,6 +38,10 @@ class FDError(ProtocolError):
     pass
 
 
+class PrintTimeoutError(ProtocolError):
+    pass
+
+
 @str_compat
 class Error(ProtocolError):
 
@@ -294,6 +298,20 @@ class Error(ProtocolError):
     def __repr__(self):
         return '{}({})'.format(type(self).__name__, self)
 
+    def __reduce__(self):
+        # аргументы __init__ не сохраняются в args, поэтому pickle восстанавливает атрибуты
+        return restore, (type(self), self.__dict__)
+
+
+def restore(cls, state):
+    """
+    Восстановление исключения Error (и его подклассов) при распаковке pickle.
+    """
+
+    exc = cls.__new__(cls)
+    exc.__dict__.update(state)
+    return exc
+
 
 class CheckError(Error):
 
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+
+import functools
+import threading
+from concurrent import futures
+
+from .compat import queue
+
+
+class DeviceExecutor(object):
+    DEFAULT_MAXSIZE = 100
+
+    def __init__(self, device, maxsize=DEFAULT_MAXSIZE, timeout=None):
+        """
+        Очередь команд устройства с выделенным потоком ввода-вывода.
+
+        Все команды выполняются последовательно в одном рабочем потоке, поэтому
+        кадры разных потоков приложения не перемешиваются. Методы устройства,
+        вызванные через исполнителя, возвращают concurrent.futures.Future:
+
+            >>> executor = DeviceExecutor(device)
+            >>> executor.state().result()
+
+        :type device: pyshtrih.device.Device
+        :param device: устройство
+        :type maxsize: int
+        :param maxsize: максимальная длина очереди команд
+        :type timeout: float
+        :param timeout: время ожидания места в заполненной очереди,
+                        по истечении которого возбуждается queue.Full (None - без ограничения)
+        """
+
+        self.device = device
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize)
+        self.lock = threading.Lock()
+        self.closed = False
+
+        self.thread = threading.Thread(
+            target=self._worker, name=u'pyshtrih-executor-{}'.format(device.port)
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            future, func, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Поставить вызов в очередь.
+
+        :type func: str or collections.Callable
+        :param func: имя метода устройства или функция, вызываемая в рабочем потоке
+        :param args: позиционные аргументы
+        :param kwargs: именованные аргументы
+
+        :rtype: concurrent.futures.Future
+        :return: результат вызова
+        """
+
+        if not callable(func):
+            func = getattr(self.device, func)
+
+        future = futures.Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError(u'Исполнитель остановлен')
+            self.queue.put((future, func, args, kwargs), timeout=self.timeout)
+
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Остановить рабочий поток после выполнения уже поставленных команд.
+
+        :type wait: bool
+        :param wait: дождаться завершения рабочего потока
+        """
+
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.queue.put(None)
+
+        if wait:
+            self.thread.join()
+
+    def __getattr__(self, item):
+        if item == 'device':
+            raise AttributeError(item)
+
+        attr = getattr(self.device, item)
+        if callable(attr):
+            return functools.partial(self.submit, attr)
+        return attr
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
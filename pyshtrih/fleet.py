@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+
+import threading
+import collections
+
+from . import commands
+from .executor import DeviceExecutor
+from .compat import monotonic
+
+
+class Fleet(object):
+    # время ожидания результатов групповой операции, None - без ограничения
+    GATHER_TIMEOUT = None
+
+    def __init__(self, devices=None, maxsize=DeviceExecutor.DEFAULT_MAXSIZE, timeout=None):
+        """
+        Группа устройств, обмен с которыми выполняется параллельно.
+
+        Каждое устройство обслуживается собственным исполнителем (DeviceExecutor) с выделенным
+        потоком ввода-вывода, поэтому время групповой операции определяется самым медленным
+        устройством, а не суммой времени всех устройств. Команды адресуются по идентификатору
+        устройства:
+
+            >>> fleet = Fleet({u'касса-1': ShtrihM01F('/dev/ttyS0'), u'касса-2': ShtrihM02F('/dev/ttyS1')})
+            >>> fleet.connect()
+            >>> fleet[u'касса-1'].sale((u'Хлеб', 1000, 4500)).result()
+            >>> fleet.state()
+            OrderedDict([(u'касса-1', <Response>), (u'касса-2', NoConnectionError(...))])
+
+        :type devices: dict
+        :param devices: идентификатор -> устройство (pyshtrih.device.Device)
+        :type maxsize: int
+        :param maxsize: максимальная длина очереди команд каждого устройства
+        :type timeout: float
+        :param timeout: время ожидания места в заполненной очереди (см. DeviceExecutor)
+        """
+
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # идентификатор -> DeviceExecutor
+        self.executors = collections.OrderedDict()
+
+        for device_id, device in (devices or {}).items():
+            self.add(device_id, device)
+
+    def add(self, device_id, device):
+        """
+        Добавить устройство.
+
+        :param device_id: идентификатор устройства
+        :type device: pyshtrih.device.Device
+        :param device: устройство
+        """
+
+        with self.lock:
+            if device_id in self.executors:
+                raise KeyError(u'Устройство {} уже добавлено'.format(device_id))
+            self.executors[device_id] = DeviceExecutor(device, self.maxsize, self.timeout)
+
+    def remove(self, device_id, wait=True):
+        """
+        Исключить устройство (после выполнения уже поставленных команд).
+
+        :param device_id: идентификатор устройства
+        :type wait: bool
+        :param wait: дождаться завершения рабочего потока
+
+        :rtype: pyshtrih.device.Device
+        """
+
+        with self.lock:
+            executor = self.executors.pop(device_id)
+        executor.shutdown(wait)
+        return executor.device
+
+    @property
+    def ids(self):
+        with self.lock:
+            return list(self.executors)
+
+    def device(self, device_id):
+        """
+        Устройство по идентификатору (вызовы его методов выполняются в потоке приложения).
+
+        :rtype: pyshtrih.device.Device
+        """
+
+        return self.executors[device_id].device
+
+    def __getitem__(self, device_id):
+        """
+        Исполнитель устройства: методы устройства, вызванные через него,
+        возвращают concurrent.futures.Future.
+
+        :rtype: pyshtrih.executor.DeviceExecutor
+        """
+
+        return self.executors[device_id]
+
+    def __contains__(self, device_id):
+        return device_id in self.executors
+
+    def __len__(self):
+        return len(self.executors)
+
+    def submit(self, device_id, func, *args, **kwargs):
+        """
+        Поставить вызов в очередь устройства.
+
+        :param device_id: идентификатор устройства
+        :type func: str or collections.Callable
+        :param func: имя метода устройства или функция
+
+        :rtype: concurrent.futures.Future
+        """
+
+        return self.executors[device_id].submit(func, *args, **kwargs)
+
+    def broadcast(self, func, *args, **kwargs):
+        """
+        Поставить вызов в очереди всех устройств.
+
+        :type func: str or collections.Callable
+        :param func: имя метода устройства или функция, вызываемая с устройством
+                     первым аргументом
+
+        :rtype: collections.OrderedDict
+        :return: идентификатор -> concurrent.futures.Future
+        """
+
+        with self.lock:
+            executors = list(self.executors.items())
+
+        result = collections.OrderedDict()
+        for device_id, executor in executors:
+            if callable(func):
+                result[device_id] = executor.submit(func, executor.device, *args, **kwargs)
+            else:
+                result[device_id] = executor.submit(func, *args, **kwargs)
+        return result
+
+    def wait(self, futures_, timeout=None):
+        """
+        Ожидание результатов групповой операции.
+
+        :type futures_: collections.OrderedDict
+        :param futures_: идентификатор -> concurrent.futures.Future (см. broadcast)
+        :type timeout: float
+        :param timeout: максимальное время ожидания, по умолчанию - GATHER_TIMEOUT
+
+        :rtype: collections.OrderedDict
+        :return: идентификатор -> результат или исключение (в т.ч. concurrent.futures.TimeoutError,
+                 если результат не получен за timeout)
+        """
+
+        if timeout is None:
+            timeout = self.GATHER_TIMEOUT
+        deadline = None if timeout is None else monotonic() + timeout
+
+        result = collections.OrderedDict()
+        for device_id, future in futures_.items():
+            remaining = None if deadline is None else max(deadline - monotonic(), 0)
+            try:
+                result[device_id] = future.result(remaining)
+            except Exception as exc:
+                result[device_id] = exc
+        return result
+
+    def gather(self, func, *args, **kwargs):
+        """
+        Вызов на всех устройствах с ожиданием результатов.
+
+        :type func: str or collections.Callable
+        :param func: имя метода устройства или функция, вызываемая с устройством
+                     первым аргументом
+
+        :rtype: collections.OrderedDict
+        :return: идентификатор -> результат или исключение
+        """
+
+        return self.wait(self.broadcast(func, *args, **kwargs))
+
+    def connect(self):
+        """
+        Подключиться ко всем устройствам.
+
+        :rtype: collections.OrderedDict
+        :return: идентификатор -> None или исключение
+        """
+
+        return self.gather('connect')
+
+    def disconnect(self):
+        """
+        Отключиться от всех устройств.
+        """
+
+        return self.gather('disconnect')
+
+    def shutdown(self, wait=True):
+        """
+        Остановить исполнители всех устройств.
+
+        :type wait: bool
+        :param wait: дождаться завершения рабочих потоков
+        """
+
+        with self.lock:
+            executors = list(self.executors.values())
+            self.executors.clear()
+
+        for executor in executors:
+            executor.shutdown(False)
+        if wait:
+            for executor in executors:
+                executor.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def __getattr__(self, item):
+        # групповые вызовы - только для методов устройства из pyshtrih.commands
+        if item not in commands.METHODS:
+            raise AttributeError(item)
+
+        def method(*args, **kwargs):
+            return self.gather(item, *args, **kwargs)
+
+        method.__name__ = item
+        return method
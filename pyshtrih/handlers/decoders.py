@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+
+import struct
+import operator
+import functools
+import collections
+
+from . import commands as hc
+from .. import misc
+
+
+def interpret(handler, response):
+    """
+    Разбор ответа ККМ обходом описания полей из HANDLERS.
+
+    :type handler: tuple
+    :param handler: описание полей ответа
+    :type response: bytearray or memoryview
+    :param response: ответ ККМ без байт команды
+
+    :rtype: dict
+    :return: набор параметров в виде словаря
+    """
+
+    result = {}
+    for _slice, func, name in handler:
+        chunk = _slice(response) if isinstance(_slice, misc.mslice) else response[_slice]
+        if chunk and name is None:
+            result.update(func(chunk))
+        elif chunk:
+            # поля без обработчика получают собственную копию байт
+            result[name] = func(chunk) if func else misc.bytearray_cast(chunk)
+        else:
+            result[name] = None
+
+    return result
+
+
+def unpack_func(func):
+    """
+    Определение формата struct для функции разбора поля.
+
+    :rtype: tuple
+    :return: (формат, признак одного значения, функция постобработки)
+             или None, если функция не сводится к struct.unpack
+    """
+
+    if func in misc.UNCAST_FORMAT:
+        fmt, single = misc.UNCAST_FORMAT[func]
+        return fmt, single, None
+
+    if isinstance(func, misc.FuncChain) and len(func.funcs) > 1 and func.funcs[-1] in misc.UNCAST_FORMAT:
+        fmt, single = misc.UNCAST_FORMAT[func.funcs[-1]]
+        post = func.funcs[0] if len(func.funcs) == 2 else misc.FuncChain(*func.funcs[:-1])
+        return fmt, single, post
+
+
+class Decoder(object):
+    def __init__(self, handler):
+        """
+        Разборщик ответа одной команды, скомпилированный из описания полей HANDLERS.
+
+        Поля с фиксированным смещением и форматом struct разбираются одним вызовом
+        struct.Struct.unpack_from, остальные - так же, как в interpret.
+        Ответы короче ожидаемого (например, ответы с ошибкой) разбираются interpret.
+
+        :type handler: tuple
+        :param handler: описание полей ответа
+        """
+
+        self.handler = handler
+
+        compiled = []
+        for _slice, func, name in handler:
+            spec = None
+            if isinstance(_slice, slice) and _slice.stop is not None and name is not None and func is not None:
+                spec = unpack_func(func)
+
+            if spec:
+                fmt, single, post = spec
+                start = _slice.start or 0
+                if struct.calcsize(fmt) == _slice.stop - start:
+                    compiled.append((start, fmt, single, post, name))
+
+        fmt = ['<']
+        offset = 0
+        index = 0
+        fields = {}
+        layout = {}
+        for start, field_fmt, single, post, name in sorted(compiled, key=lambda i: i[0]):
+            if start < offset:
+                # пересекающиеся поля разбираются отдельно
+                continue
+            if start > offset:
+                fmt.append('{}x'.format(start - offset))
+
+            field_fmt = field_fmt.lstrip('<')
+            count = len(struct.unpack('<' + field_fmt, bytearray(struct.calcsize('<' + field_fmt))))
+            fmt.append(field_fmt)
+            fields[name] = (index if single else slice(index, index + count), post)
+            layout[name] = (struct.Struct('<' + field_fmt), start, 0 if single else slice(0, count), post)
+
+            offset = start + struct.calcsize('<' + field_fmt)
+            index += count
+
+        self.struct = struct.Struct(''.join(fmt))
+        self.size = self.struct.size
+        # порядок ключей совпадает с порядком полей в HANDLERS
+        self.names = tuple(name for _, _, name in handler if name is not None)
+
+        plain = [(name, index) for name, (index, post) in fields.items() if post is None]
+        self.plain_names = tuple(name for name, _ in plain)
+        self.plain_values = operator.itemgetter(*(index for _, index in plain)) if plain else None
+        if len(plain) == 1:
+            getter = self.plain_values
+            self.plain_values = lambda values: (getter(values), )
+
+        self.posted = tuple((name, index, post) for name, (index, post) in fields.items() if post is not None)
+        self.rest = tuple((_slice, func, name) for _slice, func, name in handler if name not in fields)
+
+        self.layout = layout
+        self.handler_fields = {name: ((_slice, func, name), ) for _slice, func, name in handler if name is not None}
+
+    def __call__(self, response):
+        """
+        :type response: bytearray or memoryview
+        :param response: ответ ККМ без байт команды
+
+        :rtype: dict
+        :return: набор параметров в виде словаря
+        """
+
+        if len(response) < self.size:
+            return interpret(self.handler, response)
+
+        values = self.struct.unpack_from(response)
+
+        result = dict.fromkeys(self.names)
+        if self.plain_values:
+            result.update(zip(self.plain_names, self.plain_values(values)))
+        for name, index, post in self.posted:
+            result[name] = post(values[index])
+        if self.rest:
+            result.update(interpret(self.rest, response))
+
+        return result
+
+    def field(self, name, response):
+        """
+        Разбор одного поля ответа.
+
+        :type name: unicode
+        :param name: название поля
+        :type response: bytearray or memoryview
+        :param response: ответ ККМ без байт команды
+
+        :return: значение поля
+
+        :raises KeyError: если поле не описано в HANDLERS (в т.ч. поля,
+                          получаемые функциями, возвращающими несколько значений)
+        """
+
+        if name in self.layout:
+            struct_, offset, index, post = self.layout[name]
+            if len(response) >= offset + struct_.size:
+                value = struct_.unpack_from(response, offset)[index]
+                return post(value) if post else value
+
+        return interpret(self.handler_fields[name], response)[name]
+
+
+DECODERS = {
+    cmd: Decoder(handler) for cmd, handler in hc.HANDLERS.items()
+}
+
+
+# контекст разбора ответов устройства: код модели (ответ команды 0xFC, -1 - неизвестна),
+# сборка ПО ФР (None - неизвестна), признак наличия ФН
+Context = collections.namedtuple('Context', 'model firmware fs')
+
+DEFAULT_CONTEXT = Context(-1, None, False)
+
+# контекст -> разборщики ответов (заполняется один раз для каждого контекста)
+CONTEXT_DECODERS = {}
+
+
+def bind(func, context):
+    """
+    Привязка функции разбора поля к контексту.
+
+    Функции с атрибутом contextual (в т.ч. в составе misc.FuncChain) получают
+    контекст именованным аргументом context, остальные возвращаются без изменений.
+    """
+
+    if getattr(func, 'contextual', False):
+        return functools.partial(func, context=context)
+
+    if isinstance(func, misc.FuncChain):
+        funcs = tuple(bind(f, context) for f in func.funcs)
+        if any(a is not b for a, b in zip(funcs, func.funcs)):
+            return misc.FuncChain(*funcs)
+
+    return func
+
+
+def decoders(context):
+    """
+    Разборщики ответов для контекста устройства.
+
+    Разборщики, не зависящие от контекста, общие для всех контекстов. Результат
+    не изменяется после создания, поэтому используется протоколами разных устройств
+    параллельно без блокировок.
+
+    :type context: Context
+    :param context: контекст разбора ответов
+
+    :rtype: dict
+    :return: номер команды -> Decoder
+    """
+
+    try:
+        return CONTEXT_DECODERS[context]
+    except KeyError:
+        pass
+
+    result = dict(DECODERS)
+    for cmd, handler in hc.HANDLERS.items():
+        bound = tuple((_slice, bind(func, context), name) for _slice, func, name in handler)
+        if any(a[1] is not b[1] for a, b in zip(bound, handler)):
+            result[cmd] = Decoder(bound)
+
+    return CONTEXT_DECODERS.setdefault(context, result)
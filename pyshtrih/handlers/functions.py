@@ -40,7 +40,22 @@ def handle_datetime(arg):
     return res
 
 
-def handle_fr_flags(arg):
+def fr_flags_layout(model):
+    """
+    Функция получения набора флагов ФР, актуальных для модели.
+
+    :type model: int
+    :param model: код модели устройства
+
+    :rtype: tuple
+    :return: пары (название флага, номер бита)
+    """
+
+    try:
+        return FR_FLAGS_LAYOUT[model]
+    except KeyError:
+        pass
+
     def get_keys(revision):
         return (
             (u'Увеличенная точность количества', u'Буфер принтера непуст')[revision],
@@ -61,8 +76,6 @@ def handle_fr_flags(arg):
             u'Рулон операционного журнала'
         )
 
-    bits = misc.int_to_bits(arg, 16)
-
     a, b, c = 0, 1, 2
     flags_actual = {
         # ШТРИХ-ФР-К
@@ -74,17 +87,29 @@ def handle_fr_flags(arg):
     }
 
     flags, rev = flags_actual.get(
-        handle_fr_flags.model,
+        model,
         ((1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1), a)
     )
 
-    return dict(
-        zip(
-            itertools.compress(get_keys(rev), flags),
-            itertools.compress(bits, flags)
-        )
-    )
-handle_fr_flags.model = -1
+    # ключи перечислены от старшего бита к младшему
+    layout = tuple(itertools.compress(zip(get_keys(rev), range(15, -1, -1)), flags))
+    FR_FLAGS_LAYOUT[model] = layout
+    return layout
+FR_FLAGS_LAYOUT = {}
+
+
+def handle_fr_flags(arg, context=None):
+    """
+    Функция обработки флагов ФР с учетом модели устройства.
+
+    :type context: pyshtrih.handlers.decoders.Context
+    :param context: контекст разбора ответов устройства (по умолчанию - модель неизвестна)
+    """
+
+    model = -1 if context is None else context.model
+    return {key: (arg >> bit) & 1 for key, bit in fr_flags_layout(model)}
+# функция получает контекст разбора (см. pyshtrih.handlers.decoders.bind)
+handle_fr_flags.contextual = True
 
 
 def handle_baudrate(arg):
@@ -239,12 +264,15 @@ class FRSubMode(object):
     __repr__ = __str__
 
 
-def handle_fp_flags(arg):
-    keys = (u'ФП 1', u'ФП 2', u'Лицензия', u'Переполнение ФП',
-            u'Батарея ФП', u'Последняя запись ФП', u'Смена в ФП', u'24 часа в ФП')
-    bits = misc.int_to_bits(arg, 8)
+FP_FLAGS = tuple(zip(
+    (u'ФП 1', u'ФП 2', u'Лицензия', u'Переполнение ФП',
+     u'Батарея ФП', u'Последняя запись ФП', u'Смена в ФП', u'24 часа в ФП'),
+    range(7, -1, -1)
+))
 
-    return dict(zip(keys, bits))
+
+def handle_fp_flags(arg):
+    return {key: (arg >> bit) & 1 for key, bit in FP_FLAGS}
 
 
 def handle_inn(arg):
@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+
+
+import io
+import os
+import time
+import struct
+import threading
+import collections
+
+from . import excepts
+from .protocol import frame_cmd, payload_cmd
+from .compat import unicode
+
+
+# типы записей журнала
+FRAME, ACKED, RESPONSE, FAILED = range(1, 5)
+
+# тип записи, время (time.time), длина данных
+RECORD_HEADER = struct.Struct('<BdH')
+
+# команды чека
+OPEN_CHECK = 0x8D
+CLOSE_CHECK = 0x85
+CANCEL_CHECK = 0x88
+CHECK_COMMANDS = (OPEN_CHECK, 0x80, 0x82, 0x86, 0x87, CLOSE_CHECK, CANCEL_CHECK)
+# команды, кадр которых сбрасывается на диск немедленно
+SYNC_COMMANDS = (OPEN_CHECK, CLOSE_CHECK, CANCEL_CHECK)
+
+# режим ФР "Открытый документ"
+MODE_OPEN_DOCUMENT = 8
+
+# состояния чека после восстановления (см. Recovery)
+NONE, OPEN, CLOSED, CANCELLED = u'none', u'open', u'closed', u'cancelled'
+
+
+Record = collections.namedtuple('Record', 'kind time data offset')
+
+
+class Exchange(object):
+    __slots__ = (
+        'frame',
+        'offset',
+        'acked',
+        'response',
+        'error'
+    )
+
+    def __init__(self, frame, offset):
+        """
+        Обмен командой, восстановленный из журнала.
+
+        :type frame: bytearray
+        :param frame: кадр команды
+        :type offset: int
+        :param offset: смещение записи кадра в файле журнала
+        """
+
+        self.frame = frame
+        self.offset = offset
+        self.acked = False
+        # полезная нагрузка ответа
+        self.response = None
+        self.error = None
+
+    @property
+    def cmd(self):
+        return frame_cmd(self.frame)
+
+    @property
+    def code(self):
+        """
+        Код ошибки из ответа ККМ или None, если ответ не получен.
+        """
+
+        return None if self.response is None else response_code(self.response)
+
+    @property
+    def executed(self):
+        """
+        Признак выполнения команды ККМ.
+
+        Команда считается выполненной, если получен ответ без ошибки или ККМ подтвердила
+        прием кадра (ACK), но ответ не был получен.
+        """
+
+        if self.response is not None:
+            return self.code == 0
+        return self.acked
+
+    def __repr__(self):
+        return '{}(cmd=0x{:02X}, acked={}, code={})'.format(type(self).__name__, self.cmd, self.acked, self.code)
+
+
+def response_code(payload):
+    """
+    Код ошибки из полезной нагрузки ответа.
+
+    :type payload: bytearray
+    :param payload: полезная нагрузка ответа (команда, код ошибки, параметры)
+
+    :rtype: int
+    """
+
+    offset = 2 if payload[0] == 0xFF else 1
+    return payload[offset] if len(payload) > offset else None
+
+
+def sync_dir(path):
+    """
+    Сброс на диск каталога файла (после переименования файла).
+    """
+
+    if os.name == 'nt':
+        return
+
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal(object):
+    SYNC_EVERY = 32
+
+    def __init__(self, path, sync_every=SYNC_EVERY, truncate=True):
+        """
+        Журнал обмена с ККМ (write-ahead log).
+
+        Кадр команды записывается после проверки связи непосредственно перед отправкой,
+        поэтому ответ на предыдущую команду, полученный при проверке связи, относится
+        к предыдущему кадру. Затем записываются подтверждение приема (ACK) и ответ ККМ
+        либо ошибка обмена. Записи передаются ОС сразу, а на диск (fsync) сбрасываются
+        раз в sync_every записей и немедленно для кадров SYNC_COMMANDS.
+
+        :type path: str
+        :param path: путь к файлу журнала
+        :type sync_every: int
+        :param sync_every: количество записей между сбросами на диск
+        :type truncate: bool
+        :param truncate: очищать журнал после закрытия или аннулирования чека
+                         (записи до этого момента для восстановления не нужны)
+        """
+
+        self.path = path
+        self.sync_every = sync_every
+        self.truncate = truncate
+
+        self.lock = threading.Lock()
+        self.tmp = u'{}.tmp'.format(path)
+        if os.path.exists(self.tmp):
+            # сбой во время сжатия: журнал не заменен, временный файл не нужен
+            os.remove(self.tmp)
+        self.fd = io.open(path, 'ab')
+        self.pending = 0
+        # кадр записан, ответ или ошибка обмена еще не записаны
+        self.sending = False
+        # смещение, до которого записи удаляются после отправки ACK (см. settle)
+        self.compact_start = None
+
+        exchanges = self.exchanges()
+        check = last_check(exchanges)
+        last = exchanges[-1] if exchanges else None
+        # команда, ответ на которую ожидается (ответ может прийти при проверке связи после сбоя)
+        self.cmd = last.cmd if last and last.response is None else None
+        # смещения первого кадра незавершенного чека и последнего кадра
+        self.check_start = check[0].offset if check and not completed(check[-1]) else None
+        self.frame_start = last.offset if last else None
+
+    def size(self):
+        self.fd.flush()
+        return os.fstat(self.fd.fileno()).st_size
+
+    def append(self, kind, data=b'', sync=False):
+        self.fd.write(RECORD_HEADER.pack(kind, time.time(), len(data)))
+        self.fd.write(data)
+        self.fd.flush()
+
+        self.pending += 1
+        if sync or self.pending >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        """
+        Сброс журнала на диск.
+        """
+
+        os.fsync(self.fd.fileno())
+        self.pending = 0
+
+    def sent(self, frame):
+        """
+        Запись кадра перед отправкой.
+        """
+
+        with self.lock:
+            self.cmd = frame_cmd(frame)
+            self.sending = True
+            self.frame_start = self.size()
+            if self.cmd in CHECK_COMMANDS and self.check_start is None:
+                self.check_start = self.frame_start
+            self.append(FRAME, bytes(frame), self.cmd in SYNC_COMMANDS)
+
+    def acked(self):
+        """
+        Запись подтверждения приема кадра.
+        """
+
+        with self.lock:
+            self.append(ACKED)
+
+    def received(self, payload):
+        """
+        Запись полезной нагрузки ответа.
+
+        Завершение чека определяется по номеру команды в ответе: ответ, полученный
+        при проверке связи, относится к предыдущей команде. Сжатие журнала
+        откладывается до отправки ACK (см. settle).
+        """
+
+        payload = bytearray(payload)
+        with self.lock:
+            self.append(RESPONSE, bytes(payload))
+            self.sending = False
+
+            if payload and payload_cmd(payload) in (CLOSE_CHECK, CANCEL_CHECK) and response_code(payload) == 0:
+                if self.truncate:
+                    self.compact_start = self.frame_start if self.check_start is None else self.check_start
+                self.check_start = None
+
+    def settle(self):
+        """
+        Отложенное сжатие журнала после завершения чека (вызывается после отправки ACK).
+        """
+
+        with self.lock:
+            if self.compact_start is not None:
+                start, self.compact_start = self.compact_start, None
+                self.compact(start)
+
+    def failed(self, exc):
+        """
+        Запись ошибки обмена (если кадр команды был записан).
+        """
+
+        with self.lock:
+            if self.sending:
+                self.append(FAILED, unicode(exc).encode('utf-8'))
+                self.sending = False
+
+    def compact(self, start):
+        """
+        Удаление записей до смещения start (записей до начала завершенного чека).
+
+        Записи завершенного чека сохраняются, чтобы при восстановлении
+        отличить закрытый чек от неначатого. Оставшиеся записи записываются
+        во временный файл, который заменяет журнал, поэтому при сбое
+        сохраняется либо прежний, либо сжатый журнал.
+        """
+
+        self.fd.flush()
+        with io.open(self.path, 'rb') as fd:
+            fd.seek(start or 0)
+            data = fd.read()
+
+        with io.open(self.tmp, 'wb') as fd:
+            fd.write(data)
+            fd.flush()
+            os.fsync(fd.fileno())
+
+        self.fd.close()
+        try:
+            if os.name == 'nt':
+                # на Windows os.rename не заменяет существующий файл
+                os.remove(self.path)
+            os.rename(self.tmp, self.path)
+        finally:
+            self.fd = io.open(self.path, 'ab')
+        sync_dir(self.path)
+
+        self.pending = 0
+        self.frame_start = None
+
+    def records(self):
+        """
+        Чтение записей журнала. Неполная последняя запись (сбой во время записи) пропускается.
+
+        :rtype: list
+        :return: список Record
+        """
+
+        self.fd.flush()
+        with io.open(self.path, 'rb') as fd:
+            data = fd.read()
+
+        result = []
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            kind, timestamp, size = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            if start + size > len(data):
+                break
+            result.append(Record(kind, timestamp, bytearray(data[start:start + size]), offset))
+            offset = start + size
+
+        return result
+
+    def exchanges(self):
+        """
+        Обмены командами, восстановленные из журнала.
+
+        Ответ, полученный без отправленного кадра (ККМ вернула ответ на предыдущую
+        команду при проверке связи), относится к последнему кадру без ответа.
+
+        :rtype: list
+        :return: список Exchange
+        """
+
+        result = []
+        for record in self.records():
+            if record.kind == FRAME:
+                result.append(Exchange(record.data, record.offset))
+            elif not result:
+                continue
+            elif record.kind == ACKED:
+                result[-1].acked = True
+            elif record.kind == RESPONSE and result[-1].response is None:
+                result[-1].response = record.data
+            elif record.kind == FAILED:
+                result[-1].error = record.data.decode('utf-8')
+
+        return result
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            self.fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class Recovery(object):
+    def __init__(self, state, executed=(), response=None):
+        """
+        Результат сверки журнала с ККМ.
+
+        :type state: unicode
+        :param state: состояние чека: NONE - незавершенного чека нет, OPEN - чек открыт,
+                      CLOSED - чек закрыт, CANCELLED - чек аннулирован ККМ
+        :type executed: tuple
+        :param executed: кадры команд чека, выполненные ККМ
+        :type response: pyshtrih.protocol.Response
+        :param response: ответ на команду закрытия чека (если он был получен при восстановлении)
+        """
+
+        self.state = state
+        self.executed = tuple(executed)
+        self.response = response
+
+    def __repr__(self):
+        return '{}(state={}, executed={})'.format(type(self).__name__, self.state, len(self.executed))
+
+
+def completed(exchange):
+    """
+    Признак успешного закрытия или аннулирования чека.
+    """
+
+    return exchange.cmd in (CLOSE_CHECK, CANCEL_CHECK) and exchange.code == 0
+
+
+def last_check(exchanges):
+    """
+    Обмены командами последнего чека в журнале.
+
+    :rtype: list
+    :return: список Exchange (пустой, если в журнале нет команд чека)
+    """
+
+    result = []
+    for exchange in exchanges:
+        if exchange.cmd not in CHECK_COMMANDS:
+            continue
+        if result and completed(result[-1]):
+            result = []
+        result.append(exchange)
+
+    return result
+
+
+def recover(device, journal):
+    """
+    Сверка журнала с состоянием ККМ после переподключения.
+
+    Ответ на команду, выполнявшуюся в момент сбоя, ККМ возвращает при проверке связи
+    (см. Protocol.init), поэтому он попадает в журнал при подключении.
+    Если чек был открыт и ККМ в режиме открытого документа, возвращается список уже
+    выполненных команд чека (см. pyshtrih.receipt.Receipt.execute). Если незавершенной
+    была команда закрытия чека, она отправляется повторно.
+
+    :type device: pyshtrih.device.Device
+    :param device: подключенное устройство, протокол которого ведет журнал journal
+    :type journal: Journal
+    :param journal: журнал
+
+    :rtype: Recovery
+    """
+
+    if not last_check(journal.exchanges()):
+        return Recovery(NONE)
+
+    mode = device.state(fresh=True)[u'Режим ФР'].num
+    # ответ на последнюю команду мог быть получен при проверке связи
+    check = last_check(journal.exchanges())
+
+    executed = [
+        exchange.frame for exchange in check
+        if exchange.executed and exchange.cmd not in (CLOSE_CHECK, CANCEL_CHECK)
+    ]
+    last = check[-1]
+
+    if completed(last):
+        return Recovery(
+            CLOSED if last.cmd == CLOSE_CHECK else CANCELLED,
+            executed,
+            device.protocol.handle_payload(last.response)
+        )
+
+    if mode != MODE_OPEN_DOCUMENT:
+        if last.cmd == CLOSE_CHECK and last.acked:
+            # ответ на закрытие чека потерян, но чек закрыт
+            return Recovery(CLOSED, executed)
+        return Recovery(CANCELLED, executed)
+
+    if last.cmd == CLOSE_CHECK and last.response is None:
+        # чек не закрыт - повторяем закрытие
+        try:
+            response = device.protocol.command_frame(last.frame)
+        except excepts.ProtocolError as exc:
+            raise excepts.CloseCheckError(exc)
+        return Recovery(CLOSED, executed, response)
+
+    return Recovery(OPEN, executed)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+
+import io
+import os
+import json
+import datetime
+import threading
+
+from . import tables, protocol, compat
+
+
+METADATA_CACHE = os.path.join(os.path.expanduser('~'), '.pyshtrih_metadata.json')
+
+# неизменяемые поля ответа команды 0x11 "Запрос состояния ФР"
+INFO_FIELDS = (
+    u'Версия ПО ФР',
+    u'Сборка ПО ФР',
+    u'Дата ПО ФР',
+    u'Версия ПО ФП',
+    u'Сборка ПО ФП',
+    u'Дата ПО ФП',
+    u'Заводской номер',
+    u'ИНН'
+)
+DATE_FIELDS = (u'Дата ПО ФР', u'Дата ПО ФП')
+DATE_FORMAT = '%Y-%m-%d'
+
+# типы полей таблиц в файле кеша
+FIELD_TYPES = {
+    u'int': int,
+    u'str': str
+}
+
+
+def entry_key(full_state):
+    """
+    Ключ записи кеша: заводской номер и сборка ПО ФР.
+
+    :type full_state: dict
+    :param full_state: ответ команды 0x11 "Запрос состояния ФР" или сведения Entry.info
+
+    :rtype: unicode
+    """
+
+    return u'{}:{}'.format(full_state[u'Заводской номер'], full_state[u'Сборка ПО ФР'])
+
+
+def dump_table(table):
+    return {
+        'name': table.name,
+        'rows': table.rows,
+        'fields': [
+            [field.name, field.type.__name__, field.size, field.min, field.max] for field in table.fields
+        ]
+    }
+
+
+def load_table(num, data):
+    return tables.Table(
+        num,
+        data['name'],
+        data['rows'],
+        tuple(
+            tables.Field(i, name, FIELD_TYPES[type_], size, min_, max_)
+            for i, (name, type_, size, min_, max_) in enumerate(data['fields'], 1)
+        )
+    )
+
+
+class Entry(object):
+    def __init__(self, key, data):
+        """
+        Сведения об одном экземпляре ККМ с определенной сборкой ПО.
+
+        :type key: unicode
+        :param key: ключ записи (см. entry_key)
+        :type data: dict
+        :param data: данные записи в файле кеша
+        """
+
+        self.key = key
+        self.data = data
+
+    @property
+    def model(self):
+        """
+        Ответ команды 0xFC "Получить тип устройства".
+
+        :rtype: pyshtrih.protocol.Response
+        """
+
+        return protocol.Response(0xFC, dict(self.data['model']))
+
+    @property
+    def info(self):
+        """
+        Неизменяемые поля ответа команды 0x11 "Запрос состояния ФР" (INFO_FIELDS).
+
+        :rtype: dict
+        """
+
+        result = dict(self.data['info'])
+        for name in DATE_FIELDS:
+            if result.get(name) is not None:
+                result[name] = datetime.datetime.strptime(result[name], DATE_FORMAT).date()
+        return result
+
+    def table(self, num):
+        """
+        Структура таблицы или None, если она не сохранена.
+
+        :rtype: pyshtrih.tables.Table
+        """
+
+        data = self.data['tables'].get(compat.unicode(num))
+        return None if data is None else load_table(num, data)
+
+    def matches(self, full_state):
+        """
+        Признак соответствия записи ответу команды 0x11 "Запрос состояния ФР".
+        """
+
+        return entry_key(full_state) == self.key
+
+    def __repr__(self):
+        return '{}(key={})'.format(type(self).__name__, self.key)
+
+
+class MetadataCache(object):
+    def __init__(self, path=METADATA_CACHE):
+        """
+        Постоянный кеш неизменяемых сведений о ККМ.
+
+        Для каждого экземпляра ККМ (заводской номер) и сборки ПО хранятся ответ команды 0xFC,
+        неизменяемые поля ответа команды 0x11 и структуры таблиц. Кроме того, хранится
+        последний ключ для каждого порта: при повторном подключении к порту (в т.ч. после
+        перезапуска приложения) выполняется только запрос 0x11 для сверки.
+
+        Соответствие записи устройству проверяется запросом 0x11 при каждом подключении
+        и по каждому следующему ответу команды 0x11 (см. pyshtrih.device.Device.verify_metadata):
+        при замене ККМ или обновлении ПО сведения сразу запрашиваются заново.
+
+            >>> cache = MetadataCache()
+            >>> device = ShtrihM01F(port, baudrate, metadata=cache)
+
+        :type path: str
+        :param path: путь к файлу кеша
+        """
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries, self.ports = self.load()
+
+    def load(self):
+        """
+        Чтение файла кеша. Поврежденный или отсутствующий файл считается пустым.
+
+        :rtype: tuple
+        :return: (ключ -> данные записи, порт -> ключ)
+        """
+
+        try:
+            with io.open(self.path, encoding='utf-8') as fd:
+                data = json.load(fd)
+            return dict(data['entries']), dict(data['ports'])
+        except (IOError, OSError, ValueError, TypeError, KeyError):
+            return {}, {}
+
+    def save(self):
+        """
+        Запись файла кеша. Ошибки записи игнорируются.
+        """
+
+        tmp = u'{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            with io.open(tmp, 'w', encoding='utf-8') as fd:
+                fd.write(compat.unicode(json.dumps({'entries': self.entries, 'ports': self.ports})))
+            if os.name == 'nt' and os.path.exists(self.path):
+                # на Windows os.rename не заменяет существующий файл
+                os.remove(self.path)
+            os.rename(tmp, self.path)
+        except (IOError, OSError):
+            pass
+
+    def lookup(self, port):
+        """
+        Запись для устройства, последним подключавшегося к порту.
+
+        :type port: str
+        :param port: порт
+
+        :rtype: Entry
+        :return: запись или None
+        """
+
+        with self.lock:
+            key = self.ports.get(port)
+            if key is None or key not in self.entries:
+                return None
+            return Entry(key, self.entries[key])
+
+    def store(self, port, model, full_state):
+        """
+        Сохранение сведений об устройстве и привязка его к порту.
+
+        :type port: str
+        :param port: порт
+        :type model: pyshtrih.protocol.Response
+        :param model: ответ команды 0xFC "Получить тип устройства"
+        :type full_state: pyshtrih.protocol.Response
+        :param full_state: ответ команды 0x11 "Запрос состояния ФР"
+
+        :rtype: Entry
+        """
+
+        info = {}
+        for name in INFO_FIELDS:
+            value = full_state[name]
+            info[name] = value.strftime(DATE_FORMAT) if name in DATE_FIELDS else value
+
+        key = entry_key(info)
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                data = self.entries[key] = {'tables': {}}
+            data['model'] = dict(model.params)
+            data['info'] = info
+            self.ports[port] = key
+            self.save()
+            return Entry(key, data)
+
+    def store_table(self, entry, table):
+        """
+        Сохранение структуры таблицы.
+
+        :type entry: Entry
+        :param entry: запись устройства
+        :type table: pyshtrih.tables.Table
+        :param table: структура таблицы
+        """
+
+        with self.lock:
+            data = self.entries.get(entry.key)
+            if data is None:
+                return
+            data['tables'][compat.unicode(table.num)] = dump_table(table)
+            self.save()
+
+    def forget(self, port):
+        """
+        Сброс привязки порта: при следующем подключении сведения запрашиваются у ККМ.
+        """
+
+        with self.lock:
+            if self.ports.pop(port, None) is not None:
+                self.save()
+
+    def invalidate(self, serial_number=None, build=None):
+        """
+        Удаление записей.
+
+        :type serial_number: int
+        :param serial_number: заводской номер (по умолчанию - все устройства)
+        :type build: int
+        :param build: сборка ПО ФР (по умолчанию - все сборки)
+        """
+
+        with self.lock:
+            for key in list(self.entries):
+                serial, _, key_build = key.partition(u':')
+                if serial_number is not None and serial != compat.unicode(serial_number):
+                    continue
+                if build is not None and key_build != compat.unicode(build):
+                    continue
+                del self.entries[key]
+
+            self.ports = {port: key for port, key in self.ports.items() if key in self.entries}
+            self.save()
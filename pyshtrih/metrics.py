@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+
+import bisect
+import threading
+
+
+# этапы обмена командой
+ENQ = u'enq'
+WRITE = u'write'
+ACK = u'ack'
+READ = u'read'
+PHASES = (ENQ, WRITE, ACK, READ)
+
+# счетчики
+NAKS = u'naks'
+LRC_ERRORS = u'lrc_errors'
+INCOMPLETE = u'incomplete'
+RETRIES = u'retries'
+NO_CONNECTION = u'no_connection'
+BYTES_IN = u'bytes_in'
+BYTES_OUT = u'bytes_out'
+COUNTERS = (NAKS, LRC_ERRORS, INCOMPLETE, RETRIES, NO_CONNECTION, BYTES_IN, BYTES_OUT)
+
+
+class Histogram(object):
+    # верхние границы интервалов, с
+    BOUNDS = (
+        0.0001, 0.00025, 0.0005,
+        0.001, 0.0025, 0.005,
+        0.01, 0.025, 0.05,
+        0.1, 0.25, 0.5,
+        1, 2.5, 5, 10
+    )
+
+    __slots__ = (
+        'buckets',
+        'count',
+        'total',
+        'min',
+        'max'
+    )
+
+    def __init__(self):
+        """
+        Гистограмма длительностей с логарифмическими интервалами.
+        """
+
+        # последний интервал - значения больше BOUNDS[-1]
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Оценка квантиля (верхняя граница интервала, в который попадает квантиль).
+
+        :type q: float
+        :param q: квантиль (0..1)
+
+        :rtype: float
+        """
+
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.BOUNDS, self.buckets):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        """
+        :rtype: dict
+        """
+
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': list(zip(self.BOUNDS + (None, ), self.buckets))
+        }
+
+
+class Metrics(object):
+    def __init__(self):
+        """
+        Метрики обмена с ККМ (см. pyshtrih.protocol.Protocol).
+
+        Длительности этапов обмена (PHASES) собираются в гистограммы по номерам команд,
+        счетчики (COUNTERS) - общие для протокола. Этап проверки связи при подключении
+        учитывается под номером команды None.
+
+            >>> metrics = Metrics()
+            >>> device = ShtrihM01F(port, baudrate, metrics=metrics)
+            >>> metrics.snapshot()
+        """
+
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        # команда, выполняемая в данный момент
+        self.cmd = None
+
+    def begin(self, cmd):
+        """
+        Начало обмена командой cmd.
+        """
+
+        self.cmd = cmd
+
+    def end(self):
+        """
+        Окончание обмена.
+        """
+
+        self.cmd = None
+
+    def phase(self, phase, value):
+        """
+        Учет длительности этапа обмена текущей командой.
+
+        :type phase: unicode
+        :param phase: этап (один из PHASES)
+        :type value: float
+        :param value: длительность, с
+        """
+
+        key = self.cmd, phase
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        histogram.add(value)
+
+    def incr(self, counter, value=1):
+        """
+        Увеличение счетчика.
+
+        :type counter: unicode
+        :param counter: счетчик (один из COUNTERS)
+        :type value: int
+        :param value: приращение
+        """
+
+        self.counters[counter] += value
+
+    def snapshot(self):
+        """
+        Снимок метрик.
+
+        :rtype: dict
+        :return: словарь с ключами counters (значения счетчиков) и commands
+                 (номер команды -> этап -> описание гистограммы)
+        """
+
+        with self.lock:
+            items = list(self.histograms.items())
+
+        commands = {}
+        for (cmd, phase), histogram in items:
+            commands.setdefault(cmd, {})[phase] = histogram.snapshot()
+
+        return {
+            'counters': dict(self.counters),
+            'commands': commands
+        }
+
+    def reset(self):
+        """
+        Сброс метрик.
+        """
+
+        with self.lock:
+            self.histograms = {}
+            self.counters = dict.fromkeys(COUNTERS, 0)
@@ -2,11 +2,12 @@
 
 
 import struct
+import binascii
 import operator
 import functools
 import collections
 
-from .compat import reduce, xrange
+from .compat import PY2, xrange
 
 
 NULL = bytearray((0x00, ))
@@ -39,7 +40,7 @@ def bytearray_concat(*args):
     Функция конкатенирования нескольких bytearray в один.
     """
 
-    return bytearray_cast(reduce(operator.concat, args))
+    return bytearray().join(args)
 
 
 def bytearray_strip(arg):
@@ -47,6 +48,9 @@ def bytearray_strip(arg):
     Функция отрезания нулевых байт от набора байт.
     """
 
+    if isinstance(arg, memoryview):
+        arg = bytearray(arg)
+
     return arg.strip(NULL)
 
 
@@ -67,22 +71,39 @@ class mslice(object):
         """
         Вызов.
 
-        :type arg: bytearray
+        :type arg: bytearray or memoryview
         :param arg: нарезаемый объект
 
         :rtype: bytearray
         :return: нарезанный объект
         """
 
-        return bytearray_concat(*(arg[s] for s in self.slices))
+        return bytearray().join([arg[s] for s in self.slices])
 
 
 def lrc(buff):
     """
-    Расчет контрольной суммы.
+    Расчет контрольной суммы (XOR всех байт).
+
+    Байты представляются одним большим целым числом, которое сворачивается
+    операцией XOR старшей половины с младшей до 8 байт, а затем сдвигами до одного байта.
     """
 
-    return reduce(operator.xor, buff)
+    size = len(buff)
+    if not size:
+        return 0
+
+    value = int(binascii.hexlify(buff), 16) if PY2 else int.from_bytes(buff, 'little')
+    while size > 8:
+        half = (size >> 1) << 3
+        value = (value >> half) ^ (value & ((1 << half) - 1))
+        size -= size >> 1
+
+    value ^= value >> 32
+    value ^= value >> 16
+    value ^= value >> 8
+
+    return value & 0xFF
 
 
 def encode(text):
@@ -98,6 +119,9 @@ def decode(text):
     Декодирование текста полученного с фискального регистратора.
     """
 
+    if isinstance(text, memoryview):
+        text = text.tobytes()
+
     return text.decode('cp1251')
 
 
@@ -375,3 +399,9 @@ UNCAST_SIZE = {
     )
     for size, fmt in CHAR_SIZE.items()
 }
+
+# обратное соответствие функции распаковки формату struct
+# и признаку возврата одного значения (а не кортежа)
+UNCAST_FORMAT = {
+    func: (CHAR_SIZE[size], len(size) == 1) for size, func in UNCAST_SIZE.items()
+}
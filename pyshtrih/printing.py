@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+
+from . import excepts
+from .compat import monotonic
+
+
+MODE_STR = u'Режим ФР'
+SUBMODE_STR = u'Подрежим ФР'
+
+# режим 12 - ФР печатает документ, подрежим при этом не информативен
+MODE_PRINTING = 12
+
+SUBMODE_IDLE = 0
+SUBMODE_PAPER_OUT = (1, 2)
+SUBMODE_WAIT_CONTINUE = 3
+
+# результаты разбора состояния (см. PrintTracker.handle_state)
+WAIT, DONE, CONTINUE = range(3)
+
+
+class PrintTracker(object):
+    # время печати одной строки, с
+    LINE_TIME = 0.02
+    MIN_POLL = 0.01
+    MAX_POLL = 0.5
+    BACKOFF = 2
+    # количество байт, передаваемых при запросе состояния (ENQ, кадры запроса и ответа, ACK)
+    STATE_BYTES = 28
+
+    # примерное количество строк, печатаемых командой
+    PRINT_LINES = {
+        # Печать строки
+        0x17: 1,
+        # Тестовый прогон
+        0x19: 10,
+        # Отрезка чека
+        0x25: 4,
+        # Протяжка
+        0x29: 1,
+        # Суточный отчет без гашения
+        0x40: 30,
+        # Суточный отчет с гашением
+        0x41: 40,
+        # Внесение
+        0x50: 8,
+        # Выплата
+        0x51: 8,
+        # Продажа
+        0x80: 2,
+        # Возврат продажи
+        0x82: 2,
+        # Закрытие чека
+        0x85: 6,
+        # Скидка
+        0x86: 1,
+        # Надбавка
+        0x87: 1,
+        # Аннулирование чека
+        0x88: 3,
+        # Повтор документа
+        0x8C: 12,
+        # Открыть чек
+        0x8D: 4,
+        # Отчеты ЭКЛЗ
+        0xA0: 20,
+        0xA2: 20,
+        # Продолжение печати
+        0xB0: 10,
+        # Печать графики
+        0xC1: 8,
+        # Печать штрих-кода
+        0xC2: 6,
+        # Открыть смену
+        0xE0: 4,
+        # Сформировать чек коррекции
+        0xFF36: 8,
+        # Сформировать отчёт о состоянии расчётов
+        0xFF38: 10,
+        # Открыть смену в ФН
+        0xFF0B: 4,
+        # Закрыть смену в ФН
+        0xFF43: 40
+    }
+
+    STATE_COMMANDS = (0x10, 0x11)
+
+    def __init__(self, baudrate=None, line_time=LINE_TIME, poll_time=MIN_POLL):
+        """
+        Отслеживание окончания печати документа.
+
+        Трекер получает ответы ККМ (см. pyshtrih.protocol.Protocol.listeners),
+        оценивает время печати по количеству строк, напечатанных последними командами,
+        и запоминает подрежим из последнего ответа на запрос состояния.
+        Если ККМ уже сообщила, что печать окончена, ожидание не требует обмена.
+
+        :type baudrate: int
+        :param baudrate: скорость взаимодействия с устройством (определяет минимальный
+                         интервал опроса - время обмена запросом состояния)
+        :type line_time: float
+        :param line_time: время печати одной строки, с
+        :type poll_time: float
+        :param poll_time: минимальный интервал между запросами состояния, с
+        """
+
+        self.baudrate = baudrate
+        self.line_time = line_time
+        self.poll_time = poll_time
+        # ККМ сообщила, что печать окончена, и с тех пор ничего не печатала
+        self.idle = False
+        # ожидаемое время окончания печати (по compat.monotonic)
+        self.finish = 0
+        self.paper_out = False
+
+    def __call__(self, cmd, response):
+        """
+        Обработка ответа ККМ.
+
+        :type cmd: int
+        :param cmd: номер команды
+        :type response: pyshtrih.protocol.Response
+        :param response: ответ ККМ
+        """
+
+        if cmd in self.STATE_COMMANDS:
+            self.idle = self.is_idle(response)
+        elif cmd in self.PRINT_LINES:
+            now = monotonic()
+            self.idle = False
+            self.finish = max(self.finish, now) + self.PRINT_LINES[cmd] * self.line_time
+
+    @staticmethod
+    def is_idle(state):
+        mode = state[MODE_STR]
+        submode = state[SUBMODE_STR]
+
+        return mode.num != MODE_PRINTING and submode.state == SUBMODE_IDLE
+
+    @property
+    def min_poll(self):
+        if self.baudrate:
+            return max(self.poll_time, self.STATE_BYTES * 10.0 / self.baudrate)
+        return self.poll_time
+
+    def estimate(self):
+        """
+        Оставшееся время печати по оценке.
+
+        :rtype: float
+        """
+
+        return max(self.finish - monotonic(), 0)
+
+    def delays(self, timeout=None):
+        """
+        Интервалы между запросами состояния.
+
+        Первый интервал равен оставшемуся времени печати по оценке, далее интервал
+        увеличивается в BACKOFF раз, но не более MAX_POLL.
+
+        :type timeout: float
+        :param timeout: максимальное время ожидания, None - без ограничения
+
+        :raises pyshtrih.excepts.PrintTimeoutError: по истечении timeout
+        """
+
+        deadline = None if timeout is None else monotonic() + timeout
+
+        delay = max(self.estimate(), self.min_poll)
+        while True:
+            if deadline is not None:
+                left = deadline - monotonic()
+                if left <= 0:
+                    raise excepts.PrintTimeoutError(
+                        u'Печать не окончена за {} с'.format(timeout)
+                    )
+                delay = min(delay, left)
+
+            yield delay
+            delay = max(self.estimate(), min(delay * self.BACKOFF, self.MAX_POLL))
+
+    def handle_state(self, state, paper_out=None):
+        """
+        Разбор ответа на запрос состояния.
+
+        :type state: pyshtrih.protocol.Response
+        :param state: ответ на запрос состояния
+        :param paper_out: callable объект, вызываемый с ответом state
+                          один раз при обнаружении отсутствия бумаги
+
+        :rtype: int
+        :return: WAIT, DONE или CONTINUE (необходимо выполнить команду продолжения печати)
+        """
+
+        if state[MODE_STR].num == MODE_PRINTING:
+            return WAIT
+
+        submode = state[SUBMODE_STR].state
+        if submode in SUBMODE_PAPER_OUT:
+            if not self.paper_out and paper_out:
+                paper_out(state)
+            self.paper_out = True
+            return WAIT
+
+        self.paper_out = False
+        if submode == SUBMODE_IDLE:
+            return DONE
+        if submode == SUBMODE_WAIT_CONTINUE:
+            return CONTINUE
+
+        return WAIT
+
+    def wait(self, device, timeout=None, paper_out=None):
+        """
+        Ожидание окончания печати документа.
+
+        :type device: pyshtrih.device.Device
+        :param device: устройство
+        :type timeout: float
+        :param timeout: максимальное время ожидания, None - без ограничения
+        :param paper_out: callable объект, вызываемый с ответом state
+                          один раз при обнаружении отсутствия бумаги
+
+        :raises pyshtrih.excepts.PrintTimeoutError: по истечении timeout
+        """
+
+        if self.idle:
+            return
+
+        for delay in self.delays(timeout):
+            time.sleep(delay)
+
+            action = self.handle_state(device.state(fresh=True), paper_out)
+            if action == DONE:
+                return
+            if action == CONTINUE:
+                device.continue_print()
@@ -1,12 +1,11 @@
 # -*- coding: utf-8 -*-
 
 
-import serial
 import unilog
 
-from . import misc, excepts
-from .compat import unicode, xrange, str_compat
-from .handlers import commands as hc
+from . import misc, excepts, metrics as mt, transport as tr
+from .compat import unicode, xrange, memoryview, monotonic, str_compat
+from .handlers import commands as hc, decoders as hd
 
 
 STX = bytearray((0x02, ))  # START OF TEXT - начало текста
@@ -15,11 +14,190 @@ ACK = bytearray((0x06, ))  # ACKNOWLEDGE - положительное подтв
 NAK = bytearray((0x15, ))  # NEGATIVE ACKNOWLEDGE - отрицательное подтверждение
 
 
+def build_frame(cmd, params):
+    """
+    Функция формирования кадра команды.
+
+    :type cmd: int
+    :param cmd: номер команды
+    :type params: bytearray
+    :param params: набор параметров команды
+
+    :rtype: bytearray
+    :return: кадр команды (STX, длина, команда, параметры, LRC)
+    """
+
+    cmd_bytes = misc.CAST_CMD[len(misc.int_to_bytes(cmd))](cmd)
+    size = len(cmd_bytes) + len(params)
+
+    frame = bytearray(size + 3)
+    frame[0] = ord(STX)
+    frame[1] = size
+    frame[2:2 + len(cmd_bytes)] = cmd_bytes
+    frame[2 + len(cmd_bytes):-1] = params
+    frame[-1] = misc.lrc(memoryview(frame)[1:-1])
+
+    return frame
+
+
+def frame_cmd(frame):
+    """
+    Функция получения номера команды из кадра.
+
+    :type frame: bytearray
+    :param frame: кадр команды (STX, длина, команда, параметры, LRC)
+
+    :rtype: int
+    """
+
+    if frame[2] == 0xFF:
+        return misc.bytes_to_int((frame[3], frame[2]))
+    return frame[2]
+
+
+def payload_cmd(payload):
+    """
+    Функция получения номера команды из полезной нагрузки ответа.
+
+    :type payload: bytearray
+    :param payload: полезная нагрузка ответа (команда, код ошибки, параметры)
+
+    :rtype: int
+    """
+
+    if payload[0] == 0xFF and len(payload) > 1:
+        return (payload[0] << 8) | payload[1]
+    return payload[0]
+
+
+def is_response(payload, cmd):
+    """
+    Функция проверки, что полезная нагрузка является ответом на команду cmd.
+
+    :type payload: bytearray
+    :param payload: полезная нагрузка ответа
+    :type cmd: int
+    :param cmd: номер команды или None
+
+    :rtype: bool
+    """
+
+    return cmd is not None and bool(payload) and payload_cmd(payload) == cmd
+
+
+class FrameReader(object):
+    def __init__(self, transport, metrics=None):
+        """
+        Класс буферизированного чтения ответов ККМ.
+
+        Читает из транспорта все доступные байты за один вызов и разбирает кадры
+        (STX, длина, полезная нагрузка, LRC) из переиспользуемого буфера.
+
+        :type transport: pyshtrih.transport.Transport
+        :param transport: транспорт
+        :type metrics: pyshtrih.metrics.Metrics
+        :param metrics: метрики обмена
+        """
+
+        self.transport = transport
+        self.metrics = metrics
+        self.buffer = bytearray()
+
+    def fill(self, size):
+        """
+        Метод дочитывания данных в буфер.
+
+        :type size: int
+        :param size: необходимое количество байт в буфере
+
+        :rtype: bool
+        :return: False, если данные не были получены до истечения таймаута
+        """
+
+        buffer = self.buffer
+        while len(buffer) < size:
+            chunk = self.transport.read(max(size - len(buffer), self.transport.in_waiting))
+            if not chunk:
+                return False
+            buffer.extend(chunk)
+            if self.metrics:
+                self.metrics.incr(mt.BYTES_IN, len(chunk))
+
+        return True
+
+    def read_byte(self):
+        """
+        Метод чтения одного байта.
+
+        :rtype: bytes
+        :return: прочитанный байт или пустая строка в случае таймаута
+        """
+
+        if not self.fill(1):
+            return bytes()
+
+        byte = bytes(self.buffer[:1])
+        del self.buffer[:1]
+        return byte
+
+    def read_frame(self):
+        """
+        Метод чтения кадра ответа ККМ.
+
+        :rtype: bytearray
+        :return: полезная нагрузка кадра или None, если кадр получен не полностью
+                 или не совпала контрольная сумма
+        """
+
+        buffer = self.buffer
+        if not self.fill(1) or buffer[0] != STX[0]:
+            self.reset()
+            raise excepts.NoConnectionError()
+
+        if not self.fill(2) or not self.fill(buffer[1] + 3):
+            self.reset()
+            if self.metrics:
+                self.metrics.incr(mt.INCOMPLETE)
+            return
+
+        end = buffer[1] + 2
+
+        payload = buffer[2:end]
+        valid = misc.lrc(buffer[1:end]) == buffer[end]
+        del buffer[:end + 1]
+
+        if not valid and self.metrics:
+            self.metrics.incr(mt.LRC_ERRORS)
+
+        return payload if valid else None
+
+    def drain(self):
+        """
+        Метод вычитывания из порта всех данных до истечения таймаута.
+        """
+
+        self.reset()
+        while True:
+            chunk = self.transport.read(max(1, self.transport.in_waiting))
+            if not chunk:
+                break
+            if self.metrics:
+                self.metrics.incr(mt.BYTES_IN, len(chunk))
+
+    def reset(self):
+        """
+        Метод очистки буфера.
+        """
+
+        del self.buffer[:]
+
+
 class Protocol(object):
     MAX_ATTEMPTS = 10
     CHECK_NUM = 3
 
-    def __init__(self, port, baudrate, timeout, fs=False):
+    def __init__(self, port, baudrate, timeout, fs=False, session=False, transport=None, lazy=False, journal=None,
+                 metrics=None):
         """
         Класс описывающий протокол взаимодействия в устройством.
 
@@ -31,18 +209,48 @@ class Protocol(object):
         :param timeout: время таймаута ответа устройства
         :type fs: bool
         :param fs: признак наличия ФН (фискальный накопитель)
+        :type session: bool
+        :param session: сессионный режим - проверка связи (ENQ) выполняется
+                        только при подключении и после ошибки обмена
+        :type transport: pyshtrih.transport.Transport
+        :param transport: транспорт взаимодействия с устройством,
+                          по умолчанию - последовательный порт port
+        :type lazy: bool
+        :param lazy: возвращать LazyResponse, разбирающий поля ответа при первом обращении
+        :type journal: pyshtrih.journal.Journal
+        :param journal: журнал обмена для восстановления после сбоя
+        :type metrics: pyshtrih.metrics.Metrics
+        :param metrics: метрики обмена (длительности этапов по командам, счетчики ошибок и байт)
         """
 
-        self.port = port
-        self.serial = serial.Serial(
-            baudrate=baudrate,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            timeout=timeout,
-            writeTimeout=timeout
-        )
+        self.transport = transport or tr.SerialTransport(port, baudrate, timeout)
+        self.metrics = metrics
+        self.reader = FrameReader(self.transport, metrics)
         self.fs = fs
+        self.session = session
+        self.lazy = lazy
+        self.journal = journal
+        self.set_context(hd.DEFAULT_CONTEXT._replace(fs=fs))
+        # callable объекты, вызываемые с номером команды и ответом после каждого успешного обмена
+        self.listeners = []
+        # callable объекты, вызываемые с кадром команды перед его отправкой
+        self.senders = []
         self.connected = False
+        # признак того, что ККМ ожидает команду (последний обмен завершился успешно)
+        self.synced = False
+
+    @property
+    def port(self):
+        return self.transport.port
+
+    @port.setter
+    def port(self, port):
+        self.transport.port = port
+
+    @property
+    def serial(self):
+        # оставлено для обратной совместимости
+        return self.transport
 
     def connect(self):
         """
@@ -50,11 +258,10 @@ class Protocol(object):
         """
 
         if not self.connected:
-            self.serial.port = self.port
-            if not self.serial.isOpen():
+            if not self.transport.is_open:
                 try:
-                    self.serial.open()
-                except serial.SerialException as exc:
+                    self.transport.open()
+                except tr.TransportError as exc:
                     raise excepts.NoConnectionError(
                         u'Не удалось открыть порт {} ({})'.format(
                             self.port, exc
@@ -66,7 +273,7 @@ class Protocol(object):
                     self.connected = True
                     return
             else:
-                self.serial.close()
+                self.transport.close()
                 raise excepts.NoConnectionError()
 
     def disconnect(self):
@@ -75,37 +282,96 @@ class Protocol(object):
         """
 
         if self.connected:
-            self.serial.close()
+            self.transport.close()
             self.connected = False
+            self.synced = False
 
-    def init(self):
+    def init(self, expected=None):
         """
         Метод инициализации устройства перед отправкой команды.
+
+        :type expected: int
+        :param expected: номер команды, кадр которой отправлен, но прием которого
+                         не подтвержден ККМ (ACK потерян или не получен)
+
+        :rtype: bool or bytearray
+        :return: True, если ККМ готова принять команду, False в случае неожиданного ответа,
+                 или полезная нагрузка ответа на команду expected, если ККМ ее уже выполнила
         """
 
+        started = monotonic() if self.metrics else None
         try:
-            self.serial.write(ENQ)
-            byte = self.serial.read()
+            self.write(ENQ)
+            byte = self.reader.read_byte()
             if not byte:
                 raise excepts.NoConnectionError()
 
             if byte == NAK:
-                pass
+                self.synced = True
             elif byte == ACK:
-                self.handle_response()
+                payload = self.read_response(expected)
+                if is_response(payload, expected):
+                    return payload
+                self.handle_payload(payload)
             else:
-                while self.serial.read():
-                    pass
+                self.reader.drain()
                 return False
 
             return True
 
-        except serial.SerialTimeoutException:
-            self.serial.flushOutput()
+        except tr.WriteTimeoutError:
+            self.transport.flush_output()
             raise excepts.ProtocolError(u'Не удалось записать байт в ККМ')
-        except serial.SerialException as exc:
-            self.serial.flushInput()
+        except tr.TransportError as exc:
+            self.flush_input()
             raise excepts.ProtocolError(unicode(exc))
+        finally:
+            if started is not None:
+                self.metrics.phase(mt.ENQ, monotonic() - started)
+
+    def write(self, data):
+        """
+        Метод записи байт в транспорт.
+        """
+
+        self.transport.write(data)
+        if self.metrics:
+            self.metrics.incr(mt.BYTES_OUT, len(data))
+
+    def write_frame(self, command):
+        """
+        Метод записи кадра команды и чтения подтверждения.
+
+        :type command: bytearray
+        :param command: кадр команды
+
+        :rtype: bytes
+        :return: ответный байт (ACK, NAK) или пустая строка в случае таймаута
+        """
+
+        if not self.metrics:
+            self.transport.write(command)
+            return self.reader.read_byte()
+
+        started = monotonic()
+        self.write(command)
+        written = monotonic()
+        byte = self.reader.read_byte()
+
+        self.metrics.phase(mt.WRITE, written - started)
+        self.metrics.phase(mt.ACK, monotonic() - written)
+        if byte == NAK:
+            self.metrics.incr(mt.NAKS)
+
+        return byte
+
+    def flush_input(self):
+        """
+        Метод очистки входного буфера порта и буфера чтения кадров.
+        """
+
+        self.reader.reset()
+        self.transport.flush_input()
 
     def handle_response(self):
         """
@@ -115,22 +381,42 @@ class Protocol(object):
         :return: ответ ККМ в виде словаря
         """
 
-        for _ in xrange(self.MAX_ATTEMPTS):
-            stx = self.serial.read()
-            if stx != STX:
-                raise excepts.NoConnectionError()
+        return self.handle_payload(self.read_response())
+
+    def read_response(self, expected=None):
+        """
+        Метод чтения кадра ответа ККМ с подтверждением приема.
+
+        :type expected: int
+        :param expected: номер команды, прием кадра которой не был подтвержден ККМ:
+                         ответ на нее записывается в журнал вместе с подтверждением
 
-            length = self.serial.read()
-            payload = self.serial.read(misc.UNCAST_SIZE['1'](length))
-            _lrc = misc.UNCAST_SIZE['1'](self.serial.read())
+        :rtype: bytearray
+        :return: полезная нагрузка ответа
+        """
 
-            if misc.lrc(misc.bytearray_concat(length, payload)) == _lrc:
-                self.serial.write(ACK)
-                return self.handle_payload(payload)
+        started = monotonic() if self.metrics else None
+        for _ in xrange(self.MAX_ATTEMPTS):
+            payload = self.reader.read_frame()
+
+            if payload is not None:
+                if started is not None:
+                    self.metrics.phase(mt.READ, monotonic() - started)
+                if self.journal:
+                    if is_response(payload, expected):
+                        self.journal.acked()
+                    self.journal.received(payload)
+                self.write(ACK)
+                if self.journal:
+                    self.journal.settle()
+                self.synced = True
+                return payload
             else:
-                self.serial.write(NAK)
-                self.serial.write(ENQ)
-                byte = self.serial.read()
+                if self.metrics:
+                    self.metrics.incr(mt.RETRIES)
+                self.write(NAK)
+                self.write(ENQ)
+                byte = self.reader.read_byte()
                 if byte != ACK:
                     raise excepts.UnexpectedResponseError(u'Получен байт 0x{:02X}, ожидался ACK'.format(ord(byte)))
         else:
@@ -147,7 +433,8 @@ class Protocol(object):
         :return: набор параметров в виде словаря
         """
 
-        payload = misc.bytearray_cast(payload)
+        # поля разбираются из срезов memoryview без копирования
+        payload = memoryview(misc.bytearray_cast(payload))
 
         # предполагаем, что команда однобайтная
         cmd_len = 1
@@ -162,24 +449,53 @@ class Protocol(object):
             raise excepts.UnexpectedResponseError(u'Не удалось получить байт(ы) команды из ответа')
 
         response = payload[slice(cmd_len, None)]
-        handler = hc.HANDLERS.get(cmd)
-
-        if handler:
-            result = {}
-            for _slice, func, name in handler:
-                chunk = _slice(response) if isinstance(_slice, misc.mslice) else response[_slice]
-                if chunk and name is None:
-                    result.update(func(chunk))
-                elif chunk:
-                    result[name] = func(chunk) if func else chunk
-                else:
-                    result[name] = None
+        decoder = self.decoders.get(cmd)
+
+        if decoder and self.lazy:
+            # ответ без кода ошибки (неполный) - ошибка, как и при полном разборе
+            error = decoder.field(hc.ERROR_CODE_STR, response)
+            if error != 0:
+                raise excepts.Error(cmd, error, fs=self.fs)
+
+            return self.notify(cmd, LazyResponse(cmd, decoder, response))
+
+        elif decoder:
+            result = decoder(response)
 
             error = result.get(hc.ERROR_CODE_STR, 0)
             if error != 0:
                 raise excepts.Error(cmd, error, fs=self.fs)
 
-            return Response(cmd, result)
+            return self.notify(cmd, Response(cmd, result))
+
+        return misc.bytearray_cast(response)
+
+    def set_context(self, context):
+        """
+        Метод установки контекста разбора ответов (модель, сборка ПО, наличие ФН).
+
+        :type context: pyshtrih.handlers.decoders.Context
+        :param context: контекст разбора ответов
+        """
+
+        self.context = context
+        self.decoders = hd.decoders(context)
+
+    def notify(self, cmd, response):
+        """
+        Передача успешного ответа ККМ слушателям.
+
+        :type cmd: int
+        :param cmd: номер команды
+        :type response: Response
+        :param response: ответ ККМ
+
+        :rtype: Response
+        :return: ответ ККМ
+        """
+
+        for listener in self.listeners:
+            listener(cmd, response)
 
         return response
 
@@ -199,33 +515,122 @@ class Protocol(object):
         if not isinstance(params, bytearray):
             raise TypeError(u'{} expected, got {} instead'.format(bytearray, type(params)))
 
-        cmd_len = len(misc.int_to_bytes(cmd))
-        buff = misc.bytearray_concat(
-            misc.CAST_SIZE['1'](cmd_len + len(params)),
-            misc.CAST_CMD[cmd_len](cmd),
-            params
-        )
-        command = misc.bytearray_concat(STX, buff, misc.CAST_SIZE['1'](misc.lrc(buff)))
+        return self.command_frame(build_frame(cmd, params))
+
+    def command_frame(self, command):
+        """
+        Метод отправки готового кадра команды (см. pyshtrih.encoders).
+
+        :type command: bytearray
+        :param command: кадр команды (STX, длина, команда, параметры, LRC)
+
+        :rtype: dict
+        :return: набор параметров ответа в виде словаря
+        """
+
+        for sender in self.senders:
+            sender(command)
+
+        if self.journal is None and self.metrics is None:
+            return self.send_frame(command)
+
+        if self.metrics:
+            self.metrics.begin(frame_cmd(command))
+
+        try:
+            return self.send_frame(command)
+        except excepts.Error:
+            # ответ с ошибкой уже записан в журнал
+            raise
+        except excepts.ProtocolError as exc:
+            if self.metrics and isinstance(exc, excepts.NoConnectionError):
+                self.metrics.incr(mt.NO_CONNECTION)
+            if self.journal:
+                self.journal.failed(exc)
+            raise
+        finally:
+            if self.metrics:
+                self.metrics.end()
+
+    def send_frame(self, command):
+        """
+        Метод отправки кадра с проверкой связи и повторами.
+
+        :type command: bytearray
+        :param command: кадр команды
 
-        for r in self.check(self.CHECK_NUM):
-            if not r:
-                continue
+        :rtype: dict
+        :return: набор параметров ответа в виде словаря
+        """
+
+        # кадр записывается в журнал один раз, после проверки связи
+        # (ответ на предыдущую команду, полученный при проверке, относится к предыдущему кадру)
+        recorded = False
+        # номер команды, если кадр отправлен, но его прием не подтвержден: при потере ACK
+        # ККМ выполняет команду и возвращает ответ на ENQ, повторная отправка выполнила бы ее дважды
+        expected = None
+
+        if self.session and self.synced:
+            # быстрый путь: ККМ ожидает команду, проверку связи не выполняем
+            self.synced = False
+            if self.journal:
+                self.journal.sent(command)
+                recorded = True
+            try:
+                byte = self.write_frame(command)
+            except tr.WriteTimeoutError:
+                self.transport.flush_output()
+                raise excepts.ProtocolError(u'Не удалось записать байт в ККМ')
+            except tr.TransportError as exc:
+                self.flush_input()
+                raise excepts.ProtocolError(unicode(exc))
+
+            if byte == ACK:
+                if self.journal:
+                    self.journal.acked()
+                return self.handle_response()
+            # NAK или таймаут - восстанавливаем обмен через ENQ
+            expected = frame_cmd(command)
+
+        if self.transport is None:
+            raise excepts.ProtocolError(u'Необходимо вначале выполнить метод connect()')
 
-            for _ in xrange(self.MAX_ATTEMPTS):
+        for _ in xrange(self.CHECK_NUM):
+            r = self.init(expected)
+            for attempt in xrange(self.MAX_ATTEMPTS):
+                if attempt:
+                    if self.metrics:
+                        self.metrics.incr(mt.RETRIES)
+                    # кадр повторяется, только если ККМ ответила на ENQ готовностью (NAK)
+                    r = self.init(expected)
+                if r is not True:
+                    break
+
+                self.synced = False
+                if self.journal and not recorded:
+                    self.journal.sent(command)
+                    recorded = True
                 try:
-                    self.serial.write(command)
-                    byte = self.serial.read()
+                    byte = self.write_frame(command)
                     if byte == ACK:
+                        if self.journal:
+                            self.journal.acked()
                         return self.handle_response()
 
-                except serial.SerialTimeoutException:
-                    self.serial.flushOutput()
+                except tr.WriteTimeoutError:
+                    self.transport.flush_output()
                     raise excepts.ProtocolError(u'Не удалось записать байт в ККМ')
-                except serial.SerialException as exc:
-                    self.serial.flushInput()
+                except tr.TransportError as exc:
+                    self.flush_input()
                     raise excepts.ProtocolError(unicode(exc))
+
+                expected = frame_cmd(command)
             else:
                 raise excepts.NoConnectionError()
+
+            if r:
+                # ККМ выполнила команду, ответ получен при проверке связи
+                return self.handle_payload(r)
         else:
             raise excepts.NoConnectionError()
 
@@ -260,7 +665,7 @@ class Protocol(object):
         :param quiet: подавление исключений
         """
 
-        if self.serial is None:
+        if self.transport is None:
             raise excepts.ProtocolError(u'Необходимо вначале выполнить метод connect()')
 
         if count < 1:
@@ -312,3 +717,60 @@ class Response(object):
         )
 
     __repr__ = __str__
+
+
+class LazyResponse(Response):
+    __slots__ = (
+        'decoder',
+        'payload',
+        'cache',
+        'complete'
+    )
+
+    def __init__(self, cmd, decoder, payload):
+        """
+        Класс ответа ККМ, разбирающий поля при первом обращении.
+
+        :type cmd: int
+        :param cmd: номер команды
+        :type decoder: pyshtrih.handlers.decoders.Decoder
+        :param decoder: разборщик ответа команды
+        :type payload: memoryview
+        :param payload: ответ ККМ без байт команды
+        """
+
+        self.cmd = cmd
+        self.cmd_name = hc.COMMANDS[cmd]
+        self.decoder = decoder
+        self.payload = payload
+        self.cache = {}
+        self.complete = False
+
+    @property
+    def params(self):
+        if not self.complete:
+            params = self.decoder(self.payload)
+            # уже разобранные поля сохраняют свои значения
+            params.update(self.cache)
+            self.cache = params
+            self.complete = True
+
+        return self.cache
+
+    def __getitem__(self, item):
+        try:
+            return self.cache[item]
+        except KeyError:
+            if self.complete:
+                raise
+
+        try:
+            value = self.decoder.field(item, self.payload)
+        except KeyError:
+            return self.params[item]
+
+        self.cache[item] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.cache[key] = value
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+
+import collections
+
+from . import misc, excepts, encoders, journal
+from .compat import monotonic
+
+
+# команда регистрации позиции для типа чека (0 - продажа, 2 - возврат продажи)
+ITEM_COMMANDS = {
+    0: 0x80,
+    2: 0x82
+}
+
+MAX_MONEY = 2 ** 40 - 1
+MAX_DEPARTMENT = 16
+MAX_TAX = 4
+
+# этапы чека (ключи Receipt.timings)
+OPEN, ITEMS, CLOSE, TOTAL = u'open', u'items', u'close', u'total'
+
+
+class Receipt(object):
+    def __init__(self, check_type=0):
+        """
+        Чек, выполняемый как единая последовательность команд.
+
+        Позиции и оплата проверяются до обмена с ККМ, кадры всех команд формируются заранее,
+        ожидание окончания печати выполняется один раз - перед открытием чека.
+
+            >>> receipt = Receipt()
+            >>> receipt.sale(u'Хлеб', 1000, 4500).sale(u'Молоко', 2000, 7000)
+            >>> receipt.close(cash=20000)
+            >>> receipt.execute(device)
+
+        :type check_type: int
+        :param check_type: тип чека: 0 - продажа, 2 - возврат продажи
+        """
+
+        if check_type not in ITEM_COMMANDS:
+            raise ValueError(
+                u'Тип чека должен быть одним из {}'.format(', '.join(str(t) for t in sorted(ITEM_COMMANDS)))
+            )
+
+        self.check_type = check_type
+        # (номер команды, параметры команды)
+        self.items = []
+        self.payment = None
+
+        self.timings = collections.OrderedDict()
+        self.responses = []
+
+    @staticmethod
+    def check_money(value, name):
+        if not 0 <= value <= MAX_MONEY:
+            raise ValueError(u'{} должно быть в диапазоне 0..{}, получено {}'.format(name, MAX_MONEY, value))
+
+    @staticmethod
+    def check_taxes(taxes):
+        if len(taxes) != 4:
+            raise ValueError(u'Ожидалось 4 налоговые группы, получено {}'.format(len(taxes)))
+        for tax in taxes:
+            if not 0 <= tax <= MAX_TAX:
+                raise ValueError(u'Номер налоговой группы должен быть в диапазоне 0..{}'.format(MAX_TAX))
+
+    @staticmethod
+    def check_text(text):
+        if text:
+            try:
+                misc.encode(text)
+            except UnicodeError:
+                raise ValueError(u'Текст не может быть передан в ККМ: {}'.format(text))
+
+    def sale(self, text, quantity, price, department_num=0, taxes=(0, 0, 0, 0)):
+        """
+        Добавить позицию.
+
+        :type text: unicode
+        :param text: наименование
+        :type quantity: int
+        :param quantity: количество (в тысячных долях)
+        :type price: int
+        :param price: цена (в копейках)
+        :type department_num: int
+        :param department_num: номер отдела
+        :type taxes: tuple
+        :param taxes: номера налоговых групп (4 значения)
+
+        :rtype: Receipt
+        :return: чек
+        """
+
+        self.check_money(quantity, u'Количество')
+        if not quantity:
+            raise ValueError(u'Количество должно быть больше нуля')
+        self.check_money(price, u'Цена')
+        if not 0 <= department_num <= MAX_DEPARTMENT:
+            raise ValueError(u'Номер отдела должен быть в диапазоне 0..{}'.format(MAX_DEPARTMENT))
+        self.check_taxes(taxes)
+        self.check_text(text)
+
+        self.items.append(
+            (ITEM_COMMANDS[self.check_type], (quantity, price, department_num) + tuple(taxes) + (text, ))
+        )
+        return self
+
+    def discount(self, sum_, taxes=(0, 0, 0, 0), text=None):
+        """
+        Добавить скидку.
+
+        :rtype: Receipt
+        :return: чек
+        """
+
+        return self.adjustment(0x86, sum_, taxes, text)
+
+    def allowance(self, sum_, taxes=(0, 0, 0, 0), text=None):
+        """
+        Добавить надбавку.
+
+        :rtype: Receipt
+        :return: чек
+        """
+
+        return self.adjustment(0x87, sum_, taxes, text)
+
+    def adjustment(self, cmd, sum_, taxes, text):
+        if not self.items:
+            raise ValueError(u'Скидка и надбавка возможны только после позиции')
+
+        self.check_money(sum_, u'Сумма')
+        self.check_taxes(taxes)
+        self.check_text(text)
+
+        self.items.append((cmd, (sum_, ) + tuple(taxes) + (text, )))
+        return self
+
+    def close(self, cash=0, payment_type2=0, payment_type3=0, payment_type4=0, discount_allowance=0,
+              taxes=(0, 0, 0, 0), text=None):
+        """
+        Задать оплату (параметры соответствуют pyshtrih.commands.close_check).
+
+        :rtype: Receipt
+        :return: чек
+        """
+
+        for value in (cash, payment_type2, payment_type3, payment_type4):
+            self.check_money(value, u'Сумма оплаты')
+        if not -9999 <= discount_allowance <= 9999:
+            raise ValueError(u'Скидка/надбавка на чек должна быть в диапазоне -99.99..99.99%')
+        self.check_taxes(taxes)
+        self.check_text(text)
+
+        self.payment = (cash, payment_type2, payment_type3, payment_type4, discount_allowance) + \
+            tuple(taxes) + (text, )
+        return self
+
+    def frames(self, device):
+        """
+        Формирование кадров всех команд чека.
+
+        :type device: pyshtrih.device.Device
+        :param device: устройство
+
+        :rtype: tuple
+        :return: (кадр открытия чека, список кадров позиций, кадр закрытия чека)
+        """
+
+        if not self.items:
+            raise ValueError(u'Чек не содержит позиций')
+        if self.payment is None:
+            raise ValueError(u'Не задана оплата (метод close)')
+
+        length = device.DEFAULT_MAX_LENGTH
+        password = device.password
+
+        return (
+            encoders.ENCODERS[0x8D](password, self.check_type),
+            [encoders.ENCODERS[cmd](password, *params, length=length) for cmd, params in self.items],
+            encoders.ENCODERS[0x85](password, *self.payment, length=length)
+        )
+
+    def execute(self, device, recovery=None):
+        """
+        Выполнение чека.
+
+        Время выполнения этапов сохраняется в timings (ключи OPEN, ITEMS, CLOSE, TOTAL),
+        ответы ККМ - в responses, в том числе при ошибке.
+
+        :type device: pyshtrih.device.Device
+        :param device: устройство
+        :type recovery: pyshtrih.journal.Recovery
+        :param recovery: результат восстановления после сбоя (см. pyshtrih.journal.recover):
+                         если чек открыт, уже выполненные команды не повторяются,
+                         если чек закрыт, возвращается ответ на его закрытие
+
+        :rtype: pyshtrih.protocol.Response
+        :return: ответ на команду закрытия чека
+
+        :raises pyshtrih.excepts.OpenCheckError: ошибка открытия чека
+        :raises pyshtrih.excepts.ItemSaleError: ошибка регистрации позиции, скидки или надбавки
+                                                (номер позиции - в атрибуте item)
+        :raises pyshtrih.excepts.CloseCheckError: ошибка закрытия чека
+        """
+
+        open_frame, item_frames, close_frame = self.frames(device)
+        command = device.protocol.command_frame
+
+        self.timings.clear()
+        del self.responses[:]
+
+        offset = 0
+        if recovery is not None and recovery.state in (journal.OPEN, journal.CLOSED):
+            executed = [bytes(frame) for frame in recovery.executed if journal.frame_cmd(frame) != journal.OPEN_CHECK]
+            if [bytes(frame) for frame in item_frames[:len(executed)]] != executed or \
+                    recovery.state == journal.CLOSED and len(executed) != len(item_frames):
+                raise ValueError(u'Чек из журнала не соответствует выполняемому чеку')
+
+            if recovery.state == journal.CLOSED:
+                return recovery.response
+
+            open_frame = None
+            item_frames = item_frames[len(executed):]
+            offset = len(executed)
+
+        started = monotonic()
+
+        try:
+            try:
+                if open_frame is not None:
+                    device.wait_printing()
+                    self.responses.append(command(open_frame))
+            except excepts.Error as exc:
+                raise excepts.OpenCheckError(exc)
+            finally:
+                self.timings[OPEN] = monotonic() - started
+
+            stage = monotonic()
+            try:
+                for index, frame in enumerate(item_frames, offset):
+                    try:
+                        self.responses.append(command(frame))
+                    except excepts.Error as exc:
+                        error = excepts.ItemSaleError(exc)
+                        error.item = index
+                        raise error
+            finally:
+                self.timings[ITEMS] = monotonic() - stage
+
+            stage = monotonic()
+            try:
+                response = command(close_frame)
+                self.responses.append(response)
+            except excepts.ProtocolError as exc:
+                raise excepts.CloseCheckError(exc)
+            finally:
+                self.timings[CLOSE] = monotonic() - stage
+        finally:
+            self.timings[TOTAL] = monotonic() - started
+
+        return response
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return '{}(check_type={}, items={})'.format(type(self).__name__, self.check_type, len(self.items))
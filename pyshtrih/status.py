@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+
+import threading
+
+from .protocol import frame_cmd
+from .compat import monotonic
+
+
+class Flight(object):
+    __slots__ = (
+        'event',
+        'response',
+        'error'
+    )
+
+    def __init__(self):
+        """
+        Запрос, выполняемый в данный момент (ответ получат все ожидающие его вызовы).
+        """
+
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class StatusCache(object):
+    def __init__(self, ttl=0, readonly=()):
+        """
+        Кеш ответов на запросы состояния ККМ (0x10 "Короткий запрос состояния ФР",
+        0xFF01 "Запрос статуса ФН" и т.п.).
+
+        Ответ используется повторно в течение ttl секунд с момента отправки запроса.
+        Одновременные вызовы из разных потоков ожидают ответа на один запрос.
+        Кеш сбрасывается при отправке любой команды, не входящей в readonly
+        (метод sent вызывается протоколом перед отправкой кадра).
+
+        Ответы разделяются между вызывающими, изменять их не следует.
+
+        :type ttl: float
+        :param ttl: время жизни ответа, с (0 - без кеширования)
+        :type readonly: collections.Iterable
+        :param readonly: номера команд, не изменяющих состояние ККМ
+        """
+
+        self.ttl = ttl
+        self.readonly = frozenset(readonly)
+
+        self.lock = threading.Lock()
+        # номер команды -> (время отправки запроса, ответ)
+        self.values = {}
+        # номер команды -> Flight
+        self.flights = {}
+        # увеличивается при каждом сбросе кеша
+        self.generation = 0
+
+    def get(self, cmd, fresh, fetch, *args):
+        """
+        Ответ на запрос состояния.
+
+        :type cmd: int
+        :param cmd: номер команды
+        :type fresh: bool
+        :param fresh: выполнить запрос в обход кеша (ответ сохраняется в кеш)
+        :param fetch: callable объект, выполняющий запрос
+        :param args: аргументы fetch
+
+        :rtype: pyshtrih.protocol.Response
+        """
+
+        if self.ttl <= 0:
+            return fetch(*args)
+
+        with self.lock:
+            if not fresh:
+                cached = self.values.get(cmd)
+                if cached is not None and monotonic() - cached[0] < self.ttl:
+                    return cached[1]
+
+                flight = self.flights.get(cmd)
+                if flight is not None:
+                    waiting = True
+                else:
+                    flight = self.flights[cmd] = Flight()
+                    waiting = False
+            else:
+                flight = None
+                waiting = False
+            generation = self.generation
+
+        if waiting:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+
+        started = monotonic()
+        try:
+            response = fetch(*args)
+        except BaseException as exc:
+            if flight is not None:
+                flight.error = exc
+            raise
+        else:
+            if flight is not None:
+                flight.response = response
+            with self.lock:
+                if generation == self.generation:
+                    self.values[cmd] = started, response
+            return response
+        finally:
+            if flight is not None:
+                with self.lock:
+                    del self.flights[cmd]
+                flight.event.set()
+
+    def sent(self, frame):
+        """
+        Сброс кеша перед отправкой команды, изменяющей состояние ККМ.
+
+        :type frame: bytearray
+        :param frame: кадр команды
+        """
+
+        if frame_cmd(frame) not in self.readonly:
+            self.invalidate()
+
+    def invalidate(self):
+        """
+        Сброс кеша.
+        """
+
+        with self.lock:
+            self.generation += 1
+            self.values.clear()
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+
+
+import threading
+
+from . import misc, encoders, protocol
+from .compat import unicode
+
+
+class Field(object):
+    __slots__ = (
+        'num',
+        'name',
+        'type',
+        'size',
+        'min',
+        'max'
+    )
+
+    def __init__(self, num, name, type_, size, min_, max_):
+        """
+        Структура поля таблицы (ответ команды 0x2E "Запрос структуры поля").
+
+        :type num: int
+        :param num: номер поля
+        :type name: unicode
+        :param name: название поля
+        :type type_: type
+        :param type_: тип поля: int или str
+        :type size: int
+        :param size: количество байт
+        :type min_: int
+        :param min_: минимальное значение (для числовых полей)
+        :type max_: int
+        :param max_: максимальное значение (для числовых полей)
+        """
+
+        self.num = num
+        self.name = name
+        self.type = type_
+        self.size = size
+        self.min = min_
+        self.max = max_
+
+    def pack(self, value):
+        """
+        Значение поля в виде, передаваемом ККМ (ровно size байт).
+
+        :rtype: bytearray
+        """
+
+        if self.type is int:
+            if not self.min <= value <= self.max:
+                raise ValueError(
+                    u'Значение поля "{}" должно быть в диапазоне {}..{}, получено {}'.format(
+                        self.name, self.min, self.max, value
+                    )
+                )
+            return bytearray(misc.int_to_bytes(value, self.size))
+
+        value = bytearray(misc.encode(value))
+        if len(value) > self.size:
+            raise ValueError(
+                u'Длина значения поля "{}" не должна превышать {} байт, получено {}'.format(
+                    self.name, self.size, len(value)
+                )
+            )
+        value.extend(misc.NULL * (self.size - len(value)))
+        return value
+
+    def unpack(self, value):
+        """
+        Значение поля из ответа команды 0x1F "Чтение таблицы".
+        """
+
+        if self.type is int:
+            return misc.bytes_to_int(value[:self.size])
+        return misc.decode(misc.bytearray_strip(value))
+
+    def __repr__(self):
+        return '{}(num={}, type={}, size={})'.format(type(self).__name__, self.num, self.type.__name__, self.size)
+
+
+class Table(object):
+    __slots__ = (
+        'num',
+        'name',
+        'rows',
+        'fields'
+    )
+
+    def __init__(self, num, name, rows, fields):
+        """
+        Структура таблицы.
+
+        :type num: int
+        :param num: номер таблицы
+        :type name: unicode
+        :param name: название таблицы
+        :type rows: int
+        :param rows: количество рядов
+        :type fields: tuple
+        :param fields: поля таблицы (Field) по порядку номеров
+        """
+
+        self.num = num
+        self.name = name
+        self.rows = rows
+        self.fields = fields
+
+    def field(self, field):
+        """
+        Поле по номеру или названию.
+
+        :type field: int or unicode
+        :param field: номер (с 1) или название поля
+
+        :rtype: Field
+        """
+
+        if isinstance(field, (str, unicode)):
+            for item in self.fields:
+                if item.name == field:
+                    return item
+            raise KeyError(u'В таблице {} нет поля "{}"'.format(self.num, field))
+
+        if not 1 <= field <= len(self.fields):
+            raise KeyError(u'В таблице {} нет поля {}'.format(self.num, field))
+        return self.fields[field - 1]
+
+    def __repr__(self):
+        return '{}(num={}, rows={}, fields={})'.format(type(self).__name__, self.num, self.rows, len(self.fields))
+
+
+class TableCache(object):
+    def __init__(self, device):
+        """
+        Кэш таблиц ККМ.
+
+        Структура таблицы запрашивается у ККМ один раз, типы полей определяются по ней.
+        Таблица считывается в кэш целиком (load), изменения накапливаются (set)
+        и записываются в ККМ только для полей, значение которых отличается от
+        считанного (flush).
+
+            >>> tables = TableCache(device)
+            >>> tables.set(1, 1, u'Номер кассы в магазине', 5)
+            >>> tables.set(4, 1, 1, u'Спасибо за покупку')
+            >>> tables.flush()
+
+        :type device: pyshtrih.device.Device
+        :param device: устройство
+        """
+
+        self.device = device
+        self.lock = threading.RLock()
+        # номер таблицы -> Table
+        self.structures = {}
+        # (таблица, ряд, поле) -> значение, считанное из ККМ или записанное в нее
+        self.values = {}
+        # (таблица, ряд, поле) -> значение, ожидающее записи
+        self.dirty = {}
+
+    def command(self, frame):
+        return self.device.protocol.command_frame(frame)
+
+    def structure(self, table):
+        """
+        Структура таблицы (запрашивается у ККМ при первом обращении,
+        если она не сохранена в кеше сведений устройства - см. pyshtrih.metadata).
+
+        :type table: int
+        :param table: номер таблицы
+
+        :rtype: Table
+        """
+
+        with self.lock:
+            result = self.structures.get(table)
+            if result is not None:
+                return result
+
+            entry = getattr(self.device, 'metadata_entry', None)
+            if entry is not None:
+                result = entry.table(table)
+                if result is not None:
+                    self.structures[table] = result
+                    return result
+
+            password = self.device.admin_password
+            response = self.command(encoders.ENCODERS[0x2D](password, table))
+
+            fields = []
+            for num in range(1, response[u'Количество полей'] + 1):
+                field = self.command(encoders.ENCODERS[0x2E](password, table, num))
+                fields.append(Field(
+                    num,
+                    field[u'Название поля'],
+                    field[u'Тип поля'],
+                    field[u'Количество байт'],
+                    field[u'Минимальное значение поля'],
+                    field[u'Максимальное значение поля']
+                ))
+
+            result = self.structures[table] = Table(
+                table, response[u'Название таблицы'], response[u'Количество рядов'], tuple(fields)
+            )
+            if entry is not None:
+                self.device.metadata.store_table(entry, result)
+            return result
+
+    def read(self, table, row, field):
+        """
+        Чтение значения поля из ККМ (в обход кэша) с сохранением в кэш.
+        """
+
+        with self.lock:
+            field = self.structure(table).field(field)
+            response = self.command(encoders.ENCODERS[0x1F](self.device.admin_password, table, row, field.num))
+            value = self.values[(table, row, field.num)] = field.unpack(response[u'Значение'])
+            return value
+
+    def load(self, table, rows=None):
+        """
+        Считывание таблицы в кэш.
+
+        :type table: int
+        :param table: номер таблицы
+        :type rows: list
+        :param rows: номера рядов (по умолчанию - все ряды)
+
+        :rtype: dict
+        :return: (ряд, номер поля) -> значение
+        """
+
+        with self.lock:
+            structure = self.structure(table)
+            if rows is None:
+                rows = range(1, structure.rows + 1)
+
+            encode = encoders.ENCODERS[0x1F]
+            password = self.device.admin_password
+            # кадры формируются заранее, цикл обмена содержит только отправку и разбор ответа
+            frames = [
+                (row, field, encode(password, table, row, field.num))
+                for row in rows
+                for field in structure.fields
+            ]
+
+            result = {}
+            for row, field, frame in frames:
+                value = field.unpack(self.command(frame)[u'Значение'])
+                self.values[(table, row, field.num)] = result[(row, field.num)] = value
+            return result
+
+    def get(self, table, row, field):
+        """
+        Значение поля: ожидающее записи, из кэша или, если поле не считано, из ККМ.
+
+        :type table: int
+        :param table: номер таблицы
+        :type row: int
+        :param row: номер ряда
+        :type field: int or unicode
+        :param field: номер или название поля
+        """
+
+        with self.lock:
+            num = self.structure(table).field(field).num
+            key = (table, row, num)
+            if key in self.dirty:
+                return self.dirty[key]
+            if key in self.values:
+                return self.values[key]
+            return self.read(table, row, num)
+
+    def set(self, table, row, field, value):
+        """
+        Изменение значения поля (запись в ККМ выполняет flush).
+
+        Значение проверяется по структуре поля сразу. Если оно совпадает с известным
+        значением в ККМ, запись не выполняется.
+
+        :type table: int
+        :param table: номер таблицы
+        :type row: int
+        :param row: номер ряда
+        :type field: int or unicode
+        :param field: номер или название поля
+        :param value: значение (int для числовых полей, unicode для строковых)
+        """
+
+        with self.lock:
+            structure = self.structure(table)
+            if not 1 <= row <= structure.rows:
+                raise ValueError(u'В таблице {} нет ряда {}'.format(table, row))
+
+            field = structure.field(field)
+            field.pack(value)
+
+            key = (table, row, field.num)
+            if key not in self.values:
+                self.read(table, row, field.num)
+
+            if self.values[key] == value:
+                self.dirty.pop(key, None)
+            else:
+                self.dirty[key] = value
+
+    def update(self, table, values):
+        """
+        Изменение нескольких полей таблицы.
+
+        :type table: int
+        :param table: номер таблицы
+        :type values: dict
+        :param values: (ряд, номер или название поля) -> значение
+        """
+
+        for (row, field), value in values.items():
+            self.set(table, row, field, value)
+
+    def flush(self):
+        """
+        Запись в ККМ измененных полей.
+
+        При ошибке записи незаписанные изменения сохраняются.
+
+        :rtype: int
+        :return: количество записанных полей
+        """
+
+        with self.lock:
+            password = misc.CAST_SIZE['4'](self.device.admin_password)
+            count = 0
+            for key in sorted(self.dirty):
+                table, row, num = key
+                value = self.dirty[key]
+                params = misc.bytearray_concat(
+                    password,
+                    misc.CAST_SIZE['121'](table, row, num),
+                    self.structures[table].field(num).pack(value)
+                )
+                self.command(protocol.build_frame(0x1E, params))
+                self.values[key] = value
+                del self.dirty[key]
+                count += 1
+            return count
+
+    def discard(self):
+        """
+        Отмена изменений, не записанных в ККМ.
+        """
+
+        with self.lock:
+            self.dirty.clear()
+
+    def invalidate(self, table=None):
+        """
+        Сброс кэша значений (например, после изменения таблиц другим клиентом).
+
+        :type table: int
+        :param table: номер таблицы (по умолчанию - все таблицы)
+        """
+
+        with self.lock:
+            if table is None:
+                self.values.clear()
+                return
+            for key in [key for key in self.values if key[0] == table]:
+                del self.values[key]
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+import select
+import socket
+import threading
+
+import serial
+
+from .compat import unicode
+
+
+class TransportError(IOError):
+    pass
+
+
+class WriteTimeoutError(TransportError):
+    pass
+
+
+class Transport(object):
+    def __init__(self, port=None, baudrate=None, timeout=None):
+        """
+        Базовый класс транспорта - канала передачи байт между протоколом и устройством.
+
+        :type port: str
+        :param port: адрес устройства
+        :type baudrate: int
+        :param baudrate: скорость взаимодействия с устройством
+        :type timeout: float
+        :param timeout: время таймаута чтения и записи
+        """
+
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+
+    @property
+    def is_open(self):
+        """
+        Флаг открытости транспорта.
+
+        :rtype: bool
+        """
+
+        raise NotImplementedError()
+
+    @property
+    def in_waiting(self):
+        """
+        Количество байт, доступных для чтения без ожидания.
+
+        :rtype: int
+        """
+
+        raise NotImplementedError()
+
+    def open(self):
+        """
+        Открыть транспорт.
+        """
+
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Закрыть транспорт.
+        """
+
+        raise NotImplementedError()
+
+    def read(self, size=1):
+        """
+        Прочитать не более size байт, ожидая их не дольше таймаута.
+
+        :type size: int
+        :param size: количество байт
+
+        :rtype: bytes
+        :return: прочитанные байты (пустая строка в случае таймаута)
+        """
+
+        raise NotImplementedError()
+
+    def write(self, data):
+        """
+        Записать байты.
+
+        :type data: bytes or bytearray
+        :param data: записываемые байты
+        """
+
+        raise NotImplementedError()
+
+    def flush_input(self):
+        """
+        Очистить входной буфер.
+        """
+
+        raise NotImplementedError()
+
+    def flush_output(self):
+        """
+        Очистить выходной буфер.
+        """
+
+        raise NotImplementedError()
+
+
+class SerialTransport(Transport):
+    def __init__(self, port, baudrate, timeout):
+        """
+        Транспорт через последовательный порт (в т.ч. USB CDC и виртуальные порты).
+        """
+
+        self.serial = serial.Serial(
+            baudrate=baudrate,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            timeout=timeout,
+            writeTimeout=timeout
+        )
+        super(SerialTransport, self).__init__(port, baudrate, timeout)
+
+    @property
+    def baudrate(self):
+        return self.serial.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate):
+        self.serial.baudrate = baudrate
+
+    @property
+    def timeout(self):
+        return self.serial.timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self.serial.timeout = timeout
+        self.serial.writeTimeout = timeout
+
+    @property
+    def is_open(self):
+        return self.serial.isOpen()
+
+    @property
+    def in_waiting(self):
+        try:
+            return self.serial.inWaiting()
+        except serial.SerialException as exc:
+            raise TransportError(unicode(exc))
+
+    def open(self):
+        self.serial.port = self.port
+        if not self.serial.isOpen():
+            try:
+                self.serial.open()
+            except serial.SerialException as exc:
+                raise TransportError(unicode(exc))
+
+    def close(self):
+        self.serial.close()
+
+    def read(self, size=1):
+        try:
+            return self.serial.read(size)
+        except serial.SerialException as exc:
+            raise TransportError(unicode(exc))
+
+    def write(self, data):
+        try:
+            self.serial.write(data)
+        except serial.SerialTimeoutException as exc:
+            raise WriteTimeoutError(unicode(exc))
+        except serial.SerialException as exc:
+            raise TransportError(unicode(exc))
+
+    def flush_input(self):
+        self.serial.flushInput()
+
+    def flush_output(self):
+        self.serial.flushOutput()
+
+
+class TCPTransport(Transport):
+    RECV_SIZE = 4096
+
+    KEEPALIVE_IDLE = 10
+    KEEPALIVE_INTERVAL = 5
+    KEEPALIVE_COUNT = 3
+
+    def __init__(self, port, timeout=None, keepalive=True):
+        """
+        Транспорт через TCP соединение (Ethernet, RNDIS, TCP-мост к COM порту).
+
+        :type port: str or tuple
+        :param port: адрес устройства в виде строки 'host:port' или кортежа (host, port)
+        :type timeout: float
+        :param timeout: время таймаута чтения и записи
+        :type keepalive: bool
+        :param keepalive: включить TCP keep-alive
+        """
+
+        if isinstance(port, tuple):
+            port = u'{}:{}'.format(*port)
+
+        super(TCPTransport, self).__init__(port, None, timeout)
+
+        self.keepalive = keepalive
+        self.socket = None
+        self.buffer = bytearray()
+
+    @property
+    def address(self):
+        host, _, port = self.port.rpartition(':')
+        return host, int(port)
+
+    @property
+    def is_open(self):
+        return self.socket is not None
+
+    @property
+    def in_waiting(self):
+        self._check_open()
+        self._pull()
+        return len(self.buffer)
+
+    def open(self):
+        if self.socket is not None:
+            return
+
+        try:
+            sock = socket.create_connection(self.address, self.timeout)
+        except (socket.error, ValueError) as exc:
+            raise TransportError(unicode(exc))
+
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            for option, value in (
+                ('TCP_KEEPIDLE', self.KEEPALIVE_IDLE),
+                ('TCP_KEEPINTVL', self.KEEPALIVE_INTERVAL),
+                ('TCP_KEEPCNT', self.KEEPALIVE_COUNT)
+            ):
+                # набор опций зависит от платформы
+                if hasattr(socket, option):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+        self.socket = sock
+        del self.buffer[:]
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        del self.buffer[:]
+
+    def _check_open(self):
+        if self.socket is None:
+            raise TransportError(u'Соединение не установлено')
+
+    def _pull(self):
+        # забираем в буфер все, что уже пришло, не блокируясь
+        try:
+            while select.select((self.socket, ), (), (), 0)[0]:
+                self._recv()
+        except (socket.error, select.error) as exc:
+            raise TransportError(unicode(exc))
+
+    def _recv(self):
+        chunk = self.socket.recv(self.RECV_SIZE)
+        if not chunk:
+            raise TransportError(u'Соединение закрыто устройством')
+        self.buffer.extend(chunk)
+
+    def read(self, size=1):
+        self._check_open()
+
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        try:
+            while len(self.buffer) < size:
+                if deadline is None:
+                    self.socket.settimeout(None)
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.socket.settimeout(remaining)
+                self._recv()
+        except socket.timeout:
+            pass
+        except socket.error as exc:
+            raise TransportError(unicode(exc))
+
+        result = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return result
+
+    def write(self, data):
+        self._check_open()
+
+        try:
+            self.socket.settimeout(self.timeout)
+            self.socket.sendall(data)
+        except socket.timeout as exc:
+            raise WriteTimeoutError(unicode(exc))
+        except socket.error as exc:
+            raise TransportError(unicode(exc))
+
+    def flush_input(self):
+        if self.socket is not None:
+            self._pull()
+        del self.buffer[:]
+
+    def flush_output(self):
+        pass
+
+
+class LoopbackTransport(Transport):
+    def __init__(self, port=u'loopback', baudrate=None, timeout=None):
+        """
+        Транспорт в пределах процесса: все, что записано в один конец, читается из другого.
+        Пара связанных концов создается методом pair().
+        """
+
+        super(LoopbackTransport, self).__init__(port, baudrate, timeout)
+
+        self.buffer = bytearray()
+        self.condition = threading.Condition()
+        self.peer = None
+        self.opened = False
+
+    @classmethod
+    def pair(cls, timeout=None, baudrate=None):
+        """
+        Создать пару связанных концов.
+
+        :rtype: tuple
+        :return: (конец протокола, конец устройства)
+        """
+
+        a = cls(timeout=timeout, baudrate=baudrate)
+        b = cls(timeout=timeout, baudrate=baudrate)
+        a.peer, b.peer = b, a
+        return a, b
+
+    @property
+    def is_open(self):
+        return self.opened
+
+    @property
+    def in_waiting(self):
+        return len(self.buffer)
+
+    def open(self):
+        if self.peer is None:
+            raise TransportError(u'Нет связанного конца')
+        self.opened = True
+
+    def close(self):
+        with self.condition:
+            self.opened = False
+            self.condition.notify_all()
+
+    def read(self, size=1):
+        with self.condition:
+            if len(self.buffer) < size and self.timeout != 0:
+                deadline = None if self.timeout is None else time.time() + self.timeout
+                while len(self.buffer) < size and self.opened:
+                    if deadline is None:
+                        self.condition.wait()
+                    else:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+
+            result = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            return result
+
+    def write(self, data):
+        peer = self.peer
+        with peer.condition:
+            peer.buffer.extend(data)
+            peer.condition.notify_all()
+
+    def flush_input(self):
+        with self.condition:
+            del self.buffer[:]
+
+    def flush_output(self):
+        pass
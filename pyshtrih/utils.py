@@ -1,16 +1,26 @@
 # -*- coding: utf-8 -*-
 
 
+import io
+import os
+import json
+from concurrent import futures
+
 import serial.tools.list_ports
 
 from . import device, commands, protocol, misc, compat
 
 
+# наиболее вероятные скорости проверяются первыми
+BAUDRATE_PRIORITY = (115200, 4800, 9600, 57600, 19200, 38400, 2400)
+DISCOVERY_CACHE = os.path.join(os.path.expanduser('~'), '.pyshtrih_discovery.json')
+
+
 class Discovery(compat.with_metaclass(commands.SupportedCommands)):
     SUPPORTED_COMMANDS = (0xFC, )
     DISCOVERY_TIMEOUT = 0.5
 
-    def __init__(self, port, baudrate):
+    def __init__(self, port, baudrate, transport=None):
         """
         Псевдо-устройство, позволяющее определить тип подключенного оборудования.
 
@@ -18,10 +28,12 @@ class Discovery(compat.with_metaclass(commands.SupportedCommands)):
         :param port: порт взаимодействия с устройством
         :type baudrate: int
         :param baudrate: скорость взаимодействия с устройством
+        :type transport: pyshtrih.transport.Transport
+        :param transport: транспорт взаимодействия с устройством
         """
 
         self.protocol = protocol.Protocol(
-            port, baudrate, self.DISCOVERY_TIMEOUT
+            port, baudrate, self.DISCOVERY_TIMEOUT, transport=transport
         )
         self.protocol.connect()
         self.dev_info = self.model()
@@ -30,79 +42,166 @@ class Discovery(compat.with_metaclass(commands.SupportedCommands)):
     name = device.Device.name
 
 
-def discovery(callback=None, port=None, baudrate=None):
+def device_class(name):
+    """
+    Функция определения класса устройства по его названию.
+
+    :type name: unicode
+    :param name: название устройства (ответ команды 0xFC)
+
+    :rtype: type
+    :return: класс устройства или None, если устройство не поддерживается
+    """
+
+    if u'ФР-ПТК' in name:
+        return device.ShtrihFRPTK
+    elif u'LIGHT-ПТК' in name:
+        return device.ShtrihLightPTK
+    elif u'ПТК' in name:
+        return device.ShtrihComboPTK
+    elif u'КОМБО-ФР-К' in name:
+        return device.ShtrihComboFRK
+    elif u'ФР-К' in name:
+        return device.ShtrihFRK
+    elif u'ФР-01Ф' in name:
+        return device.ShtrihFR01F
+    elif u'950К' in name:
+        return device.Shtrih950K
+    elif u'ON-LINE' in name:
+        return device.ShtrihOnLine
+    elif u'РИТЕЙЛ-01Ф' in name:
+        return device.Retail01F
+    # Добавлена часть названия с латинской буквой M.
+    # В одной из прошивок наблюдался такой странный баг.
+    elif u'М-01Ф' in name or u'M-01Ф' in name:
+        return device.ShtrihM01F
+    elif u'М-02Ф' in name or u'M-02Ф' in name:
+        return device.ShtrihM02F
+    elif u'ЛАЙТ-01Ф' in name:
+        return device.ShtrihLight01F
+    elif u'ЛАЙТ-02Ф' in name:
+        return device.ShtrihLight02F
+    elif u'МИНИ-01Ф' in name:
+        return device.ShtrihMini01F
+
+
+def load_cache(path):
+    """
+    Чтение последних найденных устройств из файла кеша.
+
+    :rtype: list
+    :return: список словарей с ключами port, baudrate и name
+    """
+
+    try:
+        with io.open(path, encoding='utf-8') as fd:
+            entries = json.load(fd)
+        return [
+            entry for entry in entries
+            if isinstance(entry, dict) and entry.get('port') and entry.get('baudrate') in misc.BAUDRATE_DIRECT
+        ]
+    except (IOError, OSError, ValueError, TypeError):
+        return []
+
+
+def save_cache(path, entries):
+    """
+    Запись найденных устройств в файл кеша. Ошибки записи игнорируются.
+    """
+
+    tmp = u'{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with io.open(tmp, 'w', encoding='utf-8') as fd:
+            fd.write(compat.unicode(json.dumps(entries)))
+        if os.name == 'nt' and os.path.exists(path):
+            # на Windows os.rename не заменяет существующий файл
+            os.remove(path)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        pass
+
+
+def probe(port, baudrates, callback=None):
+    """
+    Последовательная проверка порта на заданных скоростях.
+
+    :rtype: tuple
+    :return: (порт, скорость, Discovery) или None, если устройство не найдено
+    """
+
+    for b in baudrates:
+        if callback:
+            callback(port, b)
+
+        try:
+            return port, b, Discovery(port, b)
+        except IOError:
+            pass
+
+
+def discovery(callback=None, port=None, baudrate=None, cache=DISCOVERY_CACHE, full=False):
     """
     Функция автоопределения подключеннных устройств.
 
+    Порты проверяются параллельно, скорости - в порядке BAUDRATE_PRIORITY.
+    Найденные устройства сохраняются в файл кеша и при следующем запуске
+    проверяются первыми; если все они ответили, остальные порты не проверяются.
+
     :param callback: callable объект, принимающий 2 параметра: порт и скорость
+                     (вызывается из рабочих потоков)
     :type port: str
     :param port: порт взаимодействия с устройством
     :type baudrate: int
     :param baudrate: скорость взаимодействия с устройством
+    :type cache: str
+    :param cache: путь к файлу кеша, None - не использовать кеш
+    :type full: bool
+    :param full: проверить все порты, даже если устройства из кеша найдены
 
     :rtype: list
     :return: список экземпляров оборудования
     """
 
-    devices = []
-
     if port and baudrate:
-        ports = (port, )
-        baudrates = (baudrate, )
+        found = [probe(port, (baudrate, ), callback)]
     else:
         # явное приведение результата функции comports к типу list
         # необходимо для совместимости с pyserial <= 3.0.1 на платформе win32
-        ports = (port_.device for port_ in reversed(list(serial.tools.list_ports.comports())))
-        baudrates = sorted(misc.BAUDRATE_DIRECT.keys(), reverse=True)
-
-    for p in ports:
-        for b in baudrates:
-            if callback:
-                callback(p, b)
-
-            try:
-                d = Discovery(p, b)
-            except IOError:
-                pass
-            else:
-                device_cls = None
-
-                if u'ФР-ПТК' in d.name:
-                    device_cls = device.ShtrihFRPTK
-                elif u'LIGHT-ПТК' in d.name:
-                    device_cls = device.ShtrihLightPTK
-                elif u'ПТК' in d.name:
-                    device_cls = device.ShtrihComboPTK
-                elif u'КОМБО-ФР-К' in d.name:
-                    device_cls = device.ShtrihComboFRK
-                elif u'ФР-К' in d.name:
-                    device_cls = device.ShtrihFRK
-                elif u'ФР-01Ф' in d.name:
-                    device_cls = device.ShtrihFR01F
-                elif u'950К' in d.name:
-                    device_cls = device.Shtrih950K
-                elif u'ON-LINE' in d.name:
-                    device_cls = device.ShtrihOnLine
-                elif u'РИТЕЙЛ-01Ф' in d.name:
-                    device_cls = device.Retail01F
-                # Добавлена часть названия с латинской буквой M.
-                # В одной из прошивок наблюдался такой странный баг.
-                elif u'М-01Ф' in d.name or u'M-01Ф' in d.name:
-                    device_cls = device.ShtrihM01F
-                elif u'М-02Ф' in d.name or u'M-02Ф' in d.name:
-                    device_cls = device.ShtrihM02F
-                elif u'ЛАЙТ-01Ф' in d.name:
-                    device_cls = device.ShtrihLight01F
-                elif u'ЛАЙТ-02Ф' in d.name:
-                    device_cls = device.ShtrihLight02F
-                elif u'МИНИ-01Ф' in d.name:
-                    device_cls = device.ShtrihMini01F
-
-                if device_cls:
-                    discovered_device = device_cls(p, b)
-                    discovered_device.dev_info = d.dev_info
-                    devices.append(discovered_device)
-
-                break
+        ports = [port_.device for port_ in reversed(list(serial.tools.list_ports.comports()))]
+        cached = [entry for entry in load_cache(cache) if entry['port'] in ports] if cache else []
+
+        found = []
+        if cached:
+            with futures.ThreadPoolExecutor(len(cached)) as executor:
+                found = list(executor.map(
+                    lambda entry: probe(entry['port'], (entry['baudrate'], ), callback), cached
+                ))
+
+        if full or not cached or not all(found):
+            done = set(r[0] for r in found if r)
+            rest = [p for p in ports if p not in done]
+            priority = [entry['baudrate'] for entry in cached]
+            baudrates = sorted(BAUDRATE_PRIORITY, key=lambda b: priority.index(b) if b in priority else len(priority))
+
+            if rest:
+                with futures.ThreadPoolExecutor(len(rest)) as executor:
+                    found.extend(executor.map(lambda p: probe(p, baudrates, callback), rest))
+
+    devices = []
+    entries = []
+    for r in found:
+        if r is None:
+            continue
+
+        p, b, d = r
+        device_cls = device_class(d.name)
+        if device_cls:
+            discovered_device = device_cls(p, b)
+            discovered_device.dev_info = d.dev_info
+            devices.append(discovered_device)
+            entries.append({'port': p, 'baudrate': b, 'name': d.name})
+
+    if cache and entries and not (port and baudrate):
+        save_cache(cache, entries)
 
     return devices
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+
+
+import pickle
+import itertools
+import threading
+import collections
+import multiprocessing
+from concurrent import futures
+
+from . import protocol, excepts, fleet, commands
+from .compat import unicode
+
+
+# методы устройства, вызываемые через DeviceProxy
+PROXY_METHODS = commands.METHODS | frozenset(('connect', 'disconnect'))
+# значение func сообщения, исключающего устройство из рабочего процесса
+REMOVE = None
+
+
+def plain(value):
+    """
+    Результат вызова в виде, передаваемом между процессами
+    (LazyResponse разбирается полностью и заменяется на Response).
+    """
+
+    if isinstance(value, protocol.LazyResponse):
+        return protocol.Response(value.cmd, value.params)
+    return value
+
+
+def serve(conn, factories):
+    """
+    Цикл рабочего процесса.
+
+    Устройства создаются в рабочем процессе и обслуживаются pyshtrih.fleet.Fleet,
+    поэтому зависание одного порта группы не задерживает команды остальных устройств.
+
+    :type conn: multiprocessing.connection.Connection
+    :param conn: канал связи с родительским процессом
+    :type factories: dict
+    :param factories: идентификатор -> callable объект, создающий устройство
+    """
+
+    lock = threading.Lock()
+
+    def reply(num, ok, value):
+        try:
+            if not ok:
+                # исключение должно не только упаковываться, но и распаковываться
+                pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            value = excepts.ProtocolError(u'{}: {}'.format(type(value).__name__, unicode(value)))
+
+        with lock:
+            try:
+                conn.send((num, ok, value))
+            except (pickle.PicklingError, TypeError, AttributeError) as exc:
+                # результат не передается между процессами
+                conn.send((num, False, excepts.ProtocolError(
+                    u'Не удалось передать результат: {}'.format(unicode(exc))
+                )))
+
+    def done(num, future):
+        try:
+            reply(num, True, plain(future.result()))
+        except Exception as exc:
+            reply(num, False, exc)
+
+    group = fleet.Fleet({device_id: factory() for device_id, factory in factories.items()})
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            if message is None:
+                return
+
+            num, device_id, func, args, kwargs = message
+            try:
+                if func is REMOVE:
+                    # устройство отключается после уже поставленных команд, его поток завершается
+                    future = group.submit(device_id, 'disconnect')
+                    group.remove(device_id, wait=False)
+                elif callable(func):
+                    future = group.submit(device_id, func, group.device(device_id), *args, **kwargs)
+                else:
+                    future = group.submit(device_id, func, *args, **kwargs)
+            except Exception as exc:
+                reply(num, False, exc)
+            else:
+                future.add_done_callback(lambda f, n=num: done(n, f))
+    finally:
+        # зависшие рабочие потоки не должны задерживать завершение процесса
+        group.shutdown(wait=False)
+
+
+class WorkerProcess(object):
+    # время ожидания завершения рабочего процесса, по истечении которого он прерывается
+    SHUTDOWN_TIMEOUT = 5
+
+    def __init__(self, factories, context=None):
+        """
+        Рабочий процесс, обслуживающий группу устройств.
+
+        :type factories: dict
+        :param factories: идентификатор -> callable объект, создающий устройство
+                          (передается в рабочий процесс, должен поддерживать pickle)
+        :param context: контекст multiprocessing (по умолчанию - модуль multiprocessing)
+        """
+
+        context = context or multiprocessing
+
+        self.ids = tuple(factories)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=serve, args=(child_conn, factories), name=u'pyshtrih-worker-{}'.format(u','.join(
+                unicode(device_id) for device_id in self.ids
+            ))
+        )
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        # номер запроса -> concurrent.futures.Future
+        self.pending = {}
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._reader, name=self.process.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _reader(self):
+        while True:
+            try:
+                num, ok, value = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            except Exception as exc:
+                # сообщение не распаковано - неизвестно, какому запросу оно предназначалось
+                self._fail_pending(excepts.ProtocolError(u'Не удалось получить результат: {}'.format(unicode(exc))))
+                continue
+
+            with self.lock:
+                future = self.pending.pop(num, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+        with self.lock:
+            self.closed = True
+        self._fail_pending(excepts.ProtocolError(u'Рабочий процесс {} завершился'.format(self.process.name)))
+
+    def _fail_pending(self, exc):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(exc)
+
+    def submit(self, device_id, func, *args, **kwargs):
+        """
+        Поставить вызов в очередь устройства рабочего процесса.
+
+        :param device_id: идентификатор устройства
+        :type func: str or collections.Callable
+        :param func: имя метода устройства или функция, вызываемая с устройством
+                     первым аргументом (должна поддерживать pickle)
+
+        :rtype: concurrent.futures.Future
+        """
+
+        return self._send(device_id, func, args, kwargs)
+
+    def remove(self, device_id):
+        """
+        Исключить устройство из рабочего процесса: после выполнения уже поставленных
+        команд устройство отключается (порт закрывается), его поток завершается.
+
+        :param device_id: идентификатор устройства
+
+        :rtype: concurrent.futures.Future
+        :return: завершается после отключения устройства
+        """
+
+        return self._send(device_id, REMOVE, (), {})
+
+    def _send(self, device_id, func, args, kwargs):
+        future = futures.Future()
+        future.set_running_or_notify_cancel()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError(u'Рабочий процесс остановлен')
+            num = next(self.counter)
+            self.pending[num] = future
+            try:
+                self.conn.send((num, device_id, func, args, kwargs))
+            except Exception:
+                # вызов не передан (например, func или аргументы не поддерживают pickle)
+                del self.pending[num]
+                raise
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Остановить рабочий процесс после выполнения уже поставленных команд.
+
+        :type wait: bool
+        :param wait: дождаться завершения процесса
+        """
+
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                try:
+                    self.conn.send(None)
+                except (IOError, OSError):
+                    pass
+
+        if wait:
+            self.process.join(self.SHUTDOWN_TIMEOUT)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self.thread.join()
+            self.conn.close()
+
+
+class DeviceProxy(object):
+    def __init__(self, worker, device_id):
+        """
+        Устройство рабочего процесса: методы, вызванные через него, возвращают
+        concurrent.futures.Future (как у pyshtrih.executor.DeviceExecutor).
+
+        :type worker: WorkerProcess
+        :param worker: рабочий процесс
+        :param device_id: идентификатор устройства
+        """
+
+        self.worker = worker
+        self.device_id = device_id
+
+    def submit(self, func, *args, **kwargs):
+        return self.worker.submit(self.device_id, func, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        self.worker.shutdown(wait)
+
+    def __getattr__(self, item):
+        if item not in PROXY_METHODS:
+            raise AttributeError(item)
+
+        def method(*args, **kwargs):
+            return self.submit(item, *args, **kwargs)
+
+        method.__name__ = item
+        return method
+
+
+class WorkerPool(fleet.Fleet):
+    def __init__(self, factories=None, processes=None, context=None):
+        """
+        Группа устройств, обслуживаемых рабочими процессами.
+
+        Разбор ответов и формирование кадров устройств разных процессов не конкурируют
+        за GIL, зависший порт не задерживает устройства других процессов. Результаты
+        (Response, в т.ч. разобранные LazyResponse) и исключения передаются через
+        multiprocessing.Pipe. Устройства создаются в рабочем процессе, поэтому вместо
+        устройств передаются создающие их callable объекты:
+
+            >>> pool = WorkerPool({
+            ...     u'касса-1': functools.partial(ShtrihM01F, '/dev/ttyS0', 115200),
+            ...     u'касса-2': functools.partial(ShtrihM01F, '/dev/ttyS1', 115200)
+            ... })
+            >>> pool.connect()
+            >>> pool[u'касса-1'].state().result()
+            >>> pool.state()
+
+        Групповые операции - как у pyshtrih.fleet.Fleet.
+
+        :type factories: dict
+        :param factories: идентификатор -> callable объект, создающий устройство
+        :type processes: int
+        :param processes: количество рабочих процессов (устройства распределяются
+                          по процессам по очереди), по умолчанию - процесс на устройство
+        :param context: контекст multiprocessing
+        """
+
+        self.context = context
+        self.lock = threading.Lock()
+        # идентификатор -> DeviceProxy
+        self.executors = collections.OrderedDict()
+        # идентификатор -> callable объект, создающий устройство
+        self.factories = {}
+
+        items = list((factories or {}).items())
+        count = len(items) if processes is None else min(processes, len(items))
+        for i in range(count):
+            self.add_group(collections.OrderedDict(items[i::count]))
+
+    def add_group(self, factories):
+        """
+        Добавить группу устройств, обслуживаемых одним рабочим процессом.
+
+        :type factories: dict
+        :param factories: идентификатор -> callable объект, создающий устройство
+
+        :rtype: WorkerProcess
+        """
+
+        with self.lock:
+            for device_id in factories:
+                if device_id in self.executors:
+                    raise KeyError(u'Устройство {} уже добавлено'.format(device_id))
+
+            worker = WorkerProcess(factories, self.context)
+            for device_id, factory in factories.items():
+                self.executors[device_id] = DeviceProxy(worker, device_id)
+                self.factories[device_id] = factory
+            return worker
+
+    def add(self, device_id, factory):
+        """
+        Добавить устройство с собственным рабочим процессом.
+        """
+
+        self.add_group({device_id: factory})
+
+    def remove(self, device_id, wait=True):
+        """
+        Исключить устройство (после выполнения уже поставленных команд).
+
+        Устройство отключается в рабочем процессе, порт освобождается. Рабочий процесс
+        останавливается, когда в нем не остается устройств.
+
+        :param device_id: идентификатор устройства
+        :type wait: bool
+        :param wait: дождаться отключения устройства
+
+        :return: callable объект, создающий устройство (например, для добавления в другую группу)
+        """
+
+        with self.lock:
+            proxy = self.executors.pop(device_id)
+            factory = self.factories.pop(device_id)
+            alone = all(other.worker is not proxy.worker for other in self.executors.values())
+
+        try:
+            removed = proxy.worker.remove(device_id)
+        except RuntimeError:
+            # рабочий процесс уже остановлен
+            removed = None
+
+        if alone:
+            proxy.worker.shutdown(wait)
+        elif wait and removed is not None:
+            futures.wait((removed, ))
+        return factory
+
+    def device(self, device_id):
+        raise TypeError(u'Устройство {} находится в рабочем процессе'.format(device_id))
+
+    def broadcast(self, func, *args, **kwargs):
+        with self.lock:
+            executors = list(self.executors.items())
+
+        result = collections.OrderedDict()
+        for device_id, proxy in executors:
+            result[device_id] = proxy.submit(func, *args, **kwargs)
+        return result
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            workers = []
+            for proxy in self.executors.values():
+                if proxy.worker not in workers:
+                    workers.append(proxy.worker)
+            self.executors.clear()
+            self.factories.clear()
+
+        for worker in workers:
+            worker.shutdown(False)
+        if wait:
+            for worker in workers:
+                worker.shutdown(True)
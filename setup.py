@@ -31,7 +31,7 @@ setuptools.setup(
     zip_safe=False,
     platforms='any',
     long_description=open(os.path.join(os.path.dirname(__file__), 'README.rst'), **kwargs).read(),
-    install_requires=['pyserial', 'unilog'],
+    install_requires=['pyserial', 'unilog', 'futures; python_version < "3"'],
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Intended Audience :: Developers',
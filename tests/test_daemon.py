@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+
+import socket
+import threading
+
+import pytest
+
+from pyshtrih import daemon, emulator, excepts, protocol, TCPTransport
+from pyshtrih.device import ShtrihM01F
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('pyshtrih.sock'))
+
+
+@pytest.fixture
+def emu():
+    emu = emulator.Emulator(print_line_time=0)
+    yield emu
+    emu.stop()
+
+
+def test_clients_share_device(emu, path):
+    dev = ShtrihM01F(transport=emu.loopback(timeout=0.5))
+    sent = []
+    dev.protocol.senders.append(lambda frame: sent.append(protocol.frame_cmd(frame)))
+
+    with daemon.DeviceDaemon(dev, path):
+        clients = [daemon.DaemonClient(path, timeout=5) for _ in range(4)]
+        assert clients[0].state()[u'Режим ФР'].num == 4
+
+        del sent[:]
+        results = []
+        threads = [
+            threading.Thread(target=lambda c=c: results.append(c.full_state()))
+            for c in clients for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 20
+        # одинаковые запросы чтения объединяются
+        assert sent.count(0x11) < 20
+
+        with pytest.raises(excepts.OpenCheckError):
+            clients[1].open_check(0)
+            clients[1].open_check(0)
+        clients[1].cancel_check()
+
+        with pytest.raises(excepts.ProtocolError):
+            clients[2].call('connect')
+
+        for client in clients:
+            client.close()
+
+
+def test_stalled_client_does_not_block_device(emu, path):
+    dev = ShtrihM01F(transport=emu.loopback(timeout=0.5))
+
+    with daemon.DeviceDaemon(dev, path) as server:
+        server.MAX_REPLIES = 16
+
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024)
+        stalled.connect(path)
+        # клиент отправляет запросы и не читает ответы
+        for num in range(2000):
+            try:
+                daemon.send_message(stalled, (num, 'full_state', (), {}))
+            except socket.error:
+                break
+
+        client = daemon.DaemonClient(path, timeout=5)
+        assert client.state()[u'Режим ФР'].num == 4
+        client.close()
+        stalled.close()
+
+
+def test_reconnect_backoff(path):
+    dev = ShtrihM01F(transport=TCPTransport(('127.0.0.1', 1), timeout=0.2))
+
+    with daemon.DeviceDaemon(dev, path) as server:
+        server.RECONNECT_DELAY = 60
+        client = daemon.DaemonClient(path, timeout=5)
+
+        with pytest.raises(excepts.NoConnectionError):
+            client.state()
+        first = server.connect_error
+
+        with pytest.raises(excepts.NoConnectionError) as exc_info:
+            client.state()
+        # повторная попытка подключения не выполнялась
+        assert server.connect_error is first
+        assert u'Не удалось открыть порт' in exc_info.value.args[0]
+        client.close()
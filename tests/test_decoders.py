@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+from pyshtrih import emulator, excepts, misc, protocol
+from pyshtrih.handlers import commands as hc, decoders as hd
+
+
+def normalize(value):
+    # значения без __eq__ (например, FRMode) сравниваются по атрибутам
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if hasattr(value, '__dict__'):
+        return normalize(vars(value))
+    return value
+
+
+def outcome(lazy, payload):
+    proto = protocol.Protocol('loopback', 9600, 1, lazy=lazy)
+    try:
+        response = proto.handle_payload(bytearray(payload))
+        if isinstance(response, bytearray):
+            return u'raw', response
+        # поля LazyResponse разбираются при обращении, ошибки разбора возникают здесь
+        fields = {name: response[name] for name in proto.decoders[response.cmd].names}
+        return u'response', response.cmd, normalize(fields), normalize(response.params)
+    except excepts.Error as exc:
+        return u'error', exc.cmd, exc.code
+    except Exception as exc:
+        return u'exception', type(exc)
+
+
+def cmd_bytes(cmd):
+    return misc.CAST_CMD[len(misc.int_to_bytes(cmd))](cmd)
+
+
+def emulated_payloads():
+    emu = emulator.Emulator(print_line_time=0)
+    password = misc.CAST_SIZE['4'](30)
+    for cmd in (0x10, 0x11, 0xFC, 0xFF01):
+        yield bytearray(emu.execute(misc.bytearray_concat(cmd_bytes(cmd), password)))
+
+
+@pytest.mark.parametrize('cmd', sorted(hd.DECODERS))
+@pytest.mark.parametrize('body', [b'', b'\x00', b'\x37', b'\x00\x01'])
+def test_lazy_matches_eager_short_payloads(cmd, body):
+    payload = misc.bytearray_concat(cmd_bytes(cmd), bytearray(body))
+    assert outcome(True, payload) == outcome(False, payload)
+
+
+def test_lazy_truncated_response_is_error():
+    with pytest.raises(excepts.Error):
+        protocol.Protocol('loopback', 9600, 1, lazy=True).handle_payload(bytearray(b'\x85'))
+
+
+@pytest.mark.parametrize('payload', list(emulated_payloads()), ids=lambda payload: '{:02X}'.format(payload[0]))
+def test_lazy_matches_eager_truncated_responses(payload):
+    for size in range(1, len(payload) + 1):
+        assert outcome(True, payload[:size]) == outcome(False, payload[:size])
+
+
+@pytest.mark.parametrize('payload', list(emulated_payloads()), ids=lambda payload: '{:02X}'.format(payload[0]))
+def test_compiled_decoder_matches_interpret(payload):
+    offset = 2 if payload[0] == 0xFF else 1
+    cmd = protocol.payload_cmd(payload)
+    response = memoryview(payload)[offset:]
+    assert normalize(hd.DECODERS[cmd](response)) == normalize(hd.interpret(hc.HANDLERS[cmd], response))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+
+from pyshtrih import emulator, misc, protocol
+from pyshtrih.device import ShtrihM01F
+
+
+def reply_payload(reply):
+    # ACK, STX, длина, данные, LRC
+    return bytearray(reply[3:-1])
+
+
+def test_empty_frame_gets_error_reply():
+    emu = emulator.Emulator(print_line_time=0)
+    assert reply_payload(emu.feed(b'\x02\x00\x00')) == bytearray((0x37, ))
+
+
+def test_handler_error_replies_internal_error():
+    emu = emulator.Emulator(print_line_time=0)
+
+    def broken(cmd, operator, params):
+        raise RuntimeError(u'ошибка обработчика')
+
+    emu.commands[0x13] = broken
+    frame = protocol.build_frame(0x13, bytearray(misc.CAST_SIZE['4'](1)))
+    assert reply_payload(emu.feed(bytes(frame))) == bytearray((0x13, 0x39))
+
+
+def test_malformed_frame_keeps_serving():
+    emu = emulator.Emulator(print_line_time=0)
+    transport = emu.loopback(timeout=0.5)
+    dev = ShtrihM01F(transport=transport)
+    dev.connect()
+
+    transport.write(b'\x02\x00\x00')
+    reply = bytearray()
+    for _ in range(5):
+        reply.extend(transport.read(5 - len(reply)))
+    transport.write(b'\x06')
+    assert reply_payload(reply) == bytearray((0x37, ))
+
+    # поток обслуживания продолжает работу
+    assert dev.state()[u'Режим ФР'].num == 4
+    dev.disconnect()
+    emu.stop()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+from pyshtrih import encoders, misc, protocol
+
+
+# значения параметров по коду формата и их упаковка без encoders
+VALUES = {
+    'B': (0, 7, 0xFF),
+    'H': (0, 300, 0xFFFF),
+    'I': (0, 30, 0xFFFFFFFF),
+    'h': (0, -5, 0x7FFF),
+    'M': (0, 4500, 2 ** 40 - 1)
+}
+PACK = {
+    'B': misc.CAST_SIZE['1'],
+    'H': misc.CAST_SIZE['2'],
+    'I': misc.CAST_SIZE['4'],
+    'h': misc.CAST_SIZE['s2'],
+    'M': lambda value: bytearray(misc.int_to_bytes(value, 5))
+}
+TEXTS = (None, u'', u'Хлеб', u'Позиция с очень длинным названием ' * 3)
+
+
+def generic_frame(cmd, fmt, args, length):
+    params = bytearray()
+    for code, arg in zip(fmt, args):
+        params.extend(misc.prepare_string(arg, length) if code == 'S' else PACK[code](arg))
+    return protocol.build_frame(cmd, params)
+
+
+@pytest.mark.parametrize('cmd', sorted(encoders.FORMATS))
+def test_encoder_matches_generic_frame(cmd):
+    fmt = encoders.FORMATS[cmd]
+    for variant in range(3):
+        args = [VALUES[code][variant] for code in fmt if code != 'S']
+        texts = TEXTS if fmt.endswith('S') else (None, )
+        for text in texts:
+            for length in (0, misc.DEFAULT_MIN_LENGTH, 64):
+                full = args + [text] if fmt.endswith('S') else args
+                frame = encoders.ENCODERS[cmd](*full, length=length)
+                assert frame == generic_frame(cmd, fmt, full, length), (cmd, full, length)
+                assert protocol.frame_cmd(frame) == cmd
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+
+import copy
+import functools
+import multiprocessing
+
+import pytest
+
+from pyshtrih import emulator, excepts, fleet, transport, workers
+from pyshtrih.device import ShtrihM01F
+
+
+def make_device():
+    emu = emulator.Emulator(print_line_time=0)
+    return ShtrihM01F(transport=emu.loopback(timeout=5))
+
+
+def tcp_device(address):
+    return ShtrihM01F(transport=transport.TCPTransport(address, timeout=1))
+
+
+def fail():
+    raise ValueError(u'не распаковывается')
+
+
+class Unpicklable(object):
+    def __reduce__(self):
+        return fail, ()
+
+
+def unpicklable_result(device):
+    return Unpicklable()
+
+
+def mode(device):
+    return device.state()[u'Режим ФР'].num
+
+
+@pytest.fixture
+def group():
+    group = fleet.Fleet({1: make_device(), 2: make_device()})
+    yield group
+    group.shutdown()
+
+
+@pytest.fixture
+def pool():
+    pool = workers.WorkerPool(
+        {1: make_device, 2: functools.partial(make_device)}, context=multiprocessing.get_context('fork')
+    )
+    yield pool
+    pool.shutdown()
+
+
+def test_fleet_fans_out_device_methods_only(group):
+    group.connect()
+    result = group.state()
+    assert [r[u'Режим ФР'].num for r in result.values()] == [4, 4]
+
+    assert not hasattr(group, 'stat')
+    with pytest.raises(AttributeError):
+        group.__setstate__
+    assert copy.copy(group).ids == [1, 2]
+
+
+def test_worker_proxy_methods(pool):
+    pool.connect()
+    assert pool[1].state().result(5)[u'Режим ФР'].num == 4
+    assert pool.gather(mode) == {1: 4, 2: 4}
+
+    assert not hasattr(pool[1], 'stat')
+    assert not hasattr(pool, 'stat')
+
+
+def test_worker_unpicklable_result(pool):
+    pool.connect()
+    with pytest.raises(excepts.ProtocolError):
+        pool[1].submit(unpicklable_result).result(5)
+    # рабочий процесс продолжает обслуживать запросы
+    assert pool[1].state().result(5)[u'Режим ФР'].num == 4
+
+
+def test_worker_remove_disconnects_shared_device():
+    emu = emulator.Emulator(print_line_time=0)
+    address = emu.tcp()
+    factory = functools.partial(tcp_device, address)
+    pool = workers.WorkerPool({1: factory, 2: make_device}, processes=1, context=multiprocessing.get_context('fork'))
+    try:
+        pool.connect()
+        assert pool.remove(1) is factory
+        assert pool.ids == [2]
+        assert pool[2].state().result(5)[u'Режим ФР'].num == 4
+
+        # эмулятор принимает следующее соединение только после закрытия предыдущего
+        dev = factory()
+        dev.connect()
+        assert dev.state()[u'Режим ФР'].num == 4
+        dev.disconnect()
+    finally:
+        pool.shutdown()
+        emu.stop()
+
+
+def test_worker_submit_unpicklable_call(pool):
+    pool.connect()
+    with pytest.raises(Exception):
+        pool[1].submit(lambda device: None)
+    assert not pool[1].worker.pending
+    assert pool[1].state().result(5)[u'Режим ФР'].num == 4
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+
+import io
+import os
+import time
+
+import pytest
+
+from pyshtrih import encoders, emulator, journal
+from pyshtrih.device import ShtrihM01F
+
+
+ITEM = (u'Хлеб', 1000, 4500)
+
+
+def make_device(emu, path):
+    return ShtrihM01F(transport=emu.loopback(timeout=0.5), journal=journal.Journal(path))
+
+
+def sale_frame(dev):
+    text, quantity, price = ITEM
+    return encoders.ENCODERS[0x80](
+        dev.password, quantity, price, 0, 0, 0, 0, 0, text, length=dev.DEFAULT_MAX_LENGTH
+    )
+
+
+def close_frame(dev, cash):
+    return encoders.ENCODERS[0x85](
+        dev.password, cash, 0, 0, 0, 0, 0, 0, 0, 0, None, length=dev.DEFAULT_MAX_LENGTH
+    )
+
+
+def lose_response(emu, dev, frame):
+    """
+    Кадр записан в журнал и выполнен ККМ, ответ не прочитан драйвером.
+    """
+
+    # эмулятор должен получить ACK на предыдущий ответ
+    deadline = time.time() + 1
+    while emu.pending is not None and time.time() < deadline:
+        time.sleep(0.001)
+
+    dev.protocol.journal.sent(frame)
+    dev.protocol.journal.acked()
+    emu.feed(bytes(frame))
+
+
+@pytest.fixture
+def emu():
+    emu = emulator.Emulator(print_line_time=0)
+    yield emu
+    emu.stop()
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('journal.bin'))
+
+
+def test_completed_check_compacts_journal(emu, path):
+    dev = make_device(emu, path)
+    dev.connect()
+    dev.state()
+    dev.open_check(0)
+    dev.sale(ITEM)
+    dev.close_check(5000)
+
+    exchanges = dev.protocol.journal.exchanges()
+    assert [exchange.cmd for exchange in exchanges] == [0x8D, 0x80, 0x85]
+    assert all(exchange.code == 0 for exchange in exchanges)
+    assert journal.recover(dev, dev.protocol.journal).state == journal.CLOSED
+    dev.disconnect()
+
+
+def test_stale_response_belongs_to_previous_frame(emu, path):
+    dev = make_device(emu, path)
+    dev.connect()
+    dev.open_check(0)
+    lose_response(emu, dev, sale_frame(dev))
+
+    # ответ на продажу получен при проверке связи перед следующей командой
+    dev.close_check(5000)
+
+    exchanges = dev.protocol.journal.exchanges()
+    check = journal.last_check(exchanges)
+    assert [exchange.cmd for exchange in check] == [0x8D, 0x80, 0x85]
+    assert [exchange.code for exchange in check] == [0, 0, 0]
+    assert all(journal.payload_cmd(exchange.response) == exchange.cmd for exchange in exchanges)
+    dev.disconnect()
+
+
+def test_recover_closed_check_after_reconnect(emu, path):
+    dev = make_device(emu, path)
+    dev.connect()
+    dev.open_check(0)
+    dev.sale(ITEM)
+    lose_response(emu, dev, close_frame(dev, 5000))
+    # сбой приложения: ответ на закрытие чека остался в ККМ
+    dev.protocol.journal.close()
+    dev.disconnect()
+
+    dev = make_device(emu, path)
+    dev.connect()
+    recovery = journal.recover(dev, dev.protocol.journal)
+
+    assert recovery.state == journal.CLOSED
+    assert len(recovery.executed) == 2
+    assert recovery.response[u'Сдача'] == 500
+    dev.disconnect()
+
+
+def test_recover_open_check(emu, path):
+    dev = make_device(emu, path)
+    dev.connect()
+    dev.open_check(0)
+    dev.sale(ITEM)
+    dev.protocol.journal.close()
+    dev.disconnect()
+
+    dev = make_device(emu, path)
+    dev.connect()
+    recovery = journal.recover(dev, dev.protocol.journal)
+
+    assert recovery.state == journal.OPEN
+    assert [journal.frame_cmd(frame) for frame in recovery.executed] == [0x8D, 0x80]
+    dev.cancel_check()
+    assert journal.recover(dev, dev.protocol.journal).state == journal.CANCELLED
+    dev.disconnect()
+
+
+def test_recover_without_check(emu, path):
+    dev = make_device(emu, path)
+    dev.connect()
+    dev.state()
+    assert journal.recover(dev, dev.protocol.journal).state == journal.NONE
+    dev.disconnect()
+
+
+def test_compaction_deferred_until_settle(path):
+    log = journal.Journal(path)
+    log.sent(bytearray(b'\x02\x05\x8d\x1e\x00\x00\x00\x00\x96'))
+    log.received(bytearray(b'\x8d\x00\x01'))
+    log.sent(bytearray(b'\x02\x05\x85\x1e\x00\x00\x00\x00\x9e'))
+    size = log.size()
+
+    log.received(bytearray(b'\x85\x00\x01'))
+    assert log.size() > size
+    assert log.compact_start == 0
+
+    log.settle()
+    assert log.compact_start is None
+    assert [exchange.cmd for exchange in log.exchanges()] == [0x8D, 0x85]
+    log.close()
+
+
+def test_compaction_keeps_journal_on_failure(path, monkeypatch):
+    log = journal.Journal(path)
+    log.sent(bytearray(b'\x02\x05\x10\x1e\x00\x00\x00\x00\x0b'))
+    log.received(bytearray(b'\x10\x00\x01'))
+    log.sync()
+    with io.open(path, 'rb') as fd:
+        data = fd.read()
+
+    def fail(src, dst):
+        raise OSError(u'сбой')
+
+    monkeypatch.setattr(os, 'rename', fail)
+    with pytest.raises(OSError):
+        log.compact(len(data))
+    monkeypatch.undo()
+
+    with io.open(path, 'rb') as fd:
+        assert fd.read() == data
+    assert os.path.exists(log.tmp)
+    # журнал остается открытым для записи
+    log.sent(bytearray(b'\x02\x05\x10\x1e\x00\x00\x00\x00\x0b'))
+    log.close()
+
+    # временный файл незавершенного сжатия удаляется при открытии журнала
+    log = journal.Journal(path)
+    assert not os.path.exists(log.tmp)
+    assert [exchange.cmd for exchange in log.exchanges()] == [0x10, 0x10]
+    log.close()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+from pyshtrih import emulator, metadata
+from pyshtrih.device import ShtrihM01F
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return metadata.MetadataCache(str(tmpdir.join('metadata.json')))
+
+
+def swap(dev, emu):
+    """
+    Замена ККМ на порту без переподключения драйвера.
+    """
+
+    dev.protocol.transport = dev.protocol.reader.transport = emu.loopback(timeout=5)
+    dev.protocol.disconnect()
+    dev.protocol.connect()
+
+
+def test_cached_connect_verifies_device(cache):
+    first = emulator.Emulator(print_line_time=0)
+    dev = ShtrihM01F(transport=first.loopback(timeout=5), metadata=cache)
+    dev.connect()
+    assert dev.metadata_entry.info[u'Заводской номер'] == 12345678
+    dev.disconnect()
+
+    # при подключении с записью кеша ККМ сверяется запросом 0x11
+    second = emulator.Emulator(print_line_time=0, model=4, serial_number=999)
+    dev.protocol.transport = dev.protocol.reader.transport = second.loopback(timeout=5)
+    dev.connect()
+
+    assert dev.metadata_entry.info[u'Заводской номер'] == 999
+    assert dev.dev_info[u'Модель устройства'] == 4
+    assert dev.protocol.context.model == 4
+    assert cache.lookup(dev.port).key == dev.metadata_entry.key
+
+    dev.disconnect()
+    first.stop()
+    second.stop()
+
+
+def test_swapped_device_refreshes_session(cache):
+    first = emulator.Emulator(print_line_time=0)
+    dev = ShtrihM01F(transport=first.loopback(timeout=5), metadata=cache)
+    dev.connect()
+    assert dev.protocol.context.model == 19
+
+    second = emulator.Emulator(print_line_time=0, model=4, serial_number=999)
+    swap(dev, second)
+    dev.full_state()
+
+    assert dev.metadata_entry.info[u'Заводской номер'] == 999
+    assert dev.dev_info[u'Модель устройства'] == 4
+    assert dev.protocol.context.model == 4
+    # флаги ФР разбираются по набору модели 4
+    assert u'Увеличенная точность количества' not in dev.state()[u'Флаги ФР']
+
+    dev.disconnect()
+    first.stop()
+    second.stop()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+
+import pytest
+
+from pyshtrih import aio, emulator, journal, metrics, protocol
+from pyshtrih.device import ShtrihM01F
+
+
+ITEM = (u'Хлеб', 1000, 4500)
+
+
+def drop_ack(emu, cmd):
+    """
+    Потеря подтверждения (ACK) приема кадра команды cmd: ККМ выполняет команду,
+    драйвер получает только кадр ответа.
+    """
+
+    feed, execute = emu.feed, emu.execute
+    executed = []
+    dropped = []
+
+    def lossy_execute(payload):
+        executed.append(protocol.payload_cmd(payload))
+        return execute(payload)
+
+    def lossy(data):
+        del executed[:]
+        reply = feed(data)
+        if not dropped and cmd in executed:
+            dropped.append(cmd)
+            return reply[1:]
+        return reply
+
+    emu.execute = lossy_execute
+    emu.feed = lossy
+    return dropped
+
+
+@pytest.fixture
+def emu():
+    emu = emulator.Emulator(print_line_time=0)
+    yield emu
+    emu.stop()
+
+
+@pytest.mark.parametrize('session', [True, False])
+def test_lost_ack_does_not_repeat_command(emu, tmpdir, session):
+    log = journal.Journal(str(tmpdir.join('journal.bin')))
+    dev = ShtrihM01F(transport=emu.loopback(timeout=0.2), session=session, journal=log,
+                     metrics=metrics.Metrics())
+    dev.connect()
+    dev.open_check(0)
+    dropped = drop_ack(emu, 0x80)
+    dev.sale(ITEM)
+
+    assert dropped == [0x80]
+    assert emu.check_ops == 1
+    assert dev.state()[u'Количество операций в чеке'] == 1
+
+    sale = [exchange for exchange in log.exchanges() if exchange.cmd == 0x80]
+    assert len(sale) == 1
+    assert sale[0].acked and sale[0].code == 0
+    assert dev.protocol.metrics.snapshot()['commands'][0x80][metrics.READ]['count'] == 1
+
+    dev.cancel_check()
+    dev.disconnect()
+    log.close()
+
+
+def test_lost_ack_does_not_repeat_command_async(emu):
+    async def run():
+        dev = aio.ShtrihM01F(u'{}:{}'.format(*emu.tcp()), timeout=0.2, session=True)
+        await dev.connect()
+        await dev.open_check(0)
+        drop_ack(emu, 0x80)
+        await dev.sale(ITEM)
+        ops = emu.check_ops
+        await dev.cancel_check()
+        await dev.disconnect()
+        return ops
+
+    assert asyncio.run(run()) == 1